@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Mine Armour - Alert Rules
+Danger thresholds shared by the dashboard alert monitor and the ingest load
+shedder, so a reading that would raise an alert is never shed.
+"""
+
+import os
+
+# Gas danger thresholds (PPM)
+GAS_DANGER_THRESHOLDS = {
+    'LPG': 1000,      # Explosive at 2-10%, dangerous at 1000+ ppm
+    'CH4': 5000,      # Explosive at 5-15%, dangerous at 5000+ ppm
+    'Propane': 1000,  # Explosive at 2-10%, dangerous at 1000+ ppm
+    'Butane': 1000,   # Explosive at 1.5-9%, dangerous at 1000+ ppm
+    'H2': 4000        # Explosive at 4-75%, dangerous at 4000+ ppm
+}
+
+# Heart rate (BPM): danger zone and upper limit
+HEART_RATE_DANGER_RANGE = (10, 70)
+HEART_RATE_HIGH = 100
+
+# Temperature (°C) outside this range raises an alert
+TEMPERATURE_RANGE = (22, 28)
+
+# A channel whose last sample is older than this (seconds) no longer raises alerts: with
+# sparse payloads its value is carried forward after the helmet stops sending it
+STALE_AFTER_S = float(os.getenv("ALERT_STALE_AFTER", "15"))
+
+# SensorReading slot of each gas in GAS_DANGER_THRESHOLDS
+_GAS_SLOTS = (('LPG', 1), ('CH4', 2), ('Propane', 3), ('Butane', 4), ('H2', 5))
+
+
+def heart_rate_alarm(hr):
+    low, high = HEART_RATE_DANGER_RANGE
+    return isinstance(hr, (int, float)) and hr > 0 and ((low <= hr <= high) or hr > HEART_RATE_HIGH)
+
+
+def temperature_alarm(temperature):
+    low, high = TEMPERATURE_RANGE
+    return isinstance(temperature, (int, float)) and (temperature < low or temperature > high)
+
+
+def gas_alarm(gas_type, value):
+    return isinstance(value, (int, float)) and value > GAS_DANGER_THRESHOLDS[gas_type]
+
+
+def reading_in_alarm(reading):
+    """True if a SensorReading would raise any dashboard alert (-1 'no reading' values are ignored)"""
+    for gas_type, slot in _GAS_SLOTS:
+        if reading[slot] > GAS_DANGER_THRESHOLDS[gas_type]:
+            return True
+    hr = reading[6]
+    if hr != -1 and heart_rate_alarm(hr):
+        return True
+    temperature = reading[10]
+    return temperature != -1.0 and temperature_alarm(temperature)
+
+
+def fresh_value(latest, channel, now, max_age=STALE_AFTER_S):
+    """A channel's value from a series' latest dict, or None once its own last sample is
+    older than max_age (or it never had one)"""
+    received = latest.get('channel_ts', {}).get(channel)
+    if received is None or now - received > max_age:
+        return None
+    return latest.get(channel)
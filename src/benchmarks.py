@@ -0,0 +1,954 @@
+#!/usr/bin/env python3
+"""
+Mine Armour - Ingest Micro-benchmarks
+Usage: python benchmarks.py [name ...]   (runs every benchmark when no name is given)
+"""
+
+import sys
+import json
+import time
+from datetime import datetime
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Register a benchmark function under a short name"""
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def _timeit(func, iterations):
+    """Return seconds per call of func() averaged over iterations"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations
+
+
+SAMPLE_PAYLOAD = json.dumps({
+    "LPG": 125.14, "CH4": 67.47, "Propane": 94.18, "Butane": 109.31, "H2": 68.45,
+    "heartRate": 72, "spo2": 98.2, "GSR": 512, "stress": 0,
+    "temperature": 26.4, "humidity": 61.2,
+    "lat": 12.971599, "lon": 77.594566, "alt": 920.5, "sat": 7,
+    "name": "TRISHALA", "station_id": "A1",
+}).encode()
+
+
+# --------------------------------------------------
+# DECODER
+# --------------------------------------------------
+
+def _legacy_decode(payload, timestamp):
+    """The decode path used before sensor_codec (json.loads + per-message closures)"""
+    data = json.loads(payload.decode())
+
+    def _to_float(v, default=0.0):
+        try:
+            if v is None or (isinstance(v, str) and not v.strip()):
+                return default
+            return float(v)
+        except Exception:
+            return default
+
+    def _to_int(v, default=0):
+        try:
+            if v is None or (isinstance(v, str) and not v.strip()):
+                return default
+            return int(float(v))
+        except Exception:
+            return default
+
+    lpg = _to_float(data.get('LPG', 0.0), 0.0)
+    ch4 = _to_float(data.get('CH4', 0.0), 0.0)
+    propane = _to_float(data.get('Propane', 0.0), 0.0)
+    butane = _to_float(data.get('Butane', 0.0), 0.0)
+    h2 = _to_float(data.get('H2', 0.0), 0.0)
+    heartRate = _to_int(data.get('heartRate', -1), -1)
+    spo2 = _to_float(data.get('spo2', -1), -1)
+    gsr = _to_float(data.get('GSR', 0.0), 0.0)
+    stress = _to_int(data.get('stress', 0), 0)
+    temperature = _to_float(data.get('temperature', -1.0), -1.0)
+    humidity = _to_float(data.get('humidity', -1.0), -1.0)
+    lat = _to_float(data.get('lat', 0.0), 0.0)
+    lon = _to_float(data.get('lon', 0.0), 0.0)
+    alt = _to_float(data.get('alt', 0.0), 0.0)
+    sat = _to_int(data.get('sat', 0), 0)
+    person_name = data.get('name') or data.get('person') or data.get('user')
+    station_id_msg = data.get('station_id')
+    zone_label = data.get('zone') or (f"Zone {station_id_msg[0].upper()}" if isinstance(station_id_msg, str) and station_id_msg else None)
+    return {
+        'LPG': lpg, 'CH4': ch4, 'Propane': propane, 'Butane': butane, 'H2': h2,
+        'heartRate': heartRate, 'spo2': spo2, 'temperature': temperature, 'humidity': humidity,
+        'GSR': gsr, 'stress': stress, 'lat': lat, 'lon': lon, 'alt': alt, 'sat': sat,
+        'name': person_name, 'zone': zone_label, 'timestamp': timestamp
+    }
+
+
+@benchmark('decoder')
+def bench_decoder(iterations=50000):
+    """Legacy json.loads + closure casts vs. the schema-specialised sensor_codec decoder"""
+    from sensor_codec import decode_payload, JSON_BACKEND
+
+    ts = time.time()
+    legacy = _timeit(lambda: _legacy_decode(SAMPLE_PAYLOAD, ts), iterations)
+    fast = _timeit(lambda: decode_payload(SAMPLE_PAYLOAD, ts), iterations)
+
+    # Both paths must agree on every field
+    expected = _legacy_decode(SAMPLE_PAYLOAD, ts)
+    _, reading = decode_payload(SAMPLE_PAYLOAD, ts)
+    assert all(expected.get(k) == v for k, v in reading._asdict().items() if k != 'present'), "decoder mismatch"
+
+    print(f"  legacy decode : {legacy * 1e6:8.2f} us/msg")
+    print(f"  sensor_codec  : {fast * 1e6:8.2f} us/msg  (json backend: {JSON_BACKEND})")
+    print(f"  speed-up      : {legacy / fast:8.2f}x")
+
+
+# --------------------------------------------------
+# BINARY FORMAT
+# --------------------------------------------------
+
+@benchmark('binary')
+def bench_binary(iterations=50000):
+    """Payload size and decode cost: JSON vs. the compact binary encoding"""
+    from sensor_codec import decode_payload, encode_binary
+
+    ts = time.time()
+    binary_payload = encode_binary(json.loads(SAMPLE_PAYLOAD))
+    json_cost = _timeit(lambda: decode_payload(SAMPLE_PAYLOAD, ts), iterations)
+    binary_cost = _timeit(lambda: decode_payload(binary_payload, ts), iterations)
+
+    print(f"  JSON   : {len(SAMPLE_PAYLOAD):4d} bytes, {json_cost * 1e6:6.2f} us/msg")
+    print(f"  binary : {len(binary_payload):4d} bytes, {binary_cost * 1e6:6.2f} us/msg")
+    print(f"  size   : {len(SAMPLE_PAYLOAD) / len(binary_payload):.1f}x smaller, decode {json_cost / binary_cost:.2f}x faster")
+
+
+# --------------------------------------------------
+# TOPIC ROUTING
+# --------------------------------------------------
+
+@benchmark('router')
+def bench_router(iterations=20000, topic_count=500):
+    """Linear any(startswith) topic matching vs. the compiled TopicRouter"""
+    from topic_router import TopicRouter
+
+    topics = [f"HELMET_{i:04d}" for i in range(topic_count)] + [f"SITE_{i:03d}/#" for i in range(topic_count // 10)]
+    router = TopicRouter()
+    for t in topics:
+        router.add(t, 'sensor', [t])
+
+    def linear(topic):
+        # The matching server.py used before the router
+        return topic in topics or any(topic.startswith(t.rstrip('/#')) for t in topics if '/#' in t)
+
+    probes = ['HELMET_0499', f"SITE_{topic_count // 10 - 1:03d}/zone/gas", 'UNKNOWN_TOPIC']
+    for probe in probes:
+        assert bool(linear(probe)) == (router.route(probe) is not None), probe
+        before = _timeit(lambda: linear(probe), iterations // 10)
+        after = _timeit(lambda: router.route(probe), iterations)
+        print(f"  {probe:<24} linear {before * 1e6:8.2f} us   router {after * 1e6:6.3f} us   ({before / after:,.0f}x)")
+
+
+# --------------------------------------------------
+# HOT-PATH LOGGING
+# --------------------------------------------------
+
+@benchmark('logging')
+def bench_logging(iterations=50000):
+    """Per-message f-string logging vs. rate-limited lazy hot_log records"""
+    import os
+    import logging
+    from hot_log import HotPathLog, LazyText
+
+    logger = logging.getLogger('benchmarks.logging')
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    with open(os.devnull, 'w') as sink:
+        handler = logging.StreamHandler(sink)
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+        logger.addHandler(handler)
+        hot = HotPathLog(logger, rate=5, interval=10.0)
+        try:
+            eager = _timeit(lambda: logger.info(f"📩 MQTT [LOKI_2004] {SAMPLE_PAYLOAD.decode('utf-8', 'replace')}"),
+                            iterations)
+            lazy = _timeit(lambda: hot.info('bench', "📩 MQTT [%s] %s", 'LOKI_2004', LazyText(SAMPLE_PAYLOAD)),
+                           iterations)
+        finally:
+            logger.removeHandler(handler)
+
+    print(f"  f-string logging.info : {eager * 1e6:6.2f} us/msg")
+    print(f"  hot_log (rate-limited): {lazy * 1e6:6.2f} us/msg")
+    print(f"  speed-up              : {eager / lazy:6.1f}x")
+
+
+# --------------------------------------------------
+# PER-NODE SERIES STORAGE
+# --------------------------------------------------
+
+_SERIES_SECTIONS = {
+    'gas_sensors': (('LPG', 1), ('CH4', 2), ('Propane', 3), ('Butane', 4), ('H2', 5)),
+    'health_sensors': (('heartRate', 6), ('spo2', 7), ('GSR', 8), ('stress', 9)),
+    'environmental_sensors': (('temperature', 10), ('humidity', 11)),
+    'gps_data': (('lat', 12), ('lon', 13), ('alt', 14), ('sat', 15)),
+}
+
+
+def _legacy_node_store(capacity, rows):
+    """Per-node dict of deques as SensorDataManager stored it before node_series"""
+    from collections import deque
+    store = {}
+    for section, channels in _SERIES_SECTIONS.items():
+        store[section] = {'timestamps': deque((datetime.fromtimestamp(r[0]) for r in rows), maxlen=capacity)}
+        for name, slot in channels:
+            store[section][name] = deque((r[slot] for r in rows), maxlen=capacity)
+    return store
+
+
+@benchmark('series')
+def bench_series(iterations=2000, capacity=1000):
+    """Per-node deque-of-objects storage vs. columnar NodeSeries (memory and chart read cost)"""
+    import gc
+    import random
+    import tracemalloc
+    from node_series import NodeSeries
+    from sensor_codec import reading_from_dict
+
+    start = time.time()
+    payload = json.loads(SAMPLE_PAYLOAD)
+
+    def make_rows():
+        return [reading_from_dict({k: v + random.random() if isinstance(v, float) else v
+                                   for k, v in payload.items()}, start + i)
+                for i in range(capacity)]
+
+    # Only what the store keeps alive once the decoded rows are gone; gc.collect() also
+    # empties CPython's tuple free lists, which would otherwise still hold the dead rows
+    tracemalloc.start()
+    legacy = _legacy_node_store(capacity, make_rows())
+    gc.collect()
+    legacy_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    series = NodeSeries(capacity)
+    series.append_rows(make_rows())
+    gc.collect()
+    series_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    # Chart refresh: copy a node's gas section out of the store and hand one channel to plotly
+    def legacy_read():
+        gas = legacy['gas_sensors'].copy()
+        return list(gas['timestamps']), list(gas['LPG'])
+
+    def series_read():
+        snapshot = series.snapshot(('ts', 'LPG'))
+        return snapshot.column('ts'), snapshot.column('LPG')
+
+    before = _timeit(legacy_read, iterations)
+    after = _timeit(series_read, iterations)
+    print(f"  memory per node ({capacity} readings): deques {legacy_bytes / 1024:7.1f} KiB   "
+          f"NodeSeries {series_bytes / 1024:6.1f} KiB   ({legacy_bytes / series_bytes:.1f}x)")
+    print(f"  chart read: deques {before * 1e6:7.2f} us   NodeSeries {after * 1e6:6.2f} us   ({before / after:.1f}x)")
+
+
+@benchmark('sparse')
+def bench_sparse(capacity=100, minutes=10):
+    """Mixed gas / vitals / GPS payloads: padded rows vs. per-channel sparse NodeSeries"""
+    import tracemalloc
+    from node_series import NodeSeries
+    from sensor_codec import reading_from_dict
+
+    # Gas at 2 Hz, vitals at 1 Hz, GPS fixes every 5 s, each in its own message
+    start = time.time()
+    rows = []
+    for i in range(minutes * 60 * 2):
+        ts = start + i / 2
+        rows.append(reading_from_dict({'LPG': 120.0 + i % 7, 'CH4': 60.0, 'Propane': 90.0,
+                                       'Butane': 100.0, 'H2': 70.0}, ts))
+        if i % 2 == 0:
+            rows.append(reading_from_dict({'heartRate': 70 + i % 9, 'spo2': 97.0, 'GSR': 400.0, 'stress': 0}, ts))
+        if i % 10 == 0:
+            rows.append(reading_from_dict({'lat': 12.9 + i * 1e-5, 'lon': 77.5, 'alt': 900.0, 'sat': 7}, ts))
+    padded_rows = [row._replace(present=None) for row in rows]   # every field counted as a sample
+
+    def run(batch):
+        tracemalloc.start()
+        series = NodeSeries(capacity)
+        for offset in range(0, len(batch), 16):
+            series.append_rows(batch[offset:offset + 16])
+        nbytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        snapshot = series.snapshot(('ts', 'heartRate'))
+        hr = [v for v in snapshot.column('heartRate').tolist() if v == v and v > 0]
+        ts = snapshot.times('heartRate').tolist()
+        lat = [v for v in series.snapshot(('ts', 'lat')).column('lat').tolist() if v]
+        return nbytes, len(hr), ts[-1] - ts[0] if ts else 0.0, len(lat)
+
+    print(f"  {len(rows):,} messages over {minutes} min, {capacity} samples kept per channel")
+    for label, batch in (('padded', padded_rows), ('sparse', rows)):
+        nbytes, hr, hr_span, fixes = run(batch)
+        print(f"  {label}: {nbytes / 1024:6.1f} KiB   heart-rate samples {hr:4d} covering {hr_span:6.1f}s   "
+              f"GPS fixes {fixes:4d}")
+
+
+@benchmark('fleet')
+def bench_fleet(nodes=16, batches=500, batch=16, capacity=100):
+    """Legacy double write into a global series vs. a fleet view merged from the node series"""
+    import random
+    import tracemalloc
+    from fleet_view import FleetView
+    from node_registry import NodeRegistry
+    from node_series import NodeSeries
+    from sensor_codec import reading_from_dict
+
+    start = time.time()
+    payload = json.loads(SAMPLE_PAYLOAD)
+    node_ids = [f"NODE{i:04d}" for i in range(nodes)]
+    work = []
+    for i in range(batches):
+        nid = random.choice(node_ids)
+        epochs = [start + i * batch + k for k in range(batch)]
+        work.append((nid, [reading_from_dict(payload, ts) for ts in epochs], epochs))
+
+    def ingest(double_write):
+        registry = NodeRegistry(lambda: NodeSeries(capacity))
+        fleet = NodeSeries(capacity)
+        t0 = time.perf_counter()
+        for nid, rows, epochs in work:
+            if double_write:
+                fleet.append_rows(rows, epochs)
+            registry.series_for(nid)['series'].append_rows(rows, epochs)
+        return (time.perf_counter() - t0) / (batches * batch), registry, fleet
+
+    legacy_row, _, fleet = ingest(True)
+    lazy_row, registry, _ = ingest(False)
+    tracemalloc.start()
+    legacy_fleet = NodeSeries(capacity)
+    legacy_fleet.append_rows(work[-1][1], work[-1][2])
+    fleet_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    view = FleetView(registry, capacity)
+    channels = ('ts', 'LPG', 'CH4', 'Propane', 'Butane', 'H2')
+    merge = _timeit(lambda: (view._cache.clear(), view.snapshot(channels)), 200)
+    cached = _timeit(lambda: view.snapshot(channels), 2000)
+    merged = view.snapshot(channels).times('LPG').tolist()
+    assert merged == fleet.snapshot(channels).times('LPG').tolist(), "fleet view mismatch"
+
+    print(f"  {nodes} nodes, {batches * batch:,} readings in batches of {batch}, {capacity} points in the fleet view")
+    print(f"  ingest: double write {legacy_row * 1e6:6.2f} us/row   node series only {lazy_row * 1e6:6.2f} us/row   "
+          f"({legacy_row / lazy_row:.2f}x), global series {fleet_bytes / 1024:.1f} KiB no longer kept")
+    print(f"  fleet gas read: merge {merge * 1e6:8.1f} us   cached {cached * 1e6:6.2f} us")
+
+
+# --------------------------------------------------
+# STORE LOCK CONTENTION
+# --------------------------------------------------
+
+@benchmark('contention')
+def bench_contention(duration=2.0, nodes=16, writers=2, readers=6, batch=32):
+    """Reader/writer throughput with one store-wide lock vs. per-node striped locks, and with
+    readers sharing current snapshots without the lock as get_series_snapshot does"""
+    import random
+    import threading
+    from node_registry import NodeRegistry
+    from node_series import NodeSeries
+    from sensor_codec import reading_from_dict
+
+    rows = [reading_from_dict(json.loads(SAMPLE_PAYLOAD), time.time()) for _ in range(batch)]
+    node_ids = [f"NODE{i:04d}" for i in range(nodes)]
+
+    def run(lock_for, shared=False):
+        registry = NodeRegistry(lambda: NodeSeries(1000))
+        for nid in node_ids:
+            registry.series_for(nid)['series'].append_rows(rows)
+        counts = {'write': 0, 'read': 0}
+        read_waits = []
+        stop = threading.Event()
+
+        def writer():
+            done = 0
+            while not stop.is_set():
+                nid = random.choice(node_ids)
+                with lock_for(registry, nid):
+                    registry[nid]['series'].append_rows(rows)
+                done += 1
+            counts['write'] += done
+
+        def reader():
+            done = 0
+            waits = []
+            while not stop.is_set():
+                nid = random.choice(node_ids)
+                series = registry[nid]['series']
+                done += 1
+                # get_series_snapshot: a current snapshot is shared without taking the lock
+                if shared and series.cached_snapshot(('ts', 'LPG')) is not None:
+                    waits.append(0.0)
+                    continue
+                lock = lock_for(registry, nid)
+                start = time.perf_counter()
+                with lock:
+                    waits.append(time.perf_counter() - start)
+                    series.snapshot(('ts', 'LPG'))
+            counts['read'] += done
+            read_waits.extend(waits)
+
+        threads = [threading.Thread(target=writer) for _ in range(writers)]
+        threads += [threading.Thread(target=reader) for _ in range(readers)]
+        for t in threads:
+            t.start()
+        time.sleep(duration)
+        stop.set()
+        for t in threads:
+            t.join()
+        read_waits.sort()
+        p99 = read_waits[int(len(read_waits) * 0.99)] if read_waits else 0.0
+        return counts['write'] / duration, counts['read'] / duration, p99
+
+    global_lock = threading.Lock()
+    before = run(lambda registry, nid: global_lock)
+    after = run(lambda registry, nid: registry.lock_for(nid))
+    shared = run(lambda registry, nid: registry.lock_for(nid), shared=True)
+    print(f"  {writers} writers / {readers} readers over {nodes} nodes, {duration:.0f}s each")
+    print(f"  single lock : {before[0]:9,.0f} writes/s  {before[1]:9,.0f} reads/s  p99 reader lock wait {before[2] * 1e6:7.1f} us")
+    print(f"  striped     : {after[0]:9,.0f} writes/s  {after[1]:9,.0f} reads/s  p99 reader lock wait {after[2] * 1e6:7.1f} us")
+    print(f"  + lock-free : {shared[0]:9,.0f} writes/s  {shared[1]:9,.0f} reads/s  p99 reader lock wait {shared[2] * 1e6:7.1f} us")
+
+
+
+# --------------------------------------------------
+# HISTORY ROLLUPS
+# --------------------------------------------------
+
+@benchmark('rollups')
+def bench_rollups(hours=24, rate_hz=1.0, width_px=600, iterations=200):
+    """Shift-long chart query: downsampling raw readings vs. reading a rollup tier"""
+    from node_series import NodeSeries
+    from rollups import NodeRollups
+    from sensor_codec import reading_from_dict
+
+    count = int(hours * 3600 * rate_hz)
+    start = time.time() - hours * 3600
+    epochs = [start + i / rate_hz for i in range(count)]
+    row = reading_from_dict(json.loads(SAMPLE_PAYLOAD), start)
+    rows = [row._replace(LPG=float(i % 97)) for i in range(count)]
+
+    # Ingest cost: raw buffer alone vs. raw buffer plus rollup tiers, in 32-row batches
+    def ingest(with_rollups):
+        series = NodeSeries(count)
+        rollups = NodeRollups() if with_rollups else None
+        for i in range(0, count, 32):
+            series.append_rows(rows[i:i + 32], epochs[i:i + 32])
+            if rollups is not None:
+                rollups.add_rows(rows[i:i + 32], epochs[i:i + 32])
+        return series, rollups
+
+    t0 = time.perf_counter()
+    series, _ = ingest(False)
+    raw_ingest = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    _, rollups = ingest(True)
+    rollup_ingest = time.perf_counter() - t0
+
+    span = hours * 3600
+    bucket = span / width_px
+
+    def raw_query():
+        snapshot = series.snapshot(('ts', 'LPG'))
+        ts, values = snapshot.column('ts').tolist(), snapshot.column('LPG').tolist()
+        buckets = {}
+        for t, v in zip(ts, values):
+            acc = buckets.setdefault(int((t - start) // bucket), [0, 0.0, v, v])
+            acc[0] += 1
+            acc[1] += v
+            acc[2] = min(acc[2], v)
+            acc[3] = max(acc[3], v)
+        return buckets
+
+    def tier_query():
+        tier = rollups.pick_tier(span, width_px)
+        return tier.query('LPG', start)
+
+    before = _timeit(raw_query, max(1, iterations // 20))
+    after = _timeit(tier_query, iterations)
+    tier = rollups.pick_tier(span, width_px)
+    print(f"  {count:,} readings over {hours}h, {width_px}px chart -> tier {tier.label} "
+          f"({len(tier_query()['timestamps'])} buckets, {rollups.nbytes / 1024:.0f} KiB per node)")
+    print(f"  ingest: raw only {raw_ingest / count * 1e6:5.2f} us/row   with rollups {rollup_ingest / count * 1e6:5.2f} us/row")
+    print(f"  query : downsample raw {before * 1e3:8.2f} ms   rollup tier {after * 1e3:6.3f} ms   ({before / after:.0f}x)")
+
+
+
+# --------------------------------------------------
+# COMPRESSED HISTORY BLOCKS
+# --------------------------------------------------
+
+@benchmark('compression')
+def bench_compression(readings=20000, block_size=256, iterations=5):
+    """Gorilla history blocks: compression ratio vs. deques / slab, and range-read decode throughput"""
+    import random
+    import tracemalloc
+    from history_blocks import CompressedHistory
+    from sensor_codec import reading_from_dict
+
+    # 1 Hz readings with a few ms of jitter; gases drift slowly at 0.01 ppm resolution
+    random.seed(7)
+    payload = json.loads(SAMPLE_PAYLOAD)
+    start = time.time() - readings
+    rows, epochs = [], []
+    lpg, ch4 = 2.0, 5.0
+    for i in range(readings):
+        lpg = round(max(0.0, lpg + random.choice((-0.01, 0.0, 0.0, 0.0, 0.01))), 2)
+        ch4 = round(max(0.0, ch4 + random.choice((-0.01, 0.0, 0.0, 0.01))), 2)
+        payload.update(LPG=lpg, CH4=ch4, heartRate=random.choice((72, 72, 73, 74)))
+        ts = start + i + random.randint(-3, 3) / 1000.0
+        epochs.append(ts)
+        rows.append(reading_from_dict(payload, ts))
+
+    tracemalloc.start()
+    legacy = _legacy_node_store(readings, rows)
+    legacy_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del legacy
+    slab_bytes = readings * 8 * 16
+
+    history = CompressedHistory(block_size=block_size, max_bytes=1 << 40)
+    t0 = time.perf_counter()
+    for i in range(0, readings, 32):
+        history.append_rows(rows[i:i + 32], epochs[i:i + 32])
+    history.seal()
+    encode_s = time.perf_counter() - t0
+    stats = history.stats()
+
+    since, until = start + readings * 0.25, start + readings * 0.75
+    found = history.read(('LPG',), since, until)
+    one_channel = _timeit(lambda: history.read(('LPG',), since, until), iterations)
+    channels = ('LPG', 'CH4', 'Propane', 'Butane', 'H2', 'heartRate')
+    six_channels = _timeit(lambda: history.read(channels, since, until), iterations)
+    n = len(found['ts'])
+    print(f"  {readings:,} readings: deques {legacy_bytes / readings:6.1f} B/reading   slab {slab_bytes / readings:5.1f}   "
+          f"compressed {stats['bytes_per_reading']:5.1f} ({legacy_bytes / stats['bytes']:.0f}x vs deques, "
+          f"{stats['compression_ratio']:.1f}x vs float64)")
+    print(f"  encode {readings / encode_s:,.0f} readings/s")
+    print(f"  range read of {n:,} readings: LPG only {one_channel * 1e3:6.1f} ms ({n / one_channel:,.0f} readings/s)   "
+          f"6 channels {six_channels * 1e3:6.1f} ms ({n * 6 / six_channels:,.0f} values/s)")
+
+# --------------------------------------------------
+# SQLITE SERIES STORE
+# --------------------------------------------------
+
+@benchmark('store')
+def bench_store(nodes=20, rows_per_node=5000, batch=32, tail=100):
+    """SQLite persistence: sustained write throughput and startup replay time"""
+    import sqlite3
+    import tempfile
+    from series_store import SeriesStore
+    from sensor_codec import reading_from_dict
+
+    start = time.time() - rows_per_node
+    row = reading_from_dict(json.loads(SAMPLE_PAYLOAD), start)
+    node_ids = [f"NODE{i:04d}" for i in range(nodes)]
+    total = nodes * rows_per_node
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Naive baseline: one autocommitted INSERT per reading, default rollback journal
+        naive_rows = min(total, 2000)
+        conn = sqlite3.connect(f"{tmp}/naive.db")
+        conn.execute("CREATE TABLE readings (node TEXT, ts REAL, LPG REAL, CH4 REAL, heartRate INTEGER)")
+        t0 = time.perf_counter()
+        for i in range(naive_rows):
+            conn.execute("INSERT INTO readings VALUES (?, ?, ?, ?, ?)", (node_ids[i % nodes], start + i, 1.0, 2.0, 80))
+            conn.commit()
+        naive_rate = naive_rows / (time.perf_counter() - t0)
+        conn.close()
+
+        store = SeriesStore(f"{tmp}/series.db", queue_size=total)
+        store.start()
+        t0 = time.perf_counter()
+        for offset in range(0, rows_per_node, batch):
+            epochs = [start + offset + i for i in range(min(batch, rows_per_node - offset))]
+            rows = [row._replace(timestamp=ts) for ts in epochs]
+            for nid in node_ids:
+                store.write_readings(nid, rows, epochs)
+        store.stop(timeout=600)
+        write_rate = total / (time.perf_counter() - t0)
+        stats = store.stats()
+
+        t0 = time.perf_counter()
+        replayed = sum(len(store.load_tail(nid, tail)[0]) for nid, _, _, _ in store.nodes())
+        replay_s = time.perf_counter() - t0
+
+    print(f"  write: naive row-per-commit {naive_rate:9,.0f} rows/s   batched WAL writer {write_rate:9,.0f} rows/s "
+          f"({write_rate / naive_rate:.0f}x, {stats['avg_rows_per_transaction']:.0f} rows/transaction)")
+    print(f"  replay: {replayed:,} readings ({nodes} nodes x {tail}) from {total:,} stored in {replay_s * 1e3:.1f} ms")
+
+
+
+# --------------------------------------------------
+# MEMORY-MAPPED SEGMENT FILES
+# --------------------------------------------------
+
+@benchmark('segments')
+def bench_segments(days=7, rate_hz=0.2, batch=32, iterations=20):
+    """Week-long node history: slicing mmap'd segment files vs. reading the SQLite store"""
+    import tempfile
+    from segment_store import SegmentStore
+    from series_store import SeriesStore
+    from sensor_codec import reading_from_dict
+
+    count = int(days * 86400 * rate_hz)
+    start = time.time() - days * 86400
+    epochs = [start + i / rate_hz for i in range(count)]
+    row = reading_from_dict(json.loads(SAMPLE_PAYLOAD), start)
+    rows = [row] * count
+
+    with tempfile.TemporaryDirectory() as tmp:
+        segments = SegmentStore(f"{tmp}/segments", retention_s=0)
+        t0 = time.perf_counter()
+        for i in range(0, count, batch):
+            segments.append('NODE', rows[i:i + batch], epochs[i:i + batch])
+        append_s = time.perf_counter() - t0
+        size = segments.stats()['bytes']
+        segments.close()
+
+        store = SeriesStore(f"{tmp}/series.db", queue_size=count)
+        store.start()
+        for i in range(0, count, batch):
+            store.write_readings('NODE', rows[i:i + batch], epochs[i:i + batch])
+        store.stop(timeout=600)
+
+        since, until = start + 86400, start + (days - 1) * 86400
+
+        def segment_read():
+            # Fresh store each time: includes opening and mapping the files
+            return SegmentStore(f"{tmp}/segments", retention_s=0).channel('NODE', 'CH4', since, until)
+
+        def sqlite_read():
+            values = []
+            for chunk, chunk_epochs in store.iter_range('NODE', since):
+                values.extend(r[2] for r, ts in zip(chunk, chunk_epochs) if ts <= until)
+                if chunk_epochs[-1] > until:
+                    break
+            return values
+
+        n = len(segment_read()[1])
+        before = _timeit(sqlite_read, max(1, iterations // 10))
+        after = _timeit(segment_read, iterations)
+    print(f"  {count:,} readings over {days} days ({size / 1e6:.1f} MB of segments), append {count / append_s:,.0f} readings/s")
+    print(f"  read one channel over {days - 2} days ({n:,} values): SQLite {before * 1e3:8.2f} ms   "
+          f"mmap segments {after * 1e3:7.2f} ms   ({before / after:.0f}x)")
+
+# --------------------------------------------------
+# POSTGRESQL COPY SINK
+# --------------------------------------------------
+
+@benchmark('postgres')
+def bench_postgres(nodes=50, rows_per_node=4000, batch=32):
+    """PostgreSQL load: ingest-side cost and COPY throughput vs. row INSERTs (needs PG_DSN)"""
+    import os
+    import postgres_sink
+    from postgres_sink import PostgresSink
+    from sensor_codec import reading_from_dict
+
+    dsn = os.getenv("PG_DSN")
+    if not dsn or postgres_sink.psycopg2 is None:
+        print("  skipped: set PG_DSN to a local PostgreSQL database and install psycopg2-binary")
+        return
+    import psycopg2
+
+    run = f"BENCH{int(time.time())}_"
+    node_ids = [f"{run}{i:03d}" for i in range(nodes)]
+    start = time.time() - rows_per_node
+    row = reading_from_dict(json.loads(SAMPLE_PAYLOAD), start)
+    total = nodes * rows_per_node
+
+    sink = PostgresSink(dsn, max_pending=total)
+    sink.start()
+    offer_time = 0.0
+    t0 = time.perf_counter()
+    for offset in range(0, rows_per_node, batch):
+        epochs = [start + offset + i for i in range(min(batch, rows_per_node - offset))]
+        rows = [row] * len(epochs)
+        for nid in node_ids:
+            t1 = time.perf_counter()
+            sink.write_readings(nid, rows, epochs)
+            offer_time += time.perf_counter() - t1
+    sink.stop(timeout=600)
+    copy_rate = total / (time.perf_counter() - t0)
+    stats = sink.stats()
+
+    # Baseline: executemany INSERT in ingest-sized batches on one connection
+    conn = psycopg2.connect(dsn)
+    insert_rows = min(total, 20000)
+    values = [(f"{run}INSERT", datetime.fromtimestamp(start + i)) + tuple(row[1:19]) for i in range(insert_rows)]
+    columns = ', '.join(f'"{c}"' for c in postgres_sink.TABLES['sensor_readings'][0])
+    placeholders = ', '.join(['%s'] * len(values[0]))
+    t0 = time.perf_counter()
+    with conn.cursor() as cur:
+        for offset in range(0, insert_rows, batch):
+            cur.executemany(f"INSERT INTO sensor_readings ({columns}) VALUES ({placeholders})", values[offset:offset + batch])
+            conn.commit()
+    insert_rate = insert_rows / (time.perf_counter() - t0)
+    with conn.cursor() as cur:
+        cur.execute("SELECT count(*) FROM sensor_readings WHERE node_id LIKE %s", (run + '%',))
+        stored = cur.fetchone()[0] - insert_rows
+        cur.execute("DELETE FROM sensor_readings WHERE node_id LIKE %s", (run + '%',))
+    conn.commit()
+    conn.close()
+
+    print(f"  {total:,} readings from {nodes} nodes, {stats['copies']} COPY(s) of ~{stats['avg_rows_per_copy']:.0f} rows, "
+          f"{stored:,} stored, {stats['shed']} shed")
+    print(f"  ingest-side cost: {offer_time / total * 1e6:.2f} us/reading (never waits on the database)")
+    print(f"  throughput: executemany INSERT {insert_rate:9,.0f} rows/s   COPY sink {copy_rate:9,.0f} rows/s "
+          f"({copy_rate / insert_rate:.1f}x)")
+
+
+# --------------------------------------------------
+# WARM-RESTART SNAPSHOTS
+# --------------------------------------------------
+
+@benchmark('snapshot')
+def bench_snapshot(nodes=300, rows_per_node=600, batch=32):
+    """Warm restart: snapshot capture/write cost, file size and load time vs. rebuilding from SQLite"""
+    import tempfile
+    from history_blocks import CompressedHistory
+    from node_series import NodeSeries, Retention
+    from rollups import DEFAULT_TIERS, NodeRollups
+    from sensor_codec import reading_from_dict
+    from series_store import SeriesStore
+    from state_snapshot import StateSnapshotter
+
+    retention = Retention()
+    start = time.time() - rows_per_node
+    base = reading_from_dict(json.loads(SAMPLE_PAYLOAD), start)
+    node_ids = [f"NODE{i:04d}" for i in range(nodes)]
+    readings = {}
+    for n, nid in enumerate(node_ids):
+        # Every node on its own clock phase with its own values, so nothing deduplicates across nodes
+        epochs = [start + i + n / nodes for i in range(rows_per_node)]
+        readings[nid] = ([base._replace(timestamp=ts, LPG=(i * 7 + n) % 97 + n / 10,
+                                        CH4=base.CH4 + (i % 13) / 4, heartRate=60 + (i + n) % 40)
+                          for i, ts in enumerate(epochs)], epochs)
+
+    def new_node():
+        return NodeSeries(retention=retention), NodeRollups(DEFAULT_TIERS), CompressedHistory()
+
+    state = {}
+    for nid in node_ids:
+        series, rollups, history = state[nid] = new_node()
+        rows, epochs = readings[nid]
+        for i in range(0, rows_per_node, batch):
+            series.append_rows(rows[i:i + batch], epochs[i:i + batch])
+            rollups.add_rows(rows[i:i + batch], epochs[i:i + batch])
+            history.append_rows(rows[i:i + batch], epochs[i:i + batch])
+
+    def capture():
+        return {'nodes': [{'id': nid, 'series': s.state(), 'rollups': r.state(), 'history': h.state()}
+                          for nid, (s, r, h) in state.items()]}
+
+    def restore(captured):
+        out = {}
+        for entry in captured['nodes']:
+            series, rollups, history = out[entry['id']] = new_node()
+            series.restore(entry['series'])
+            rollups.restore(entry['rollups'])
+            history.restore(entry['history'])
+        return out
+
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshots = StateSnapshotter(f"{tmp}/state.snap")
+        capture_s = _timeit(capture, 3)
+        captured = capture()
+        size = snapshots.write(captured)
+        write_s = _timeit(lambda: snapshots.write(captured), 3)
+        load_s = _timeit(lambda: restore(snapshots.load()[1]), 5)
+        restored = restore(snapshots.load()[1])
+        assert restored['NODE0000'][0].view('LPG').tolist() == state['NODE0000'][0].view('LPG').tolist()
+
+        # Cold start without a snapshot: replay the same readings from the SQLite store
+        store = SeriesStore(f"{tmp}/series.db", queue_size=nodes * rows_per_node)
+        store.start()
+        for nid in node_ids:
+            rows, epochs = readings[nid]
+            for i in range(0, rows_per_node, batch):
+                store.write_readings(nid, rows[i:i + batch], epochs[i:i + batch])
+        store.stop(timeout=600)
+
+        def rebuild():
+            for nid, _, _, _ in store.nodes():
+                series, rollups, history = new_node()
+                series.append_rows(*store.load_tail(nid, retention.max_points, start))
+                for chunk, chunk_epochs in store.iter_range(nid, start):
+                    rollups.add_rows(chunk, chunk_epochs)
+                    history.append_rows(chunk, chunk_epochs)
+
+        rebuild_s = _timeit(rebuild, 1)
+
+    total = nodes * rows_per_node
+    print(f"  {nodes} nodes x {rows_per_node} readings (series, rollups, compressed history): "
+          f"snapshot {size / 1e6:.2f} MB ({size / total:.1f} bytes/reading)")
+    print(f"  capture {capture_s * 1e3:.1f} ms (per-node locks)   encode+fsync+rename {write_s * 1e3:.1f} ms (no lock)")
+    print(f"  startup: rebuild from SQLite {rebuild_s * 1e3:8.1f} ms   load snapshot {load_s * 1e3:7.1f} ms "
+          f"({rebuild_s / load_s:.0f}x)")
+
+
+# --------------------------------------------------
+# EPOCH TIMESTAMPS
+# --------------------------------------------------
+
+@benchmark('timestamps')
+def bench_timestamps(readings=100000, alerts=50, iterations=2000):
+    """datetime vs. epoch-float timestamps on the data path, and ordering across a wall-clock step"""
+    import clock
+
+    received = [time.time() + i * 0.01 for i in range(readings)]
+
+    def datetime_path():
+        # Worker stamped a datetime per message, the store converted it back per row
+        return [datetime.fromtimestamp(t).timestamp() for t in received]
+
+    def epoch_path():
+        return list(received)
+
+    before = _timeit(datetime_path, 3)
+    after = _timeit(epoch_path, 3)
+    print(f"  stamp + store {readings:,} readings: datetime {before * 1e3:7.1f} ms   epoch {after * 1e3:5.2f} ms "
+          f"({before / after:.0f}x)")
+
+    # Alert cooldown check of one new alert against the alerts already shown
+    now = time.time()
+    iso = [datetime.fromtimestamp(now - i).isoformat() for i in range(alerts)]
+    epochs = [now - i for i in range(alerts)]
+    new_iso, new_epoch = datetime.fromtimestamp(now).isoformat(), now
+    before = _timeit(lambda: [(datetime.fromisoformat(new_iso) - datetime.fromisoformat(t)).total_seconds() < 30
+                              for t in iso], iterations)
+    after = _timeit(lambda: [new_epoch - t < 30 for t in epochs], iterations)
+    print(f"  alert dedupe vs {alerts} alerts: isoformat {before * 1e6:7.1f} us   epoch {after * 1e6:5.1f} us "
+          f"({before / after:.0f}x)")
+
+    # The wall clock is stepped back 30 s halfway through (NTP correction, manual change)
+    real_time = time.time
+    step = [0.0]
+    wall, mono = [], []
+    try:
+        time.time = lambda: real_time() - step[0]
+        for i in range(1000):
+            if i == 500:
+                step[0] = 30.0
+            wall.append(time.time())
+            mono.append(clock.epoch_now())
+    finally:
+        time.time = real_time
+    backwards = lambda stamps: sum(1 for a, b in zip(stamps, stamps[1:]) if b < a)
+    print(f"  30 s backward clock step: time.time() went back {backwards(wall)}x, epoch_now() {backwards(mono)}x")
+
+
+@benchmark('reorder')
+def bench_reorder(nodes=20, seconds=300, rate_hz=10, lateness=2.0, seed=7):
+    """Flaky-link delivery: receive-time stamping vs. event time through the reorder buffer"""
+    import random
+    from reorder_buffer import ReorderBuffer
+    from rollups import NodeRollups
+    from sensor_codec import reading_from_dict
+
+    rng = random.Random(seed)
+    start = time.time() - seconds
+    row = reading_from_dict(json.loads(SAMPLE_PAYLOAD), start)
+    # Each node samples at rate_hz; 10% of messages ride a burst held 0.5-1.5 s, 0.5% are stuck for 10 s
+    messages = []
+    for n in range(nodes):
+        held_until = 0.0
+        for i in range(seconds * rate_hz):
+            event = start + i / rate_hz + n * 0.001
+            delay = rng.uniform(0.02, 0.08)
+            if rng.random() < 0.1:
+                held_until = max(held_until, event + rng.uniform(0.5, 1.5))
+            if event < held_until:
+                delay = held_until - event + rng.uniform(0.0, 0.05)
+            if rng.random() < 0.005:
+                delay = 10.0
+            messages.append((event + delay, f"N{n}", row._replace(timestamp=event, LPG=float(i % 300))))
+    messages.sort(key=lambda m: m[0])
+    tiers = ((10, seconds // 10 + 2),)
+
+    def bucket_means(readings):
+        sums = {}
+        for nid, ts, value in readings:
+            acc = sums.setdefault((nid, int(ts // 10)), [0, 0.0])
+            acc[0] += 1
+            acc[1] += value
+        return {key: total / count for key, (count, total) in sums.items()}
+
+    truth = bucket_means([(nid, r[0], r[1]) for _, nid, r in messages])
+
+    def rollup_error(rollups):
+        errors = []
+        for nid, node_rollups in rollups.items():
+            tier = node_rollups.tiers[0].query('LPG')
+            for ts, mean in zip(tier['timestamps'], tier['mean']):
+                expected = truth.get((nid, int(ts // 10)))
+                if expected is not None:
+                    errors.append(abs(mean - expected))
+        return sum(errors) / len(errors), max(errors)
+
+    # Receive-time stamping: every message lands at its arrival time, in arrival order
+    rollups = {}
+    for arrival, nid, r in messages:
+        rollups.setdefault(nid, NodeRollups(tiers)).add_rows([r], [arrival])
+    skew = [arrival - r[0] for arrival, _, r in messages]
+    mean_err, max_err = rollup_error(rollups)
+    print(f"  receive time: plotted {sum(skew) / len(skew):.2f} s late on average (max {max(skew):.1f} s), "
+          f"10 s bucket mean error {mean_err:.1f} (max {max_err:.1f})")
+
+    # Event time: device stamps, reordered per node, late readings to the side channel
+    buffer = ReorderBuffer(lateness=lateness)
+    rollups = {}
+    newest = {}
+    backwards = 0
+
+    def append(nid, ready):
+        nonlocal backwards
+        for r in ready:
+            if r[0] < newest.get(nid, r[0]):
+                backwards += 1
+            newest[nid] = r[0]
+        rollups.setdefault(nid, NodeRollups(tiers)).add_rows(ready, [r[0] for r in ready])
+
+    released = []
+    t0 = time.perf_counter()
+    for arrival, nid, r in messages:
+        ready, _ = buffer.push(nid, [r], arrival)
+        if ready:
+            released.append((nid, ready))
+    for nid in buffer.pending_nodes(0.0):
+        released.append((nid, buffer.drain(nid)))
+    buffer_s = time.perf_counter() - t0
+    for nid, ready in released:
+        append(nid, ready)
+    stats = buffer.stats()
+    mean_err, max_err = rollup_error(rollups)
+    print(f"  event time:   {backwards} out-of-order append(s), {stats['late']} late reading(s) "
+          f"({stats['late'] / len(messages):.2%}) to the side channel, 10 s bucket mean error {mean_err:.1f} "
+          f"(max {max_err:.1f})")
+    print(f"  reorder buffer cost: {buffer_s / len(messages) * 1e6:.2f} us/reading ({len(messages):,} single-reading "
+          f"pushes, lateness {lateness:g} s)")
+
+
+def main(argv):
+    names = argv or list(BENCHMARKS)
+    for name in names:
+        func = BENCHMARKS.get(name)
+        if func is None:
+            print(f"Unknown benchmark '{name}'. Available: {', '.join(BENCHMARKS)}")
+            return 1
+        print(f"=== {name}: {func.__doc__}")
+        func()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
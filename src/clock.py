@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Mine Armour - Data-path Clock
+Timestamps on the data path are float epoch seconds, converted to datetimes or
+strings only when rendered. They are taken from the monotonic clock anchored to
+the wall clock at startup, so an NTP step or a manual clock change never moves a
+new reading behind older ones. Forward steps of the wall clock (a gateway that
+booted before its first NTP sync) are followed; backward steps are not.
+"""
+
+import time
+import threading
+from datetime import datetime, timezone
+
+# Wall clock jumps smaller than this are left to NTP slewing (which the monotonic clock follows)
+_RESYNC_S = 1.0
+
+_offset = time.time() - time.monotonic()
+_lock = threading.Lock()
+
+
+def epoch_now():
+    """Current time in epoch seconds; never goes backwards"""
+    global _offset
+    mono = time.monotonic()
+    offset = _offset
+    if time.time() - mono > offset + _RESYNC_S:
+        with _lock:
+            # Wall clock stepped forward: follow it (re-read so racing callers never move it back)
+            _offset = max(_offset, time.time() - mono)
+            offset = _offset
+    return offset + mono
+
+
+def as_epoch(value, default=None):
+    """Epoch seconds from an epoch number or a naive local datetime (`default` for None)"""
+    if value is None:
+        return default
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return float(value)
+
+
+def to_datetime(epoch):
+    """Naive local datetime for display (None stays None)"""
+    return datetime.fromtimestamp(epoch) if epoch is not None else None
+
+
+def format_clock(epoch, fmt='%H:%M:%S', default=''):
+    """Render-time formatting of an epoch timestamp"""
+    if epoch is None:
+        return default
+    return datetime.fromtimestamp(epoch).strftime(fmt)
+
+
+def parse_timestamp(value):
+    """Epoch seconds from a device timestamp: epoch seconds or milliseconds, or ISO 8601
+    (naive times are UTC, as publish_hr_test.py sends utcnow()); None if unusable"""
+    try:
+        if isinstance(value, str):
+            text = value.strip()
+            try:
+                value = float(text)
+            except ValueError:
+                if text[-1:] in ('Z', 'z'):
+                    text = text[:-1] + '+00:00'
+                parsed = datetime.fromisoformat(text)
+                if parsed.tzinfo is None:
+                    parsed = parsed.replace(tzinfo=timezone.utc)
+                return parsed.timestamp()
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return None
+        value = float(value)
+        if not value > 0 or value == float('inf'):
+            return None
+        return value / 1000.0 if value > 1e11 else value
+    except (ValueError, OverflowError, OSError):
+        return None
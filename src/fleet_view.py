@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Mine Armour - Fleet View
+The fleet-wide series (landing page with no node selected, alert monitor) computed
+on demand from the per-node series instead of being written a second time on
+ingest. Each channel is a k-way merge by timestamp of the nodes' newest samples,
+keeping the newest max_points; the result is cached until any node changes.
+"""
+
+import heapq
+import threading
+from array import array
+from itertools import islice
+from operator import itemgetter
+
+from node_series import CHANNELS, SeriesSnapshot
+
+_BY_TIME = itemgetter(0)
+
+
+class FleetView:
+    """Lazy merge of every registered node's series (see NodeRegistry)"""
+
+    def __init__(self, registry, max_points=100):
+        self.registry = registry
+        self.max_points = max_points
+        self._lock = threading.Lock()
+        self._cache = {}          # channels -> (node versions, SeriesSnapshot)
+        self._version = 0
+        self._merges = 0
+
+    def _node_snapshots(self, nodes, channels):
+        """Snapshot of each (node id, series); unchanged snapshots are reused lock-free"""
+        out = []
+        for node_id, series in nodes:
+            snap = series.cached_snapshot(channels)
+            if snap is None:
+                with self.registry.lock_for(node_id):
+                    snap = series.snapshot(channels)
+            out.append(snap)
+        return out
+
+    def snapshot(self, channels=CHANNELS):
+        """SeriesSnapshot of the fleet: per channel, the newest max_points samples of all nodes"""
+        nodes = [(storage['id'], storage['series']) for storage in self.registry.nodes()
+                 if storage['series'] is not None and storage['series'].version]
+        # Node series versions identify the merge input, so an unchanged fleet costs no copies
+        key = tuple((node_id, series.version) for node_id, series in nodes)
+        cached = self._cache.get(channels)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        snaps = self._node_snapshots(nodes, channels)
+
+        data = array('d')
+        lanes = {}
+        limit = self.max_points
+        for name in channels:
+            if name == 'ts':
+                continue
+            tails = []
+            for snap in snaps:
+                count = snap.count(name)
+                if count:
+                    first = max(0, count - limit)
+                    times = snap.times(name)[first:].tolist()
+                    values = snap.column(name)[first:].tolist()
+                    tails.append(zip(reversed(times), reversed(values)))
+            # Newest first across nodes; stop once the fleet window is full
+            newest = list(islice(heapq.merge(*tails, key=_BY_TIME, reverse=True), limit))
+            newest.reverse()
+            lanes[name] = (len(data), len(newest), len(data) + len(newest))
+            data.extend(t for t, _ in newest)
+            data.extend(v for _, v in newest)
+
+        latest = max(snaps, key=lambda snap: snap.latest['timestamp'], default=None)
+        with self._lock:
+            self._version += 1
+            self._merges += 1
+            snap = SeriesSnapshot(data, lanes, latest.latest if latest else None,
+                                  latest.gps_latest if latest else None, self._version)
+            self._cache[channels] = (key, snap)
+        return snap
+
+    def last_timestamp(self):
+        """Epoch seconds of the newest reading of any node"""
+        stamps = [storage['series'].last_timestamp() for storage in self.registry.nodes()
+                  if storage['series'] is not None]
+        return max((ts for ts in stamps if ts is not None), default=None)
+
+    def stats(self):
+        return {'cached_views': len(self._cache), 'merges': self._merges, 'max_points': self.max_points}
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+Mine Armour - Compressed History Blocks
+Gorilla-style compression for sealed per-node history: timestamps are stored as
+delta-of-delta milliseconds and every channel as XOR-encoded float64, each in its
+own bit stream. Readings accumulate in a small open block of typed arrays; full
+blocks are sealed into bytes, so long history costs a few bytes per reading
+instead of boxed floats and datetimes. Range reads skip blocks outside the range
+and decode only the requested channels.
+"""
+
+import os
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+
+from node_series import CHANNELS, CHANNEL_INDEX, MISSING_AS_NAN
+from sensor_codec import ALL_PRESENT
+
+_NAN_LANES = frozenset(CHANNEL_INDEX[name] for name in MISSING_AS_NAN)
+_VALUE_LANES = range(1, len(CHANNELS))
+_NAN = float('nan')
+
+# Delta-of-delta buckets (Gorilla): (prefix, prefix bits, value bits); larger values use 64 bits
+_DOD_BUCKETS = ((0b10, 2, 7), (0b110, 3, 9), (0b1110, 4, 12))
+_DOD_ESCAPE = (0b1111, 4, 64)
+
+# Block header: reading count, first/last timestamp (epoch ms), then one uint32 byte
+# offset per channel stream (timestamps first)
+_HEADER = struct.Struct('<Iqq')
+_OFFSETS = struct.Struct(f'<{len(CHANNELS)}I')
+
+
+# --------------------------------------------------
+# BIT STREAMS
+# --------------------------------------------------
+
+class _BitWriter:
+    """Appends bit fields to one integer (blocks are small, so this stays cheap)"""
+
+    __slots__ = ('acc', 'bits')
+
+    def __init__(self):
+        self.acc = 0
+        self.bits = 0
+
+    def write(self, value, width):
+        self.acc = (self.acc << width) | value
+        self.bits += width
+
+    def getvalue(self):
+        pad = -self.bits % 8
+        return (self.acc << pad).to_bytes((self.bits + pad) // 8, 'big')
+
+
+def _signed(value, width):
+    return value - (1 << width) if value >= 1 << (width - 1) else value
+
+
+# --------------------------------------------------
+# TIMESTAMPS: DELTA OF DELTA
+# --------------------------------------------------
+
+def encode_timestamps(ms):
+    """Integer millisecond timestamps -> bytes (first value raw, then delta-of-delta buckets)"""
+    out = _BitWriter()
+    if not ms:
+        return b''
+    out.write(ms[0] & (2 ** 64 - 1), 64)
+    prev, delta = ms[0], 0
+    for t in ms[1:]:
+        new_delta = t - prev
+        dod = new_delta - delta
+        prev, delta = t, new_delta
+        if dod == 0:
+            out.write(0, 1)
+            continue
+        for prefix, prefix_bits, width in _DOD_BUCKETS:
+            if -(1 << (width - 1)) <= dod < 1 << (width - 1):
+                out.write(prefix, prefix_bits)
+                out.write(dod & ((1 << width) - 1), width)
+                break
+        else:
+            prefix, prefix_bits, width = _DOD_ESCAPE
+            out.write(prefix, prefix_bits)
+            out.write(dod & ((1 << width) - 1), width)
+    return out.getvalue()
+
+
+def decode_timestamps(data, count):
+    """bytes -> list of `count` integer millisecond timestamps"""
+    if not count:
+        return []
+    big = int.from_bytes(data, 'big')
+    pos = len(data) * 8            # bits left to read, counted from the least significant end
+    pos -= 64
+    t = _signed((big >> pos) & (2 ** 64 - 1), 64)
+    out = [t]
+    delta = 0
+    append = out.append
+    for _ in range(count - 1):
+        # Control bits '0' / '10' / '110' / '1110' / '1111'; most readings hit '0' (same interval)
+        pos -= 1
+        if (big >> pos) & 1:
+            pos -= 1
+            if not (big >> pos) & 1:
+                width = 7
+            else:
+                pos -= 1
+                if not (big >> pos) & 1:
+                    width = 9
+                else:
+                    pos -= 1
+                    width = 64 if (big >> pos) & 1 else 12
+            pos -= width
+            delta += _signed((big >> pos) & ((1 << width) - 1), width)
+        t += delta
+        append(t)
+    return out
+
+
+# --------------------------------------------------
+# VALUES: XOR FLOATS
+# --------------------------------------------------
+
+def encode_floats(values):
+    """float64 values -> bytes (Gorilla XOR with leading/trailing zero windows)"""
+    if not len(values):
+        return b''
+    bits = memoryview(array('d', values)).cast('B').cast('Q')
+    out = _BitWriter()
+    prev = bits[0]
+    out.write(prev, 64)
+    prev_lead, prev_trail = 65, 0        # no window yet
+    for value in bits[1:]:
+        xor = value ^ prev
+        prev = value
+        if not xor:
+            out.write(0, 1)
+            continue
+        lead = min(64 - xor.bit_length(), 31)
+        trail = (xor & -xor).bit_length() - 1
+        if lead >= prev_lead and trail >= prev_trail:
+            # Fits the previous meaningful-bit window
+            out.write(0b10, 2)
+            out.write(xor >> prev_trail, 64 - prev_lead - prev_trail)
+        else:
+            meaningful = 64 - lead - trail
+            out.write(0b11, 2)
+            out.write(lead, 5)
+            out.write(meaningful - 1, 6)          # 1..64 stored as 0..63
+            out.write(xor >> trail, meaningful)
+            prev_lead, prev_trail = lead, trail
+    return out.getvalue()
+
+
+def decode_floats(data, count):
+    """bytes -> array('d') of `count` values"""
+    if not count:
+        return array('d')
+    big = int.from_bytes(data, 'big')
+    pos = len(data) * 8 - 64
+    prev = (big >> pos) & 0xFFFFFFFFFFFFFFFF
+    out = array('Q', [prev]) * count
+    lead = trail = 0
+    for k in range(1, count):
+        pos -= 1
+        if (big >> pos) & 1:
+            pos -= 1
+            if (big >> pos) & 1:
+                pos -= 11
+                header = (big >> pos) & 0x7FF
+                lead, meaningful = header >> 6, (header & 0x3F) + 1
+                trail = 64 - lead - meaningful
+            else:
+                meaningful = 64 - lead - trail
+            pos -= meaningful
+            prev ^= ((big >> pos) & ((1 << meaningful) - 1)) << trail
+        out[k] = prev
+    return array('d', out.tobytes())
+
+
+# --------------------------------------------------
+# BLOCKS
+# --------------------------------------------------
+
+class HistoryBlock:
+    """One sealed, immutable block of readings: header plus one bit stream per channel"""
+
+    __slots__ = ('data', 'count', 't_first', 't_last')
+
+    def __init__(self, data):
+        self.data = data
+        self.count, t_first, t_last = _HEADER.unpack_from(data)
+        self.t_first = t_first / 1000.0
+        self.t_last = t_last / 1000.0
+
+    @classmethod
+    def seal(cls, lanes):
+        """Compress a list of per-lane sequences (lane 0 = epoch seconds) into a block"""
+        ms = [round(t * 1000) for t in lanes[0]]
+        streams = [encode_timestamps(ms)] + [encode_floats(lanes[lane]) for lane in _VALUE_LANES]
+        offsets = []
+        pos = _HEADER.size + _OFFSETS.size
+        for stream in streams:
+            offsets.append(pos)
+            pos += len(stream)
+        return cls(_HEADER.pack(len(ms), ms[0], max(ms)) + _OFFSETS.pack(*offsets) + b''.join(streams))
+
+    @property
+    def nbytes(self):
+        return len(self.data)
+
+    def _stream(self, lane):
+        offsets = _OFFSETS.unpack_from(self.data, _HEADER.size)
+        end = offsets[lane + 1] if lane + 1 < len(offsets) else len(self.data)
+        return self.data[offsets[lane]:end]
+
+    def timestamps(self):
+        """Epoch-second timestamps of every reading"""
+        return [t / 1000.0 for t in decode_timestamps(self._stream(0), self.count)]
+
+    def column(self, name):
+        """array('d') of one channel (NaN where a vital had no reading)"""
+        return decode_floats(self._stream(CHANNEL_INDEX[name]), self.count)
+
+
+class CompressedHistory:
+    """Sealed history of one node: an open block of typed arrays plus compressed blocks.
+
+    Every `block_size` readings the open block is sealed. Oldest blocks are dropped
+    once the sealed blocks exceed max_bytes. Not thread-safe: the caller holds the
+    node's lock (same as NodeSeries).
+    """
+
+    def __init__(self, block_size=256, max_bytes=2 * 1024 * 1024):
+        self.block_size = max(2, int(block_size))
+        self.max_bytes = max_bytes
+        self._open = [array('d') for _ in CHANNELS]
+        self._blocks = deque()
+        self._sealed_bytes = 0
+        self._sealed_count = 0
+        self._dropped = 0
+
+    @staticmethod
+    def settings_from_env():
+        """HISTORY_BLOCK_SIZE readings per block and HISTORY_MAX_BYTES per node (0 = no sealed history)"""
+        return (int(os.getenv("HISTORY_BLOCK_SIZE", "256")),
+                int(os.getenv("HISTORY_MAX_BYTES", str(2 * 1024 * 1024))))
+
+    def __len__(self):
+        return self._sealed_count + len(self._open[0])
+
+    @property
+    def nbytes(self):
+        return self._sealed_bytes + sum(lane.itemsize * len(lane) for lane in self._open)
+
+    def append_rows(self, rows, epochs):
+        """Add SensorReading rows (epochs: their timestamps in epoch seconds); fields a
+        payload did not carry are stored as NaN"""
+        columns = list(zip(*rows))
+        columns[0] = epochs
+        masks = columns[-1]
+        if any(m is not None and m != ALL_PRESENT for m in masks):
+            for lane in _VALUE_LANES:
+                bit = 1 << lane
+                columns[lane] = [v if m is None or m & bit else _NAN for v, m in zip(columns[lane], masks)]
+        start = 0
+        n = len(rows)
+        while start < n:
+            take = min(n - start, self.block_size - len(self._open[0]))
+            for lane, values in enumerate(columns[:len(CHANNELS)]):
+                chunk = values[start:start + take]
+                if lane in _NAN_LANES:
+                    chunk = [_NAN if v == -1 else v for v in chunk]
+                self._open[lane].extend(chunk)
+            start += take
+            if len(self._open[0]) >= self.block_size:
+                self.seal()
+
+    def seal(self):
+        """Compress the open block (no-op when empty)"""
+        if not len(self._open[0]):
+            return
+        block = HistoryBlock.seal(self._open)
+        self._blocks.append(block)
+        self._sealed_bytes += block.nbytes
+        self._sealed_count += block.count
+        self._open = [array('d') for _ in CHANNELS]
+        while self._sealed_bytes > self.max_bytes and len(self._blocks) > 1:
+            old = self._blocks.popleft()
+            self._sealed_bytes -= old.nbytes
+            self._sealed_count -= old.count
+            self._dropped += old.count
+
+    def state(self):
+        """Sealed block bytes and a copy of the open block for a warm-restart snapshot (lock held)"""
+        return {
+            'blocks': [block.data for block in self._blocks],
+            'open': [array('d', lane) for lane in self._open],
+            'dropped': self._dropped,
+        }
+
+    def restore(self, state):
+        """Replace the contents with a state() copy (blocks are kept as sealed)"""
+        self._blocks = deque(HistoryBlock(data) for data in state['blocks'])
+        self._sealed_bytes = sum(block.nbytes for block in self._blocks)
+        self._sealed_count = sum(block.count for block in self._blocks)
+        self._dropped = state['dropped']
+        if len(state['open']) == len(CHANNELS):
+            self._open = state['open']
+        while self._sealed_bytes > self.max_bytes and len(self._blocks) > 1:
+            old = self._blocks.popleft()
+            self._sealed_bytes -= old.nbytes
+            self._sealed_count -= old.count
+            self._dropped += old.count
+
+    @property
+    def first_timestamp(self):
+        if self._blocks:
+            return self._blocks[0].t_first
+        return self._open[0][0] if len(self._open[0]) else None
+
+    def read(self, channels, since=None, until=None):
+        """{'ts': [...], channel: [...]} for readings in [since, until], oldest first.
+
+        Blocks outside the range are skipped without decoding; only the requested
+        channels of the remaining blocks are decoded."""
+        out = {'ts': []}
+        out.update((name, []) for name in channels)
+        blocks = list(self._blocks)
+        lo = 0
+        if since is not None:
+            lo = bisect_left([b.t_last for b in blocks], since)
+        for block in blocks[lo:]:
+            if until is not None and block.t_first > until:
+                break
+            ts = block.timestamps()
+            self._extend(out, ts, {name: block.column(name) for name in channels}, since, until)
+        if len(self._open[0]):
+            self._extend(out, self._open[0], {name: self._open[CHANNEL_INDEX[name]] for name in channels}, since, until)
+        return out
+
+    @staticmethod
+    def _extend(out, ts, columns, since, until):
+        i = 0 if since is None else bisect_left(ts, since)
+        j = len(ts) if until is None else bisect_right(ts, until)
+        if j <= i:
+            return
+        out['ts'].extend(ts[i:j])
+        for name, values in columns.items():
+            out[name].extend(values[i:j])
+
+    def stats(self):
+        raw = len(self) * 8 * len(CHANNELS)
+        return {
+            'readings': len(self),
+            'blocks': len(self._blocks),
+            'bytes': self.nbytes,
+            'bytes_per_reading': self.nbytes / len(self) if len(self) else 0.0,
+            'compression_ratio': raw / self.nbytes if self.nbytes else 0.0,
+            'dropped': self._dropped,
+        }
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Mine Armour - Hot-path Logging
+Rate-limited, sampled logging for code that runs per MQTT message or per dashboard
+poll. Messages use logging's lazy %-formatting, so suppressed records are never
+formatted, and per-topic traffic is summarised periodically instead of logged line
+by line. Full verbosity can be switched on at runtime for debugging.
+"""
+
+import os
+import time
+import logging
+import threading
+
+
+class LazyText:
+    """Defers decoding a payload until a log record is actually formatted"""
+
+    __slots__ = ('payload',)
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def __str__(self):
+        payload = self.payload
+        if isinstance(payload, (bytes, bytearray)):
+            return payload.decode('utf-8', 'replace')
+        return str(payload)
+
+
+class HotPathLog:
+    """Per-call-site rate limits and sampling plus periodic aggregated counters"""
+
+    def __init__(self, logger=None, rate=5, interval=10.0, summary_interval=10.0, verbose=False):
+        self.logger = logger or logging.getLogger()
+        self.rate = rate                          # records per call site per interval
+        self.interval = interval
+        self.summary_interval = summary_interval
+        self.verbose = verbose
+        self._lock = threading.Lock()
+        self._sites = {}     # site -> [window_start, emitted_in_window, suppressed_pending, calls, suppressed_total]
+        self._counts = {}    # (what, key) -> count in the current summary window
+        self._summary_start = time.monotonic()
+
+    @classmethod
+    def from_env(cls):
+        """LOG_VERBOSE, LOG_RATE_LIMIT (records per site per LOG_RATE_INTERVAL s) and LOG_SUMMARY_INTERVAL"""
+        return cls(
+            rate=int(os.getenv("LOG_RATE_LIMIT", "5")),
+            interval=float(os.getenv("LOG_RATE_INTERVAL", "10")),
+            summary_interval=float(os.getenv("LOG_SUMMARY_INTERVAL", "10")),
+            verbose=os.getenv("LOG_VERBOSE", "0").lower() in ("1", "true", "yes"),
+        )
+
+    def set_verbose(self, verbose):
+        """Full verbosity logs every hot-path record (no rate limit or sampling)"""
+        self.verbose = bool(verbose)
+        self.logger.info("Hot-path logging verbosity: %s", "full" if self.verbose else "rate-limited")
+
+    # --------------------------------------------------
+    # RATE-LIMITED RECORDS
+    # --------------------------------------------------
+
+    def log(self, site, level, msg, *args, sample=1):
+        """Log msg % args from call site `site`: at most `rate` records per interval, and only
+        every `sample`-th call when sample > 1. The next emitted record reports how many
+        were suppressed."""
+        if not self.logger.isEnabledFor(level):
+            return
+        if self.verbose:
+            self.logger.log(level, msg, *args)
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            state = self._sites.get(site)
+            if state is None:
+                state = self._sites[site] = [now, 0, 0, 0, 0]
+            state[3] += 1
+            if sample > 1 and (state[3] - 1) % sample:
+                state[2] += 1
+                state[4] += 1
+                return
+            if now - state[0] >= self.interval:
+                state[0] = now
+                state[1] = 0
+            if state[1] >= self.rate:
+                state[2] += 1
+                state[4] += 1
+                return
+            state[1] += 1
+            suppressed = state[2]
+            state[2] = 0
+
+        if suppressed:
+            self.logger.log(level, msg + " (+%d similar suppressed)", *(args + (suppressed,)))
+        else:
+            self.logger.log(level, msg, *args)
+
+    def debug(self, site, msg, *args, **kwargs):
+        self.log(site, logging.DEBUG, msg, *args, **kwargs)
+
+    def info(self, site, msg, *args, **kwargs):
+        self.log(site, logging.INFO, msg, *args, **kwargs)
+
+    def warning(self, site, msg, *args, **kwargs):
+        self.log(site, logging.WARNING, msg, *args, **kwargs)
+
+    # --------------------------------------------------
+    # AGGREGATED COUNTERS
+    # --------------------------------------------------
+
+    def count(self, what, key, n=1):
+        """Count an event; every summary_interval one line per key is logged, e.g.
+        '📊 120 messages from LOKI_2004 in last 10s'"""
+        now = time.monotonic()
+        with self._lock:
+            counter = (what, key)
+            self._counts[counter] = self._counts.get(counter, 0) + n
+            elapsed = now - self._summary_start
+            if elapsed < self.summary_interval:
+                return
+            counts = self._counts
+            self._counts = {}
+            self._summary_start = now
+
+        if self.logger.isEnabledFor(logging.INFO):
+            for (what, key), total in sorted(counts.items()):
+                self.logger.info("📊 %d %s from %s in last %.0fs", total, what, key, elapsed)
+
+    def stats(self):
+        """Per-site call and suppression totals"""
+        with self._lock:
+            return {
+                'verbose': self.verbose,
+                'rate': self.rate,
+                'interval_s': self.interval,
+                'sites': {site: {'calls': s[3], 'suppressed': s[4]} for site, s in self._sites.items()},
+            }
+
+
+# Shared instance used by the dashboard and server.py
+hot_log = HotPathLog.from_env()
@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""
+Mine Armour - Ingest Pipeline
+Decouples the MQTT network thread from SensorDataManager storage.
+The paho callback only enqueues raw payload bytes; worker threads drain them in
+batches, decode them and store them. Deduplicator drops repeated readings per
+node before they reach storage.
+"""
+
+import os
+import time
+import queue
+import threading
+import logging
+from collections import OrderedDict
+
+from clock import epoch_now
+
+
+class _Shard(queue.Queue):
+    """queue.Queue that can admit protected messages past maxsize and evict around them"""
+
+    def put_protected(self, item):
+        with self.mutex:
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+    def evict_oldest(self, protected):
+        """Remove and return the oldest unprotected message, or None if every queued message is protected.
+
+        Messages still awaiting a broker ack count as protected."""
+        with self.mutex:
+            for idx, item in enumerate(self.queue):
+                if item is IngestQueue._STOP or item[4] is not None:
+                    continue
+                if protected is None or not protected(item[0]):
+                    del self.queue[idx]
+                    self.not_full.notify()
+                    return item
+        return None
+
+
+class IngestQueue:
+    """Bounded hand-off queue between MQTT on_message and the storage workers"""
+
+    # What to do when a shard is full:
+    #   drop_oldest - evict the oldest queued message to make room (default, keeps data fresh)
+    #   drop_newest - discard the incoming message
+    #   block       - wait up to block_timeout for room, then discard the incoming message
+    # Messages on protected topics (e.g. RFID scans) are never dropped or evicted:
+    # they are admitted past capacity when a shard is full. The same holds for
+    # messages put with an ack token: the broker has not been told they were
+    # received, and its receive-maximum window bounds how many there can be.
+    POLICIES = ('drop_oldest', 'drop_newest', 'block')
+
+    _STOP = object()
+
+    def __init__(self, handler, maxsize=10000, workers=1, policy='drop_oldest', block_timeout=0.05,
+                 batch_size=256, name='ingest', protected=None, burst_watermark=None, ack=None,
+                 shard_key=None):
+        """handler(batch) is called on a worker thread with a list of
+        (topic, payload, received_at) tuples, received_at being the enqueue time in
+        epoch seconds (clock.epoch_now, so it never steps backwards).
+        protected(topic) -> bool marks topics whose messages must never be dropped.
+        ack(token) is called on the worker for every message put with an ack token,
+        once the handler has returned for its batch (stored, or failed and logged).
+        shard_key(topic) picks the worker; it must be equal for all topics feeding a node
+        (e.g. TopicRouter.shard_key) so each node's readings are stored in arrival order.
+        Without it messages are sharded by topic.
+        While a shard is at least burst_watermark (fraction) full, workers drain the
+        whole backlog in one batch so the handler can coalesce it."""
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown full-queue policy '{policy}' (expected one of {self.POLICIES})")
+        self.handler = handler
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.batch_size = max(1, int(batch_size))
+        self.name = name
+        self.protected = protected
+        self.burst_watermark = burst_watermark
+        self.ack = ack
+        self.shard_key = shard_key
+        self.num_workers = max(1, int(workers))
+        # One bounded queue per worker; messages are sharded by node (shard_key) so
+        # that readings of the same node are always stored in arrival order.
+        shard_size = max(1, int(maxsize) // self.num_workers)
+        self.maxsize = shard_size * self.num_workers
+        self._shards = [_Shard(maxsize=shard_size) for _ in range(self.num_workers)]
+        self._burst_depth = (max(1, int(shard_size * burst_watermark))
+                             if burst_watermark and 0 < burst_watermark <= 1 else None)
+        self._local = threading.local()
+        self._threads = []
+        self._running = False
+
+        self._stats_lock = threading.Lock()
+        self._offered = 0
+        self._enqueued = 0
+        self._processed = 0
+        self._batches = 0
+        self._dropped = 0
+        self._dropped_by_topic = {}
+        self._over_capacity = 0
+        self._errors = 0
+        self._acked = 0
+        self._max_depth = 0
+        self._enqueue_total = 0.0
+        self._enqueue_max = 0.0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    @classmethod
+    def from_env(cls, handler, name='ingest', protected=None, burst_watermark=None, ack=None, shard_key=None):
+        """Build a queue configured from the INGEST_* environment variables"""
+        return cls(
+            handler,
+            maxsize=int(os.getenv("INGEST_QUEUE_SIZE", "10000")),
+            workers=int(os.getenv("INGEST_WORKERS", "1")),
+            policy=os.getenv("INGEST_FULL_POLICY", "drop_oldest"),
+            block_timeout=float(os.getenv("INGEST_BLOCK_TIMEOUT", "0.05")),
+            batch_size=int(os.getenv("INGEST_BATCH_SIZE", "256")),
+            name=name,
+            protected=protected,
+            burst_watermark=burst_watermark,
+            ack=ack,
+            shard_key=shard_key,
+        )
+
+    # --------------------------------------------------
+    # PRODUCER SIDE (MQTT network thread)
+    # --------------------------------------------------
+
+    def put(self, topic, payload, ack_token=None):
+        """Enqueue one raw message. Returns False if it was dropped.
+
+        A message with an ack_token (e.g. the MQTT mid of a manually acked QoS1 delivery)
+        is never dropped; ack(ack_token) runs once it has been handled."""
+        start = time.perf_counter()
+        if self.num_workers > 1:
+            key = self.shard_key(topic) if self.shard_key is not None else topic
+            shard = self._shards[hash(key) % self.num_workers]
+        else:
+            shard = self._shards[0]
+        item = (topic, payload, epoch_now(), time.monotonic(), ack_token)
+        accepted = True
+        evicted = None
+        forced = False
+        try:
+            if self.policy == 'block':
+                shard.put(item, timeout=self.block_timeout)
+            else:
+                shard.put_nowait(item)
+        except queue.Full:
+            if ack_token is not None or (self.protected is not None and self.protected(topic)):
+                shard.put_protected(item)
+                forced = True
+            elif self.policy == 'drop_oldest':
+                evicted = shard.evict_oldest(self.protected)
+                try:
+                    shard.put_nowait(item)
+                except queue.Full:
+                    accepted = False
+            else:
+                accepted = False
+
+        elapsed = time.perf_counter() - start
+        depth = shard.qsize()
+        with self._stats_lock:
+            self._offered += 1
+            if accepted:
+                self._enqueued += 1
+            if forced:
+                self._over_capacity += 1
+            if evicted is not None:
+                self._dropped += 1
+                self._dropped_by_topic[evicted[0]] = self._dropped_by_topic.get(evicted[0], 0) + 1
+            if not accepted:
+                self._dropped += 1
+                self._dropped_by_topic[topic] = self._dropped_by_topic.get(topic, 0) + 1
+            self._enqueue_total += elapsed
+            if elapsed > self._enqueue_max:
+                self._enqueue_max = elapsed
+            if depth > self._max_depth:
+                self._max_depth = depth
+        return accepted
+
+    # --------------------------------------------------
+    # CONSUMER SIDE (worker threads)
+    # --------------------------------------------------
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._threads = []
+        for idx, shard in enumerate(self._shards):
+            t = threading.Thread(target=self._worker, args=(shard,), name=f"{self.name}-worker-{idx}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        logging.info(f"📥 Ingest queue started: {self.num_workers} worker(s), capacity {self.maxsize}, policy={self.policy}")
+
+    def stop(self, timeout=2.0):
+        if not self._running:
+            return
+        self._running = False
+        for shard in self._shards:
+            shard.put_protected(self._STOP)
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def _worker(self, shard):
+        stopping = False
+        while not stopping:
+            # Block for the first message, then drain whatever else is already
+            # queued so storage can take its lock once for the whole batch.
+            item = shard.get()
+            if item is self._STOP:
+                break
+            items = [item]
+            limit = self.batch_size
+            burst = self._burst_depth is not None and shard.qsize() >= self._burst_depth
+            if burst:
+                limit = max(limit, shard.maxsize + 1)
+            while len(items) < limit:
+                try:
+                    item = shard.get_nowait()
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stopping = True
+                    break
+                items.append(item)
+
+            dequeued_at = time.monotonic()
+            batch = [(topic, payload, received_at) for topic, payload, received_at, _, _ in items]
+            self._local.burst = burst
+            try:
+                self.handler(batch)
+                failed = False
+            except Exception as e:
+                failed = True
+                logging.error(f"❌ Ingest worker error on batch of {len(batch)} message(s): {e}")
+            # Ack only now, so unstored messages keep counting against the broker's window
+            # (failed batches are acked too: a redelivery would fail the same way)
+            acked = 0
+            if self.ack is not None:
+                for item in items:
+                    if item[4] is not None:
+                        try:
+                            self.ack(item[4])
+                            acked += 1
+                        except Exception as e:
+                            logging.error(f"❌ Ingest ack failed: {e}")
+
+            waited = [dequeued_at - item[3] for item in items]
+            with self._stats_lock:
+                self._processed += len(items)
+                self._batches += 1
+                self._acked += acked
+                if failed:
+                    self._errors += len(items)
+                self._wait_total += sum(waited)
+                longest = max(waited)
+                if longest > self._wait_max:
+                    self._wait_max = longest
+
+    def bursting(self):
+        """True inside the handler when the current batch is a backlog drain (see burst_watermark)"""
+        return getattr(self._local, 'burst', False)
+
+    # --------------------------------------------------
+    # MONITORING
+    # --------------------------------------------------
+
+    def depth(self):
+        return sum(shard.qsize() for shard in self._shards)
+
+    def stats(self):
+        """Snapshot of queue depth, throughput counters and latencies (milliseconds)"""
+        with self._stats_lock:
+            return {
+                'depth': self.depth(),
+                'max_depth': self._max_depth,
+                'capacity': self.maxsize,
+                'workers': self.num_workers,
+                'policy': self.policy,
+                'enqueued': self._enqueued,
+                'processed': self._processed,
+                'batches': self._batches,
+                'avg_batch_size': (self._processed / self._batches) if self._batches else 0.0,
+                'dropped': self._dropped,
+                'dropped_by_topic': dict(self._dropped_by_topic),
+                'protected_over_capacity': self._over_capacity,
+                'errors': self._errors,
+                'acked': self._acked,
+                'enqueue_latency_avg_ms': (self._enqueue_total / self._offered * 1000.0) if self._offered else 0.0,
+                'enqueue_latency_max_ms': self._enqueue_max * 1000.0,
+                'queue_wait_avg_ms': (self._wait_total / self._processed * 1000.0) if self._processed else 0.0,
+                'queue_wait_max_ms': self._wait_max * 1000.0,
+            }
+
+
+class Deduplicator:
+    """Per-node duplicate filter (QoS1 redeliveries, one reading echoed on several topics).
+
+    Keys come from sensor_codec.dedupe_key. Sequence keys ('seq', source, n) identify a
+    message: each node remembers at most max_entries of them for window seconds, and one
+    seen again inside the window is a duplicate. Content keys ('hash', h) do not: a steady
+    helmet sends identical values second after second, so they only drop the same reading
+    arriving on a different topic of the same batch. In event-time mode ('event', h) also
+    covers the device timestamp and is remembered like a sequence key.
+    """
+
+    def __init__(self, window=10.0, max_entries=1024):
+        self.window = window
+        self.max_entries = max_entries
+        self._seen = {}     # node_id -> OrderedDict(key -> monotonic time), oldest first
+        self._counts = {}   # node_id -> [checked, seq_duplicates, hash_duplicates]
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """DEDUPE_WINDOW seconds (0 disables) and DEDUPE_MAX_ENTRIES keys per node"""
+        return cls(
+            window=float(os.getenv("DEDUPE_WINDOW", "10")),
+            max_entries=int(os.getenv("DEDUPE_MAX_ENTRIES", "1024")),
+        )
+
+    @property
+    def enabled(self):
+        return self.window > 0 and self.max_entries > 0
+
+    def filter_batch(self, entries, key_func):
+        """Drop duplicates from a batch of (reading, node_ids, topic) entries.
+
+        Returns (reading, kept_node_ids, topic) for every reading that is new to at least
+        one of its nodes, in the original order.
+        """
+        now = time.monotonic()
+        horizon = now - self.window
+        kept = []
+        echoes = {}     # (node, content key) -> topic it first arrived on in this batch
+        with self._lock:
+            for reading, node_ids, topic in entries:
+                key = key_func(reading)
+                windowed = key[0] != 'hash'
+                fresh = []
+                for nid in node_ids:
+                    seen = self._seen.get(nid)
+                    if seen is None:
+                        seen = self._seen[nid] = OrderedDict()
+                        self._counts[nid] = [0, 0, 0]
+                    counts = self._counts[nid]
+                    counts[0] += 1
+
+                    # Expire from the old end; entries are kept in arrival order
+                    while seen:
+                        oldest = next(iter(seen.values()))
+                        if oldest >= horizon:
+                            break
+                        seen.popitem(last=False)
+
+                    if not windowed:
+                        if echoes.setdefault((nid, key), topic) != topic:
+                            counts[2] += 1
+                            continue
+                    elif key in seen:
+                        counts[1 if key[0] == 'seq' else 2] += 1
+                        continue
+                    else:
+                        seen[key] = now
+                        if len(seen) > self.max_entries:
+                            seen.popitem(last=False)
+                    fresh.append(nid)
+                if fresh:
+                    kept.append((reading, tuple(fresh), topic))
+        return kept
+
+    def forget(self, node_ids):
+        """Drop the state kept for nodes that are no longer tracked (e.g. evicted as idle)"""
+        with self._lock:
+            for nid in node_ids:
+                self._seen.pop(nid, None)
+                self._counts.pop(nid, None)
+
+    def stats(self):
+        """Per-node checked / duplicate counters"""
+        with self._lock:
+            by_node = {
+                nid: {'checked': c[0], 'seq_duplicates': c[1], 'hash_duplicates': c[2], 'tracked': len(self._seen[nid])}
+                for nid, c in self._counts.items()
+            }
+        return {
+            'enabled': self.enabled,
+            'window_s': self.window,
+            'max_entries': self.max_entries,
+            'checked': sum(n['checked'] for n in by_node.values()),
+            'duplicates': sum(n['seq_duplicates'] + n['hash_duplicates'] for n in by_node.values()),
+            'by_node': by_node,
+        }
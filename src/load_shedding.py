@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Mine Armour - Ingest Load Shedding
+While the ingest backlog is above a watermark, intermediate gas samples are
+coalesced so only the latest reading per node is stored. Readings that would raise
+an alert, or that clear one, are always kept, and RFID scans never reach the shedder.
+"""
+
+import os
+import threading
+
+from alert_rules import reading_in_alarm
+from topic_router import TopicRouter
+
+
+class LoadShedder:
+    """Per-topic shedding policies applied to decoded sensor readings"""
+
+    # keep     - never shed readings from the topic
+    # coalesce - under backlog keep only the latest reading per node in each batch,
+    #            plus every reading that enters, stays in or leaves an alarm state
+    POLICIES = ('keep', 'coalesce')
+
+    def __init__(self, default_policy='coalesce', overrides=None, watermark=0.5):
+        if default_policy not in self.POLICIES:
+            raise ValueError(f"Unknown load-shedding policy '{default_policy}' (expected one of {self.POLICIES})")
+        self.default_policy = default_policy
+        self.watermark = watermark
+        self._policies = TopicRouter()
+        for pattern, policy in (overrides or {}).items():
+            if policy not in self.POLICIES:
+                raise ValueError(f"Unknown load-shedding policy '{policy}' for {pattern}")
+            self._policies.add(pattern, policy)
+
+        self._lock = threading.Lock()
+        self._in_alarm = {}      # node group -> alarm state of the last stored reading
+        self._shed_batches = 0
+        self._by_topic = {}      # topic -> [seen while shedding, coalesced]
+
+    @classmethod
+    def from_env(cls):
+        """LOAD_SHED_POLICY, LOAD_SHED_TOPICS ("LOKI_2004=keep,SUSH_2004/#=coalesce") and LOAD_SHED_WATERMARK"""
+        overrides = {}
+        for entry in os.getenv("LOAD_SHED_TOPICS", "").split(','):
+            if '=' in entry:
+                pattern, policy = entry.split('=', 1)
+                overrides[pattern.strip()] = policy.strip()
+        return cls(
+            default_policy=os.getenv("LOAD_SHED_POLICY", "coalesce"),
+            overrides=overrides,
+            watermark=float(os.getenv("LOAD_SHED_WATERMARK", "0.5")),
+        )
+
+    def policy_for(self, topic):
+        route = self._policies.route(topic)
+        return route.handler if route is not None else self.default_policy
+
+    @property
+    def enabled(self):
+        """Shedding engages once the ingest backlog reaches watermark (fraction of capacity; 0 disables)"""
+        return 0 < self.watermark <= 1
+
+    def shed(self, records, nodes_for, coalesce=True):
+        """Coalesce a batch of (topic, SensorReading) records; returns the records to store.
+
+        nodes_for(topic) gives the node IDs a topic feeds; readings for the same nodes
+        that carry the same fields coalesce together regardless of which topic carried them.
+        Call it for every batch: with coalesce=False (no backlog) nothing is dropped, but the
+        alarm state is still tracked, so the first reading shed after a burst begins knows
+        whether its node was in alarm.
+        """
+        if not coalesce:
+            with self._lock:
+                for topic, reading in records:
+                    if self.policy_for(topic) != 'keep':
+                        self._in_alarm[tuple(nodes_for(topic))] = reading_in_alarm(reading)
+            return records
+
+        keep = [False] * len(records)
+        latest = {}
+        with self._lock:
+            self._shed_batches += 1
+            for idx, (topic, reading) in enumerate(records):
+                counts = self._by_topic.get(topic)
+                if counts is None:
+                    counts = self._by_topic[topic] = [0, 0]
+                counts[0] += 1
+                if self.policy_for(topic) == 'keep':
+                    keep[idx] = True
+                    continue
+                group = tuple(nodes_for(topic))
+                alarm = reading_in_alarm(reading)
+                if alarm or self._in_alarm.get(group, False):
+                    keep[idx] = True
+                self._in_alarm[group] = alarm
+                # Readings carrying different fields (gas-only vs vitals) coalesce separately
+                latest[group, reading[19]] = idx
+            for idx in latest.values():
+                keep[idx] = True
+
+            kept = []
+            for idx, record in enumerate(records):
+                if keep[idx]:
+                    kept.append(record)
+                else:
+                    self._by_topic[record[0]][1] += 1
+        return kept
+
+    def stats(self):
+        with self._lock:
+            return {
+                'default_policy': self.default_policy,
+                'watermark': self.watermark,
+                'shed_batches': self._shed_batches,
+                'coalesced': sum(c[1] for c in self._by_topic.values()),
+                'by_topic': {
+                    topic: {'policy': self.policy_for(topic), 'seen': c[0], 'coalesced': c[1]}
+                    for topic, c in self._by_topic.items()
+                },
+            }
@@ -7,26 +7,48 @@ Sensors: Gas (LPG, CH4, Propane, Butane, H2), Heart Rate, Temperature, Humidity,
 
 import os
 import sys
-import json
 import time
 import threading
 import ssl
+import uuid
 from datetime import datetime, timedelta
 from collections import deque
 import logging
 
 # Third-party imports
-import paho.mqtt.client as mqtt
 import plotly.graph_objects as go
 import plotly.express as px
 import plotly.io as pio
 import dash
 from dash import dcc, html, Input, Output, State, ALL, callback_context
-from flask import request, jsonify
+from flask import Response, request, jsonify
 import dash_bootstrap_components as dbc
 import dash
 from dash.exceptions import PreventUpdate
 
+# Local modules
+from clock import as_epoch, epoch_now, format_clock
+from alert_rules import (GAS_DANGER_THRESHOLDS, HEART_RATE_DANGER_RANGE, HEART_RATE_HIGH, TEMPERATURE_RANGE,
+                         heart_rate_alarm, temperature_alarm, gas_alarm, reading_in_alarm, fresh_value)
+from ingest_pipeline import Deduplicator, IngestQueue
+from hot_log import LazyText, hot_log
+from load_shedding import LoadShedder
+from mqtt_options import MqttOptions, TopicAliasResolver
+from node_registry import NodeRegistry
+from node_series import CHANNELS, SECTIONS, NodeSeries, Retention
+from fleet_view import FleetView
+from history_blocks import CompressedHistory
+from rollups import NodeRollups
+from reorder_buffer import ReorderBuffer
+from postgres_sink import PostgresSink
+from segment_store import SegmentStore
+from series_store import SeriesStore
+from shared_ingest import SharedSubscriptionIngest
+from state_snapshot import StateSnapshotter
+from sensor_codec import (SensorReading, decode_payload, dedupe_key, event_dedupe_key, is_binary_payload,
+                          reading_from_dict)
+from topic_router import TopicRouter, route_nodes
+
 # Force Plotly to use built-in json engine to avoid orjson issues
 pio.json.config.default_engine = "json"
 
@@ -51,6 +73,20 @@ class SensorDataManager:
         'SUSH_2004': ['DB970104'],    # SUSH → ONLY Sushma (DB970104)
         'SAM_2006': ['DB970104'],     # SAM → ONLY Sushma (DB970104)
     }
+
+    # RFID station topics (payloads carry station_id/tag_id)
+    RFID_TOPICS = ['rfid', 'rfid/#']
+
+    # Per-helmet topics: the last level is the node ID (nodes are registered on first message)
+    NODE_TOPICS = ['helmet/+']
+
+    # Configured nodes: always listed and never evicted (node ID -> display name)
+    KNOWN_NODES = {
+        'C7761005': 'LOKESH (RANJ_2005 Data)',
+        '93BA302D': 'TRISHALA (LOKI_2004 Data)',
+        '7AA81505': 'RANJHANA (RANJ_2005 Data)',
+        'DB970104': 'SUSHMA (LOKI_2004 Data)',
+    }
     
 
 
@@ -613,60 +649,37 @@ class SensorDataManager:
 
     def __init__(self, max_points=100):
         self.max_points = max_points
-        # Initialize per-node data storage
-        self.per_node_data = {}
-        for node_id in ['C7761005', '93BA302D', '7AA81505', 'DB970104']:
-            self.per_node_data[node_id] = self._create_empty_node_data()
+        # Compiled topic -> (handler, nodes) routes shared by ingest and MQTT dispatch
+        self.topic_router = TopicRouter.from_node_map(self.TOPIC_TO_NODE_MAP, handler='sensor')
+        for rfid_topic in self.RFID_TOPICS:
+            self.topic_router.add(rfid_topic, 'rfid')
+        for node_topic in self.NODE_TOPICS:
+            self.topic_router.add(node_topic, 'sensor')
+        # Per-node duplicate suppression (DEDUPE_WINDOW / DEDUPE_MAX_ENTRIES)
+        self.deduplicator = Deduplicator.from_env()
+        # Optional event-time ingest (INGEST_TIME_MODE=event): device timestamps, reordered per node
+        self.reorder = ReorderBuffer.from_env()
+        self.event_time = self.reorder is not None
+        # Per-node storage: nodes register on first message, buffers are allocated on first data
+        self.rollup_tiers = NodeRollups.tiers_from_env()
+        # Longer raw history in Gorilla-compressed blocks (HISTORY_BLOCK_SIZE / HISTORY_MAX_BYTES)
+        self.history_block_size, self.history_max_bytes = CompressedHistory.settings_from_env()
+        # Per-node history is kept by duration (SERIES_RETENTION / SERIES_CHANNEL_RETENTION),
+        # capped at SERIES_MAX_BYTES per node; max_points sizes the fleet view and RFID buffers
+        self.retention = Retention.from_env()
+        self.per_node_data = NodeRegistry.from_env(lambda: NodeSeries(retention=self.retention))
+        for node_id, name in self.KNOWN_NODES.items():
+            self.per_node_data.register(node_id, name=name, pinned=True)
         
-        # Legacy global data (kept for backward compatibility)
+        # Fleet-wide view (no node selected, alert monitor), merged from the per-node series on read
+        self.fleet = FleetView(self.per_node_data, max_points)
         self.data = {
-            'gas_sensors': {
-                'timestamps': deque(maxlen=max_points),
-                'LPG': deque(maxlen=max_points),
-                'CH4': deque(maxlen=max_points),
-                'Propane': deque(maxlen=max_points),
-                'Butane': deque(maxlen=max_points),
-                'H2': deque(maxlen=max_points),
-                'latest': {
-                    'LPG': 0,
-                    'CH4': 0,
-                    'Propane': 0,
-                    'Butane': 0,
-                    'H2': 0,
-                    'timestamp': None
-                }
-            },
-            'health_sensors': {
-                'timestamps': deque(maxlen=max_points),
-                'heartRate': deque(maxlen=max_points),
-                'spo2': deque(maxlen=max_points),
-                'GSR': deque(maxlen=max_points),
-                'stress': deque(maxlen=max_points),
-            },
-            'environmental_sensors': {
-                'timestamps': deque(maxlen=max_points),
-                'temperature': deque(maxlen=max_points),
-                'humidity': deque(maxlen=max_points),
-            },
-            'gps_data': {
-                'timestamps': deque(maxlen=max_points),
-                'lat': deque(maxlen=max_points),
-                'lon': deque(maxlen=max_points),
-                'alt': deque(maxlen=max_points),
-                'sat': deque(maxlen=max_points),
-                'latest': {
-                    'lat': 0.0,
-                    'lon': 0.0,
-                    'alt': 0.0,
-                    'sat': 0
-                }
-            },
             'rfid_checkpoints': {
                 'timestamps': deque(maxlen=max_points),
                 'uid_scans': deque(maxlen=max_points),
                 'latest_tag': None,
                 'latest_station': None,
-                'checkpoint_progress': {},  # Maps node_id -> {checkpoint_id: passed_timestamp}
+                'checkpoint_progress': {},  # Maps node_id -> {checkpoint_id: passed_epoch}
                 'active_checkpoints': {
                     # Zone A checkpoints
                     '1298': ['Entry Gate', 'Safety Check', 'Equipment Bay', 'Deep Section'],
@@ -682,441 +695,817 @@ class SensorDataManager:
                 }
             }
         }
-        self.lock = threading.Lock()
+        # Fine-grained locking: each node's series is guarded by one of the registry's
+        # striped locks; the RFID state has its own lock
+        self.rfid_lock = threading.Lock()
         # Per-tag scan counters to support sequence-based checkpoint progression
         # Keyed by lower-case tag id. Used for special-case flows (e.g. c7761005 in Zone A)
         self._rfid_tag_scan_counts = {}
         # Track last scan time for each tag to prevent duplicate rapid scans
-        self._last_scan_time = {}  # Format: {(tag_id, station_id): timestamp}
+        self._last_scan_time = {}  # Format: {(tag_id, station_id): epoch seconds}
         # Global per-tag debounce to avoid rapid cycling even across stations
-        self._last_tag_time = {}  # Format: {tag_id: timestamp}
+        self._last_tag_time = {}  # Format: {tag_id: epoch seconds}
         # Track last checkpoint index seen per tag (to detect wrap-around)
         self._rfid_tag_last_index = {}
         # Track last detected direction per tag ('forward' or 'reverse')
         self._rfid_tag_direction = {}
+        # RFID events persisted since the store's last RFID state checkpoint
+        self._rfid_since_checkpoint = 0
+
+        # Optional warm-restart snapshots (STATE_SNAPSHOT): load the last one before anything else
+        self.snapshots = StateSnapshotter.from_env()
+        restored, snapshot_time = {}, None
+        if self.snapshots is not None:
+            loaded = self.snapshots.load()
+            if loaded is not None:
+                restored, snapshot_time = self.restore_state(loaded[1])
+
+        # Optional SQLite persistence (SERIES_DB): rehydrate from the stored tail (only what is
+        # newer than the snapshot, if one was loaded), then persist new data
+        self.store = SeriesStore.from_env()
+        if self.store is not None:
+            if self.store.replay:
+                self.restore_from_store(restored, snapshot_time)
+            self.store.start()
+        # Optional fleet history in PostgreSQL (PG_DSN): buffered COPY writes, never blocks ingest
+        self.pg_sink = PostgresSink.from_env()
+        if self.pg_sink is not None:
+            self.pg_sink.start()
+        self._alert_sent = {}  # (type, node, message) -> last time the alert was sent to the sink
+        self._alert_lock = threading.Lock()
+        # Optional off-heap history in mmap-able per-node segment files (SEGMENT_DIR)
+        self.segments = SegmentStore.from_env()
+        if self.reorder is not None:
+            self.reorder.start(self.flush_reorder)
+        if self.snapshots is not None:
+            self.snapshots.start(self.capture_state)
     
-    def _create_empty_node_data(self):
-        """Create an empty data structure for a single node"""
-        return {
-            'gas_sensors': {
-                'timestamps': deque(maxlen=self.max_points),
-                'LPG': deque(maxlen=self.max_points),
-                'CH4': deque(maxlen=self.max_points),
-                'Propane': deque(maxlen=self.max_points),
-                'Butane': deque(maxlen=self.max_points),
-                'H2': deque(maxlen=self.max_points),
-                'latest': None  # None means no data received yet
-            },
-            'health_sensors': {
-                'timestamps': deque(maxlen=self.max_points),
-                'heartRate': deque(maxlen=self.max_points),
-                'spo2': deque(maxlen=self.max_points),
-                'GSR': deque(maxlen=self.max_points),
-                'stress': deque(maxlen=self.max_points),
-            },
-            'environmental_sensors': {
-                'timestamps': deque(maxlen=self.max_points),
-                'temperature': deque(maxlen=self.max_points),
-                'humidity': deque(maxlen=self.max_points),
-            },
-            'gps_data': {
-                'timestamps': deque(maxlen=self.max_points),
-                'lat': deque(maxlen=self.max_points),
-                'lon': deque(maxlen=self.max_points),
-                'alt': deque(maxlen=self.max_points),
-                'sat': deque(maxlen=self.max_points),
-                'latest': None  # None means no data received yet
-            },
-            'has_data': False  # Track if any data has been received for this node
-        }
-    
+    def close(self):
+        """Release reordered readings, write a final state snapshot and flush pending writes to the
+        series store and PostgreSQL sink (if any)"""
+        if self.reorder is not None:
+            self.reorder.stop()
+        if self.snapshots is not None:
+            self.snapshots.stop()
+        if self.store is not None:
+            self.store.stop()
+        if self.pg_sink is not None:
+            self.pg_sink.stop()
+        if self.segments is not None:
+            self.segments.close()
+
+    def nodes_for_route(self, route, topic):
+        """Node IDs a routed sensor topic feeds (per-helmet topics name the node themselves)"""
+        return route_nodes(route, topic)
+
     def add_gas_data(self, data, node_id=None, topic=None):
         """Add new sensor data point to global storage and per-node storage if node_id provided"""
-        with self.lock:
-            timestamp = datetime.now()
-            
+        self.add_gas_batch([(topic, data)], node_id=node_id)
+
+    def add_gas_batch(self, records, node_id=None):
+        """Add many sensor readings, taking each node's lock once per batch.
+
+        records: iterable of (topic, data) or (topic, data, timestamp) tuples, where data
+        is a payload dict or an already-decoded SensorReading and timestamp is epoch seconds
+        (a datetime is accepted; default: now). Readings are grouped by
+        node and appended per channel in bulk. If node_id is given it
+        overrides the topic mapping for every record (useful for replaying one node).
+        In event-time mode payload dicts use their own `timestamp`, and each node's readings
+        pass through the reorder buffer: only those behind its watermark are appended now.
+        Returns the number of readings accepted.
+        """
+        now = epoch_now()
+        entries = []
+        for record in records:
+            topic, data = record[0], record[1]
+            timestamp = as_epoch(record[2], now) if len(record) > 2 else now
+
             # If topic is provided, map it to node_id(s)
-            node_ids = []
-            if topic and not node_id:
-                mapped = self.TOPIC_TO_NODE_MAP.get(topic, [])
-                node_ids = mapped if isinstance(mapped, list) else [mapped]
-            elif node_id:
-                node_ids = [node_id]
-            
+            if node_id:
+                node_ids = (node_id,)
+            elif topic:
+                node_ids = self.nodes_for_route(self.topic_router.route(topic), topic)
+            else:
+                node_ids = ()
+
             # Validate that we have valid node_ids from topic mapping
             if not node_ids:
-                logging.info(f"⛔ Sensor data BLOCKED - No valid node mapping for topic {topic}")
-                return  # Exit early if no valid nodes
-            
-            logging.info(f"✅ Sensor data processing for nodes: {node_ids} from topic {topic}")
-            
-            # Safe numeric casting helpers (handle strings from publishers)
-            def _to_float(v, default=0.0):
-                try:
-                    if v is None or (isinstance(v, str) and not v.strip()):
-                        return default
-                    return float(v)
-                except Exception:
-                    return default
+                hot_log.info('store.blocked', "⛔ Sensor data BLOCKED - No valid node mapping for topic %s", topic)
+                continue
+
+            row = data if isinstance(data, SensorReading) else reading_from_dict(data, timestamp, self.event_time)
+            entries.append((row, node_ids, topic))
+
+        # Drop QoS1 redeliveries and multi-topic echoes before taking the store lock
+        if self.deduplicator.enabled:
+            # (in event-time mode equal values with different device timestamps are distinct readings)
+            entries = self.deduplicator.filter_batch(entries, event_dedupe_key if self.event_time else dedupe_key)
+
+        all_rows = []
+        rows_by_node = {}
+        node_info = {}
+        for row, node_ids, _ in entries:
+            all_rows.append(row)
+            for nid in node_ids:
+                rows_by_node.setdefault(nid, []).append(row)
+                if nid not in node_info and (row[16] or row[17]):
+                    zone = row[17].upper().replace(' ', '_') if row[17] else None
+                    node_info[nid] = (row[16], zone)
+
+        if not all_rows:
+            return 0
+
+        # Add to per-node data for all mapped nodes (registering new ones); each node
+        # is written under its own stripe, so readers of other nodes are not blocked
+        for nid, rows in rows_by_node.items():
+            if nid not in self.per_node_data:
+                name, zone = node_info.get(nid, (None, None))
+                hot_log.info('store.new_node', "🆕 Registered node %s (%s)", nid, name or 'unnamed')
+            else:
+                name = zone = None
+            node_storage = self.per_node_data.series_for(nid, name=name, zone=zone)
+            if self.reorder is None:
+                epochs = [row[0] for row in rows]
+                self._append_node_rows(node_storage, nid, rows, epochs)
+            else:
+                with self.per_node_data.lock_for(nid):
+                    floor = node_storage['series'].last_timestamp()
+                    rows, late = self.reorder.push(nid, rows, now, floor)
+                    epochs = [row[0] for row in rows]
+                    if rows:
+                        self._append_locked(node_storage, rows, epochs)
+                if late:
+                    self._store_late(nid, late)
+                if not rows:
+                    continue
+            self._persist_rows(nid, rows, epochs)
+        evicted = self.per_node_data.maybe_evict()
+
+        if evicted:
+            self.deduplicator.forget(evicted)
+            if self.reorder is not None:
+                self.reorder.forget(evicted)
+            logging.info(f"🧹 Evicted {len(evicted)} idle node(s): {', '.join(evicted[:10])}")
+
+        for nid, rows in rows_by_node.items():
+            hot_log.count('readings', nid, len(rows))
+        last = all_rows[-1]
+        hot_log.info(
+            'store.updated',
+            "Sensor data updated (%d reading(s), nodes=%s): "
+            "Gas=%.2f, CH4=%.2f, Propane=%.2f, Butane=%.2f, H2=%.2f; "
+            "GPS=(%.6f,%.6f) Alt=%.1f Sat=%s; Health=HR:%s, SpO2:%s Temp:%s Hum:%s",
+            len(all_rows), list(rows_by_node), last[1], last[2], last[3], last[4], last[5],
+            last[12], last[13], last[14], last[15], last[6], last[7], last[10], last[11],
+        )
+        return len(all_rows)
+
+    def _append_node_rows(self, node_storage, nid, rows, epochs, derived=True):
+        """Append rows to a node's series (and rollups / compressed history) under the node's stripe lock"""
+        with self.per_node_data.lock_for(nid):
+            self._append_locked(node_storage, rows, epochs, derived)
+
+    def _append_locked(self, node_storage, rows, epochs, derived=True):
+        """_append_node_rows for a caller already holding the node's stripe lock"""
+        node_storage['series'].append_rows(rows, epochs)
+        if derived:
+            self._append_derived(node_storage, rows, epochs)
+        node_storage['has_data'] = True  # Mark that this node has received data
+
+    def _persist_rows(self, nid, rows, epochs):
+        """Hand appended rows to the SQLite store, PostgreSQL sink and segment files (if enabled)"""
+        if self.store is not None:
+            self.store.write_readings(nid, rows, epochs)
+        if self.pg_sink is not None:
+            self.pg_sink.write_readings(nid, rows, epochs)
+        if self.segments is not None:
+            self.segments.append(nid, rows, epochs)
+
+    def _store_late(self, nid, rows):
+        """Side channel for readings that arrived behind their node's watermark.
+
+        They stay out of the series, rollups, compressed history and segment files (all
+        append in time order) and are kept by the reorder buffer for /late_readings; the
+        SQLite / PostgreSQL history sorts by time, so they are still written there."""
+        epochs = [row[0] for row in rows]
+        if self.store is not None:
+            self.store.write_readings(nid, rows, epochs)
+        if self.pg_sink is not None:
+            self.pg_sink.write_readings(nid, rows, epochs)
+        hot_log.count('late', nid, len(rows))
+        hot_log.warning('reorder.late', "⏰ %d late reading(s) for node %s kept out of the live series (oldest %s)",
+                        len(rows), nid, format_clock(min(epochs)))
+        for row in rows:
+            if reading_in_alarm(row):
+                logging.warning(f"🚨 Late reading in alarm range for node {nid} at {format_clock(row[0])} "
+                                f"(not shown live; see /late_readings?node={nid})")
+
+    def flush_reorder(self, idle_for=None):
+        """Release the buffered readings of nodes that went quiet (reorder flusher thread; 0 releases all)"""
+        for nid in self.reorder.pending_nodes(idle_for):
+            node_storage = self.per_node_data.series_for(nid)
+            with self.per_node_data.lock_for(nid):
+                rows = self.reorder.drain(nid)
+                epochs = [row[0] for row in rows]
+                if rows:
+                    self._append_locked(node_storage, rows, epochs)
+            if rows:
+                self._persist_rows(nid, rows, epochs)
+
+    def late_readings(self, node_id):
+        """Readings of a node that arrived too late for the live series (event-time mode)"""
+        if self.reorder is None:
+            return []
+        out = []
+        for row in self.reorder.late(node_id):
+            reading = row._asdict()
+            del reading['present']
+            out.append(reading)
+        return out
+
+    def _append_derived(self, node_storage, rows, epochs):
+        """Feed rollups and compressed history (caller holds the node's lock)"""
+        # Shift-long history: 10 s / 1 min / 15 min min-max-mean buckets (ROLLUP_TIERS)
+        if self.rollup_tiers:
+            self._rollups_for(node_storage).add_rows(rows, epochs)
+        if self.history_max_bytes > 0:
+            history = node_storage.get('history')
+            if history is None:
+                history = node_storage['history'] = CompressedHistory(self.history_block_size, self.history_max_bytes)
+            history.append_rows(rows, epochs)
+
+    def history_stats(self):
+        """Compressed history totals across nodes (readings, bytes, compression ratio)"""
+        readings = nbytes = 0
+        for node_storage in self.per_node_data.nodes():
+            history = node_storage.get('history')
+            if history is not None:
+                readings += len(history)
+                nbytes += history.nbytes
+        return {
+            'readings': readings,
+            'bytes': nbytes,
+            'compression_ratio': readings * 8 * len(CHANNELS) / nbytes if nbytes else 0.0,
+            'block_size': self.history_block_size,
+            'max_bytes_per_node': self.history_max_bytes,
+        }
 
-            def _to_int(v, default=0):
-                try:
-                    if v is None or (isinstance(v, str) and not v.strip()):
-                        return default
-                    return int(float(v))
-                except Exception:
-                    return default
-
-            # Extract sensor values
-            lpg = _to_float(data.get('LPG', 0.0), 0.0)
-            ch4 = _to_float(data.get('CH4', 0.0), 0.0)
-            propane = _to_float(data.get('Propane', 0.0), 0.0)
-            butane = _to_float(data.get('Butane', 0.0), 0.0)
-            h2 = _to_float(data.get('H2', 0.0), 0.0)
-            heartRate = _to_int(data.get('heartRate', -1), -1)
-            spo2 = _to_float(data.get('spo2', -1), -1)
-            gsr = _to_float(data.get('GSR', 0.0), 0.0)
-            stress = _to_int(data.get('stress', 0), 0)
-            temperature = _to_float(data.get('temperature', -1.0), -1.0)
-            humidity = _to_float(data.get('humidity', -1.0), -1.0)
-            lat = _to_float(data.get('lat', 0.0), 0.0)
-            lon = _to_float(data.get('lon', 0.0), 0.0)
-            alt = _to_float(data.get('alt', 0.0), 0.0)
-            sat = _to_int(data.get('sat', 0), 0)
-            
-            # Extract metadata
-            person_name = data.get('name') or data.get('person') or data.get('user')
-            station_id_msg = data.get('station_id')
-            zone_from_msg = data.get('zone')
-            derived_zone = None
-            try:
-                if isinstance(station_id_msg, str) and station_id_msg:
-                    derived_zone = f"Zone {station_id_msg[0].upper()}"
-            except Exception:
-                derived_zone = None
+    def retention_stats(self):
+        """Configured retention and the effective window of every node with data"""
+        windows = {}
+        for node_storage in self.per_node_data.nodes():
+            series = node_storage['series']
+            if series is not None and len(series):
+                with self.per_node_data.lock_for(node_storage['id']):
+                    windows[node_storage['id']] = series.window()
+        return {
+            'retention_s': self.retention.seconds,
+            'channel_retention_s': dict(self.retention.per_channel),
+            'max_bytes_per_node': self.retention.max_bytes,
+            'max_points_per_node': self.retention.max_points,
+            'nodes': windows,
+        }
 
-            zone_label = zone_from_msg or derived_zone
-            
-            # Helper function to append data to a data dict
-            def _append_to_data_dict(data_dict):
-                data_dict['gas_sensors']['timestamps'].append(timestamp)
-                data_dict['gas_sensors']['LPG'].append(lpg)
-                data_dict['gas_sensors']['CH4'].append(ch4)
-                data_dict['gas_sensors']['Propane'].append(propane)
-                data_dict['gas_sensors']['Butane'].append(butane)
-                data_dict['gas_sensors']['H2'].append(h2)
-                
-                data_dict['health_sensors']['timestamps'].append(timestamp)
-                data_dict['health_sensors']['heartRate'].append(heartRate if heartRate != -1 else None)
-                data_dict['health_sensors']['spo2'].append(spo2 if spo2 != -1 else None)
-                data_dict['health_sensors']['GSR'].append(gsr)
-                data_dict['health_sensors']['stress'].append(stress)
-                
-                data_dict['environmental_sensors']['timestamps'].append(timestamp)
-                data_dict['environmental_sensors']['temperature'].append(temperature if temperature != -1.0 else None)
-                data_dict['environmental_sensors']['humidity'].append(humidity if humidity != -1.0 else None)
-                
-                data_dict['gps_data']['timestamps'].append(timestamp)
-                data_dict['gps_data']['lat'].append(lat)
-                data_dict['gps_data']['lon'].append(lon)
-                data_dict['gps_data']['alt'].append(alt)
-                data_dict['gps_data']['sat'].append(sat)
-                
-                # Update latest values
-                data_dict['gas_sensors']['latest'] = {
-                    'LPG': lpg, 'CH4': ch4, 'Propane': propane, 'Butane': butane, 'H2': h2,
-                    'heartRate': heartRate, 'spo2': spo2, 'temperature': temperature, 'humidity': humidity,
-                    'GSR': gsr, 'stress': stress, 'lat': lat, 'lon': lon, 'alt': alt, 'sat': sat,
-                    'name': person_name, 'zone': zone_label, 'timestamp': timestamp
-                }
-                
-                data_dict['gps_data']['latest'] = {
-                    'lat': lat, 'lon': lon, 'alt': alt, 'sat': sat
-                }
-            
-            # Add to global data (for backward compatibility with TRISHALA node)
-            _append_to_data_dict(self.data)
-            
-            # Add to per-node data for all mapped nodes
-            for nid in node_ids:
-                if nid in self.per_node_data:
-                    _append_to_data_dict(self.per_node_data[nid])
-                    self.per_node_data[nid]['has_data'] = True  # Mark that this node has received data
-                    logging.info(f"✅ Data added for node {nid} from topic {topic}: CH4={ch4:.2f}, LPG={lpg:.2f}, has_data={self.per_node_data[nid]['has_data']}")
-                else:
-                    logging.warning(f"❌ Unknown node_id: {nid}")
-            
-            try:
-                logging.info(
-                    f"Sensor data updated: Gas={lpg:.2f}, CH4={ch4:.2f}, Propane={propane:.2f}, Butane={butane:.2f}, H2={h2:.2f}; "
-                    f"GPS=({lat:.6f},{lon:.6f}) Alt={alt:.1f} Sat={sat}; Health=HR:{heartRate}, SpO2:{spo2} Temp:{temperature} Hum:{humidity}"
-                )
-            except Exception:
-                logging.info("Sensor data updated (logging suppressed due to formatting error)")
+    def _rollups_for(self, node_storage):
+        rollups = node_storage.get('rollups')
+        if rollups is None:
+            rollups = node_storage['rollups'] = NodeRollups(self.rollup_tiers)
+        return rollups
+
+    def restore_from_store(self, restored=None, snapshot_time=None):
+        """Rehydrate series, rollups and RFID checkpoint state from the SQLite store (startup only).
+
+        Each node gets the readings inside its retention window (measured from its newest stored
+        reading, at most the per-node cap) in one bulk append; rollups and compressed
+        history are rebuilt from the readings inside the longest tier's retention; the RFID state
+        is loaded from the last checkpoint and the events after it are replayed in order. Nodes in `restored` ({node: newest epoch} from a state snapshot) only
+        get the readings after that, and only RFID events after snapshot_time are replayed."""
+        start = time.perf_counter()
+        now = epoch_now()
+        restored = restored or {}
+        retention = max((bucket_s * capacity for bucket_s, capacity in self.rollup_tiers), default=0)
+        readings = 0
+        nodes = self.store.nodes()
+        for nid, name, zone, last_ts in nodes:
+            if nid in restored:
+                readings += self._replay_after(nid, restored[nid], last_ts)
+                continue
+            since = last_ts - self.retention.longest if last_ts else None
+            rows, epochs = self.store.load_tail(nid, self.retention.max_points, since)
+            if not rows:
+                continue
+            zone = zone.upper().replace(' ', '_') if zone else None
+            node_storage = self.per_node_data.series_for(nid, name=name, zone=zone)
+            node_storage['last_seen'] = time.monotonic() - max(0.0, now - (last_ts or now))
+            self._append_node_rows(node_storage, nid, rows, epochs, derived=not retention)
+            if retention:
+                with self.per_node_data.lock_for(nid):
+                    for chunk, chunk_epochs in self.store.iter_range(nid, now - retention):
+                        self._append_derived(node_storage, chunk, chunk_epochs)
+            readings += len(rows)
+
+        # Events older than the last RFID checkpoint are gone from the store; start from the
+        # checkpoint unless the warm-restart snapshot is newer
+        checkpoint = self.store.load_rfid_checkpoint()
+        if checkpoint is not None and (snapshot_time is None or checkpoint[0] >= snapshot_time):
+            with self.rfid_lock:
+                self._restore_rfid(checkpoint[1])
+            events = self.store.load_rfid_events()
+        else:
+            events = self.store.load_rfid_events(since=snapshot_time)
+        with self.rfid_lock:
+            for timestamp, kind, payload in events:
+                if kind == 'scan':
+                    self._apply_rfid_scan(payload, timestamp)
+                elif kind == 'reset':
+                    self._reset_checkpoint_progress(payload.get('node_id'), payload.get('tag_id'))
+        elapsed = time.perf_counter() - start
+        self.store.record_replay(len(nodes), readings, len(events), elapsed)
+        logging.info(f"💾 Restored {readings} reading(s) for {len(nodes)} node(s) and {len(events)} RFID event(s) "
+                     f"from {self.store.path} in {elapsed:.2f}s")
+
+    def _replay_after(self, nid, newest, last_ts):
+        """Append a snapshot-restored node's stored readings newer than `newest` (series and derived)"""
+        if newest is not None and (last_ts is None or last_ts <= newest):
+            return 0
+        node_storage = self.per_node_data.series_for(nid)
+        count = 0
+        for rows, epochs in self.store.iter_range(nid, newest if newest is not None else 0.0):
+            if newest is not None and epochs[0] <= newest:
+                picked = [i for i, t in enumerate(epochs) if t > newest]
+                rows, epochs = [rows[i] for i in picked], [epochs[i] for i in picked]
+            if rows:
+                self._append_node_rows(node_storage, nid, rows, epochs)
+                count += len(rows)
+        return count
+
+    def capture_state(self):
+        """Copy of the in-memory state for a warm-restart snapshot.
+
+        Each node is copied under its own stripe lock and the RFID state under rfid_lock,
+        so ingest is only held up for one node's copy at a time."""
+        nodes = []
+        for node_storage in self.per_node_data.nodes():
+            nid = node_storage['id']
+            entry = {
+                'id': nid, 'name': node_storage['name'], 'zone': node_storage['zone'],
+                'pinned': node_storage['pinned'], 'has_data': node_storage['has_data'],
+                'idle_s': time.monotonic() - node_storage['last_seen'],
+            }
+            series, rollups, history = node_storage['series'], node_storage.get('rollups'), node_storage.get('history')
+            with self.per_node_data.lock_for(nid):
+                entry['series'] = series.state() if series is not None else None
+                entry['rollups'] = rollups.state() if rollups is not None else None
+                entry['history'] = history.state() if history is not None else None
+            nodes.append(entry)
+
+        with self.rfid_lock:
+            # Scans stamped after this were applied after the copy (add_rfid_batch stamps under the lock)
+            captured = epoch_now()
+            rfid = self._capture_rfid()
+        return {'captured': captured, 'nodes': nodes, 'rfid': rfid}
+
+    def _capture_rfid(self):
+        """Copy of the RFID checkpoint state (caller holds rfid_lock)"""
+        checkpoints = self.data['rfid_checkpoints']
+        return {
+            'timestamps': deque(checkpoints['timestamps'], maxlen=checkpoints['timestamps'].maxlen),
+            'uid_scans': deque((dict(scan) for scan in checkpoints['uid_scans']), maxlen=checkpoints['uid_scans'].maxlen),
+            'latest_tag': checkpoints['latest_tag'],
+            'latest_station': checkpoints['latest_station'],
+            'latest_name': checkpoints.get('latest_name'),
+            'checkpoint_progress': {node: dict(p) for node, p in checkpoints['checkpoint_progress'].items()},
+            'tag_scan_counts': dict(self._rfid_tag_scan_counts),
+            'last_scan_time': dict(self._last_scan_time),
+            'last_tag_time': dict(self._last_tag_time),
+            'tag_last_index': dict(self._rfid_tag_last_index),
+            'tag_direction': dict(self._rfid_tag_direction),
+        }
+
+    def _restore_rfid(self, rfid):
+        """Load a _capture_rfid() copy (caller holds rfid_lock)"""
+        checkpoints = self.data['rfid_checkpoints']
+        for key in ('timestamps', 'uid_scans'):
+            checkpoints[key] = deque(rfid[key], maxlen=checkpoints[key].maxlen)
+        for key in ('latest_tag', 'latest_station', 'latest_name', 'checkpoint_progress'):
+            checkpoints[key] = rfid[key]
+        self._rfid_tag_scan_counts = rfid['tag_scan_counts']
+        self._last_scan_time = rfid['last_scan_time']
+        self._last_tag_time = rfid['last_tag_time']
+        self._rfid_tag_last_index = rfid['tag_last_index']
+        self._rfid_tag_direction = rfid['tag_direction']
+
+    def _stored_rfid_event(self, kind, timestamp, payload):
+        """Persist one applied RFID event, checkpointing the RFID state every
+        store.rfid_checkpoint_every events (caller holds rfid_lock)"""
+        self.store.write_rfid(kind, timestamp, payload)
+        every = self.store.rfid_checkpoint_every
+        if every:
+            self._rfid_since_checkpoint += 1
+            if self._rfid_since_checkpoint >= every:
+                self._rfid_since_checkpoint = 0
+                self.store.write_rfid_checkpoint(epoch_now(), self._capture_rfid())
+
+    def restore_state(self, state):
+        """Load a capture_state() copy (startup only); returns ({node: newest epoch}, capture time)"""
+        start = time.perf_counter()
+        restored = {}
+        for entry in state['nodes']:
+            nid = entry['id']
+            node_storage = self.per_node_data.register(nid, name=entry['name'], zone=entry['zone'],
+                                                       pinned=entry['pinned'])
+            if entry['series'] is None:
+                continue
+            node_storage = self.per_node_data.series_for(nid)
+            with self.per_node_data.lock_for(nid):
+                node_storage['series'].restore(entry['series'])
+                if entry['rollups'] is not None and self.rollup_tiers:
+                    if not self._rollups_for(node_storage).restore(entry['rollups']):
+                        logging.warning(f"⚠ Snapshot rollups for {nid} use other ROLLUP_TIERS; rebuilding from new data")
+                if entry['history'] is not None and self.history_max_bytes > 0:
+                    history = node_storage['history'] = CompressedHistory(self.history_block_size, self.history_max_bytes)
+                    history.restore(entry['history'])
+            node_storage['has_data'] = entry['has_data']
+            node_storage['last_seen'] = time.monotonic() - entry['idle_s']
+            restored[nid] = entry['series']['newest']
+
+        with self.rfid_lock:
+            self._restore_rfid(state['rfid'])
+
+        elapsed = time.perf_counter() - start
+        self.snapshots.record_load(elapsed * 1000.0)
+        logging.info(f"📸 Restored {len(state['nodes'])} node(s) from state snapshot {self.snapshots.path} "
+                     f"in {elapsed:.2f}s")
+        return restored, state['captured']
+
+    # Defaults reported by the global getters before any reading arrives
+    _EMPTY_SERIES = NodeSeries(0)
+    _FLEET_GAS_LATEST = {'LPG': 0, 'CH4': 0, 'Propane': 0, 'Butane': 0, 'H2': 0, 'timestamp': None}
+    _FLEET_GPS_LATEST = {'lat': 0.0, 'lon': 0.0, 'alt': 0.0, 'sat': 0}
+
+    def get_series_snapshot(self, node_id=None, channels=CHANNELS):
+        """Immutable, versioned snapshot of some channels of a node's (or the fleet) series.
+
+        Unchanged snapshots are shared between callers without taking any lock; a new copy
+        is made under the node's lock only after ingest has appended to the series. The fleet
+        snapshot is merged from the node snapshots, again only after one of them changed."""
+        if node_id is None:
+            return self.fleet.snapshot(channels)
+        node_storage = self.per_node_data.get(node_id)
+        if node_storage is None or node_storage['series'] is None:
+            return self._EMPTY_SERIES.snapshot(channels)  # Return empty if node not found
+        series, lock = node_storage['series'], self.per_node_data.lock_for(node_id)
+        snapshot = series.cached_snapshot(channels)
+        if snapshot is None:
+            with lock:
+                snapshot = series.snapshot(channels)
+        return snapshot
+
+    def get_history(self, node_id, channel, span_s, width_px=600):
+        """One channel over the last span_s seconds at a resolution that fits width_px.
+
+        Uses the raw series, then the compressed history, when either covers the span with at
+        most width_px points; otherwise the finest rollup tier with about one bucket per pixel.
+        Returns {'tier', 'timestamps', 'mean', 'min', 'max', 'count'} with datetime timestamps
+        (raw: mean = min = max)."""
+        snapshot = self.get_series_snapshot(node_id, ('ts', channel))
+        now = epoch_now()
+        since = now - span_s
+        node_storage = self.per_node_data.get(node_id) if node_id else None
+        rollups = node_storage.get('rollups') if node_storage else None
+        history = node_storage.get('history') if node_storage else None
+
+        ts = snapshot.times(channel)
+        covers_span = len(snapshot) > 0 and ts[0] <= since
+        raw = None
+        if rollups is None or (covers_span and len(snapshot) <= width_px):
+            raw = zip(ts.tolist(), snapshot.column(channel).tolist())
+        elif history is not None and len(history):
+            with self.per_node_data.lock_for(node_id):
+                first = history.first_timestamp
+                expected = len(history) * span_s / max(now - first, 1.0)
+                if first <= since and expected <= width_px:
+                    found = history.read((channel,), since)
+                    raw = zip(found['ts'], found[channel])
+        if raw is not None:
+            raw = [(t, v) for t, v in raw if t >= since and v == v]
+            return {
+                'tier': 'raw',
+                'timestamps': [datetime.fromtimestamp(t) for t, _ in raw],
+                'mean': [v for _, v in raw], 'min': [v for _, v in raw], 'max': [v for _, v in raw],
+                'count': [1] * len(raw),
+            }
+
+        with self.per_node_data.lock_for(node_id):
+            tier = rollups.pick_tier(span_s, width_px)
+            history = tier.query(channel, since - since % tier.bucket_s)
+        history['tier'] = tier.label
+        history['timestamps'] = [datetime.fromtimestamp(t) for t in history['timestamps']]
+        return history
+
+    def _get_section(self, node_id, section):
+        """Legacy dict-of-lists view of one section, built from a series snapshot"""
+        snapshot = self.get_series_snapshot(node_id, ('ts',) + SECTIONS[section])
+        data = snapshot.section(section)
+        if section == 'gas_sensors':
+            data['latest'] = snapshot.latest if node_id or snapshot.latest else dict(self._FLEET_GAS_LATEST)
+        elif section == 'gps_data':
+            data['latest'] = snapshot.gps_latest if node_id or snapshot.gps_latest else dict(self._FLEET_GPS_LATEST)
+        return data
 
-    
     def get_gas_data(self):
         """Get gas sensor data for plotting"""
-        with self.lock:
-            return self.data['gas_sensors'].copy()
+        return self._get_section(None, 'gas_sensors')
     
     def get_gas_data_for_node(self, node_id):
         """Get gas sensor data for a specific node"""
-        with self.lock:
-            if node_id in self.per_node_data:
-                return self.per_node_data[node_id]['gas_sensors'].copy()
-            return self._create_empty_node_data()['gas_sensors'].copy()  # Return empty if node not found
+        return self._get_section(node_id, 'gas_sensors')
     
     def get_health_data(self):
         """Get health sensor data for plotting"""
-        with self.lock:
-            return self.data['health_sensors'].copy()
+        return self._get_section(None, 'health_sensors')
     
     def get_health_data_for_node(self, node_id):
         """Get health sensor data for a specific node"""
-        with self.lock:
-            if node_id in self.per_node_data:
-                return self.per_node_data[node_id]['health_sensors'].copy()
-            return self._create_empty_node_data()['health_sensors'].copy()  # Return empty if node not found
+        return self._get_section(node_id, 'health_sensors')
     
     def get_environmental_data(self):
         """Get environmental sensor data for plotting"""
-        with self.lock:
-            return self.data['environmental_sensors'].copy()
+        return self._get_section(None, 'environmental_sensors')
     
     def get_environmental_data_for_node(self, node_id):
         """Get environmental sensor data for a specific node"""
-        with self.lock:
-            if node_id in self.per_node_data:
-                return self.per_node_data[node_id]['environmental_sensors'].copy()
-            return self._create_empty_node_data()['environmental_sensors'].copy()  # Return empty if node not found
+        return self._get_section(node_id, 'environmental_sensors')
     
     def get_gps_data(self):
         """Get GPS data for mapping"""
-        with self.lock:
-            return self.data['gps_data'].copy()
+        return self._get_section(None, 'gps_data')
     
     def get_gps_data_for_node(self, node_id):
         """Get GPS data for a specific node"""
-        with self.lock:
-            if node_id in self.per_node_data:
-                return self.per_node_data[node_id]['gps_data'].copy()
-            return self._create_empty_node_data()['gps_data'].copy()  # Return empty if node not found
+        return self._get_section(node_id, 'gps_data')
     
     def add_rfid_data(self, rfid_data):
         """Add new RFID checkpoint data"""
-        with self.lock:
-            timestamp = datetime.now()
-            
-            # Extract data from new RFID format: {"station_id": "A1", "tag_id": "TAG123"}
-            station_id = rfid_data.get('station_id', '')
-            tag_id = rfid_data.get('tag_id', '')
-            logging.info(f"Processing RFID data: tag_id={tag_id}, station_id={station_id}")
-            
-            # FILTER: Tag 0AC909B0 from station A1 must ONLY show on TRISHALA node (93BA302D)
-            if tag_id == '0AC909B0' and station_id == 'A1':
-                # Only allow this tag to process on TRISHALA node
-                logging.info(f"Restricted tag {tag_id} from {station_id} detected - will only display on TRISHALA node (93BA302D)")
-                # We'll filter it to only assign to TRISHALA node later
-            
-            try:
-                tag_lc = tag_id.lower() if isinstance(tag_id, str) else ''
-            except Exception:
-                tag_lc = ''
+        self.add_rfid_batch([rfid_data])
+
+    def add_rfid_batch(self, records):
+        """Apply many RFID scans under a single lock acquisition.
+
+        records: iterable of scan dicts or (scan_dict, timestamp) tuples. Scans are applied
+        in order because checkpoint progression depends on the previous scan of each tag.
+        Returns the number of scans applied.
+        """
+        count = 0
+        with self.rfid_lock:
+            now = epoch_now()
+            for record in records:
+                if isinstance(record, dict):
+                    rfid_data, timestamp = record, now
+                else:
+                    rfid_data, timestamp = record[0], as_epoch(record[1], now)
+                self._apply_rfid_scan(rfid_data, timestamp)
+                if self.store is not None:
+                    self._stored_rfid_event('scan', timestamp, rfid_data)
+                if self.pg_sink is not None:
+                    self.pg_sink.write_rfid('scan', timestamp, rfid_data)
+                count += 1
+        return count
+
+    def _apply_rfid_scan(self, rfid_data, timestamp):
+        """Update RFID checkpoint state for one scan (caller holds rfid_lock)"""
+        # Extract data from new RFID format: {"station_id": "A1", "tag_id": "TAG123"}
+        station_id = rfid_data.get('station_id', '')
+        tag_id = rfid_data.get('tag_id', '')
+        logging.info(f"Processing RFID data: tag_id={tag_id}, station_id={station_id}")
+        
+        # FILTER: Tag 0AC909B0 from station A1 must ONLY show on TRISHALA node (93BA302D)
+        if tag_id == '0AC909B0' and station_id == 'A1':
+            # Only allow this tag to process on TRISHALA node
+            logging.info(f"Restricted tag {tag_id} from {station_id} detected - will only display on TRISHALA node (93BA302D)")
+            # We'll filter it to only assign to TRISHALA node later
+        
+        try:
+            tag_lc = tag_id.lower() if isinstance(tag_id, str) else ''
+        except Exception:
+            tag_lc = ''
 
-            # SPECIAL CASE: If tag 93BA302D arrives with name LOKESH, treat it as Lokesh node (C7761005)
-            # and do NOT update any other node's checkpoint status.
-            try:
-                rfid_name = rfid_data.get('name') if isinstance(rfid_data, dict) else None
-            except Exception:
-                rfid_name = None
-            if tag_lc == '93ba302d' and isinstance(rfid_name, str) and rfid_name.strip().upper() == 'LOKESH':
-                logging.info("RFID tag 93BA302D labeled LOKESH detected - mapping to Lokesh node (C7761005) only")
-                tag_lc = 'c7761005'
-            
-            # TEMPORARILY DISABLE DEBOUNCING TO DEBUG
-            # # DEBOUNCING: Ignore duplicate scans within 3 seconds
-            # scan_key = (tag_id, station_id)
-            # if scan_key in self._last_scan_time:
-            #     time_since_last = (timestamp - self._last_scan_time[scan_key]).total_seconds()
-            #     if time_since_last < 3.0:  # 3 second debounce window
-            #         logging.info(f"RFID scan ignored (debounce): {tag_id} at {station_id} (last scan {time_since_last:.1f}s ago)")
-            #         return
-            # # Global per-tag debounce (regardless of station)
-            # if tag_id in self._last_tag_time:
-            #     time_since_tag = (timestamp - self._last_tag_time[tag_id]).total_seconds()
-            #     if time_since_tag < 3.0:
-            #         logging.info(f"RFID scan ignored (per-tag debounce): {tag_id} ({time_since_tag:.1f}s since last)")
-            #         return
-            
-            # Update last scan time
-            scan_key = (tag_id, station_id)
-            self._last_scan_time[scan_key] = timestamp
-            self._last_tag_time[tag_id] = timestamp
-            
-            # Map station_id to node_id and checkpoint (you can customize this mapping)
-            # Station format examples: A1, A2, B1, B2, etc.
-            zone = station_id[0] if station_id else ''  # Extract zone letter (A, B, C)
-            station_num = station_id[1:] if len(station_id) > 1 else '1'  # Extract station number
-            
-            # Map zones to node IDs
-            # Use the 4 primary nodes for every zone (A/B/C) so station numbers map to these nodes
-            zone_nodes = {
-                'A': ['C7761005', '93BA302D', '7AA81505', 'DB970104'],
-                'B': ['C7761005', '93BA302D', '7AA81505', 'DB970104'],
-                'C': ['C7761005', '93BA302D', '7AA81505', 'DB970104']
-            }
+        # SPECIAL CASE: If tag 93BA302D arrives with name LOKESH, treat it as Lokesh node (C7761005)
+        # and do NOT update any other node's checkpoint status.
+        try:
+            rfid_name = rfid_data.get('name') if isinstance(rfid_data, dict) else None
+        except Exception:
+            rfid_name = None
+        if tag_lc == '93ba302d' and isinstance(rfid_name, str) and rfid_name.strip().upper() == 'LOKESH':
+            logging.info("RFID tag 93BA302D labeled LOKESH detected - mapping to Lokesh node (C7761005) only")
+            tag_lc = 'c7761005'
+        
+        # TEMPORARILY DISABLE DEBOUNCING TO DEBUG
+        # # DEBOUNCING: Ignore duplicate scans within 3 seconds
+        # scan_key = (tag_id, station_id)
+        # if scan_key in self._last_scan_time:
+        #     time_since_last = timestamp - self._last_scan_time[scan_key]
+        #     if time_since_last < 3.0:  # 3 second debounce window
+        #         logging.info(f"RFID scan ignored (debounce): {tag_id} at {station_id} (last scan {time_since_last:.1f}s ago)")
+        #         return
+        # # Global per-tag debounce (regardless of station)
+        # if tag_id in self._last_tag_time:
+        #     time_since_tag = timestamp - self._last_tag_time[tag_id]
+        #     if time_since_tag < 3.0:
+        #         logging.info(f"RFID scan ignored (per-tag debounce): {tag_id} ({time_since_tag:.1f}s since last)")
+        #         return
+        
+        # Update last scan time
+        scan_key = (tag_id, station_id)
+        self._last_scan_time[scan_key] = timestamp
+        self._last_tag_time[tag_id] = timestamp
+        
+        # Map station_id to node_id and checkpoint (you can customize this mapping)
+        # Station format examples: A1, A2, B1, B2, etc.
+        zone = station_id[0] if station_id else ''  # Extract zone letter (A, B, C)
+        station_num = station_id[1:] if len(station_id) > 1 else '1'  # Extract station number
+        
+        # Map the scan to a node: tags that are registered node IDs belong to that node;
+        # other tags fall back to the zone's configured nodes by station number
+        registered = self.per_node_data.get(tag_id.upper()) if isinstance(tag_id, str) else None
+        zone_nodes = [n['id'] for n in self.per_node_data.nodes(f"ZONE_{zone.upper()}") if n['pinned']] if zone else []
+        if registered is not None:
+            node_id = registered['id']
+        elif zone_nodes and station_num.isdigit():
+            node_id = zone_nodes[(int(station_num) - 1) % len(zone_nodes)]
+        else:
+            node_id = station_id  # Fallback to station_id if no mapping
+        
+        # FILTER OVERRIDE: Tag 0AC909B0 from station A1 must ONLY show on TRISHALA node
+        if tag_id == '0AC909B0' and station_id == 'A1':
+            node_id = '93BA302D'  # Force to TRISHALA node only
+            logging.info(f"Tag {tag_id} from {station_id} filtered to TRISHALA node (93BA302D)")
+        
+        # ENFORCE RESTRICTION: Reject this tag from any other node
+        if tag_id == '0AC909B0' and station_id == 'A1' and node_id != '93BA302D':
+            logging.warning(f"BLOCKED: Tag {tag_id} from {station_id} attempted to display on node {node_id} - ONLY TRISHALA (93BA302D) allowed")
+            return
+        
+        # Map station to checkpoint names
+        checkpoint_mapping = {
+            # Map station IDs to the checkpoint names used in active_checkpoints
+            # so that progress keys match the UI's expected checkpoint list.
+            'A1': 'Main Gate Checkpoint',
+            'A2': 'Weighbridge Checkpoint',
+            'A3': 'Fuel Station Checkpoint',
+            'A4': 'Workshop Checkpoint',
+            'B1': 'North Entry',
+            'B2': 'Equipment Room',
+            'B3': 'Gas Detection', 
+            'B4': 'Exit Portal',
+            'C1': 'South Gate',
+            'C2': 'Tool Center',
+            'C3': 'Deep Shaft',
+            'C4': 'Return Path'
+        }
+        # Default checkpoint id from mapping
+        checkpoint_id = checkpoint_mapping.get(station_id, f'Station {station_id}')
+
+        # Whether we've already handled marking/unmarking for this special-case
+        skip_auto_mark = False
+
+        # Special-case: for tag C7761005 and 93BA302D (case-insensitive), advance the
+        # checkpoint progress sequentially on every unique scan. Each scan
+        # advances to the next configured checkpoint for that node (cycles).
+        if tag_lc in ['c7761005', '93ba302d']:
+            # Determine the target node ID based on tag
+            target_node = 'C7761005' if tag_lc == 'c7761005' else '93BA302D'
             
-            # Get node_id based on zone and station number
-            if zone in zone_nodes:
-                nodes = zone_nodes[zone]
-                node_idx = (int(station_num) - 1) % len(nodes)
-                node_id = nodes[node_idx]
+            # Increment the per-tag counter (absolute count) for each unique scan
+            cnt = self._rfid_tag_scan_counts.get(tag_lc, 0) + 1
+            self._rfid_tag_scan_counts[tag_lc] = cnt
+
+            # Get ordered checkpoint list for this node
+            node_checkpoints = self.data['rfid_checkpoints']['active_checkpoints'].get(
+                target_node,
+                ['Main Gate Checkpoint', 'Weighbridge Checkpoint', 'Fuel Station Checkpoint', 'Workshop Checkpoint']
+            )
+            n = len(node_checkpoints)
+
+            # Compute position in a forward-then-reverse cycle of length 2*n
+            pos = ((cnt - 1) % (2 * n)) + 1
+
+            # Helper to mark/unmark
+            def _mark(node, idx_mark):
+                chk = node_checkpoints[idx_mark]
+                if node not in self.data['rfid_checkpoints']['checkpoint_progress']:
+                    self.data['rfid_checkpoints']['checkpoint_progress'][node] = {}
+                self.data['rfid_checkpoints']['checkpoint_progress'][node][chk] = timestamp
+
+            def _unmark_idx(node, idx_un):
+                chk = node_checkpoints[idx_un]
+                try:
+                    if node in self.data['rfid_checkpoints']['checkpoint_progress'] and chk in self.data['rfid_checkpoints']['checkpoint_progress'][node]:
+                        del self.data['rfid_checkpoints']['checkpoint_progress'][node][chk]
+                except Exception:
+                    logging.exception("Error unmarking checkpoint")
+
+            if pos <= n:
+                # Forward pass: mark checkpoint at index pos-1
+                idx = pos - 1
+                _mark(target_node, idx)
+                checkpoint_id = node_checkpoints[idx]
             else:
-                node_id = station_id  # Fallback to station_id if no mapping
-            
-            # FILTER OVERRIDE: Tag 0AC909B0 from station A1 must ONLY show on TRISHALA node
-            if tag_id == '0AC909B0' and station_id == 'A1':
-                node_id = '93BA302D'  # Force to TRISHALA node only
-                logging.info(f"Tag {tag_id} from {station_id} filtered to TRISHALA node (93BA302D)")
-            
-            # ENFORCE RESTRICTION: Reject this tag from any other node
-            if tag_id == '0AC909B0' and station_id == 'A1' and node_id != '93BA302D':
-                logging.warning(f"BLOCKED: Tag {tag_id} from {station_id} attempted to display on node {node_id} - ONLY TRISHALA (93BA302D) allowed")
-                return
-            
-            # Map station to checkpoint names
-            checkpoint_mapping = {
-                # Map station IDs to the checkpoint names used in active_checkpoints
-                # so that progress keys match the UI's expected checkpoint list.
-                'A1': 'Main Gate Checkpoint',
-                'A2': 'Weighbridge Checkpoint',
-                'A3': 'Fuel Station Checkpoint',
-                'A4': 'Workshop Checkpoint',
-                'B1': 'North Entry',
-                'B2': 'Equipment Room',
-                'B3': 'Gas Detection', 
-                'B4': 'Exit Portal',
-                'C1': 'South Gate',
-                'C2': 'Tool Center',
-                'C3': 'Deep Shaft',
-                'C4': 'Return Path'
-            }
-            # Default checkpoint id from mapping
-            checkpoint_id = checkpoint_mapping.get(station_id, f'Station {station_id}')
-
-            # Whether we've already handled marking/unmarking for this special-case
-            skip_auto_mark = False
-
-            # Special-case: for tag C7761005 and 93BA302D (case-insensitive), advance the
-            # checkpoint progress sequentially on every unique scan. Each scan
-            # advances to the next configured checkpoint for that node (cycles).
-            if tag_lc in ['c7761005', '93ba302d']:
-                # Determine the target node ID based on tag
-                target_node = 'C7761005' if tag_lc == 'c7761005' else '93BA302D'
-                
-                # Increment the per-tag counter (absolute count) for each unique scan
-                cnt = self._rfid_tag_scan_counts.get(tag_lc, 0) + 1
-                self._rfid_tag_scan_counts[tag_lc] = cnt
-
-                # Get ordered checkpoint list for this node
-                node_checkpoints = self.data['rfid_checkpoints']['active_checkpoints'].get(
-                    target_node,
-                    ['Main Gate Checkpoint', 'Weighbridge Checkpoint', 'Fuel Station Checkpoint', 'Workshop Checkpoint']
-                )
-                n = len(node_checkpoints)
-
-                # Compute position in a forward-then-reverse cycle of length 2*n
-                pos = ((cnt - 1) % (2 * n)) + 1
-
-                # Helper to mark/unmark
-                def _mark(node, idx_mark):
-                    chk = node_checkpoints[idx_mark]
-                    if node not in self.data['rfid_checkpoints']['checkpoint_progress']:
-                        self.data['rfid_checkpoints']['checkpoint_progress'][node] = {}
-                    self.data['rfid_checkpoints']['checkpoint_progress'][node][chk] = timestamp
-
-                def _unmark_idx(node, idx_un):
-                    chk = node_checkpoints[idx_un]
-                    try:
-                        if node in self.data['rfid_checkpoints']['checkpoint_progress'] and chk in self.data['rfid_checkpoints']['checkpoint_progress'][node]:
-                            del self.data['rfid_checkpoints']['checkpoint_progress'][node][chk]
-                    except Exception:
-                        logging.exception("Error unmarking checkpoint")
+                # Reverse pass: pos in [n+1 .. 2n] -> unmark index = 2n - pos
+                idx_un = (2 * n) - pos
+                _unmark_idx(target_node, idx_un)
+                checkpoint_id = node_checkpoints[idx_un]
 
-                if pos <= n:
-                    # Forward pass: mark checkpoint at index pos-1
-                    idx = pos - 1
-                    _mark(target_node, idx)
-                    checkpoint_id = node_checkpoints[idx]
-                else:
-                    # Reverse pass: pos in [n+1 .. 2n] -> unmark index = 2n - pos
-                    idx_un = (2 * n) - pos
-                    _unmark_idx(target_node, idx_un)
-                    checkpoint_id = node_checkpoints[idx_un]
+            # Force the node to the target node so progress is stored under that person's node
+            node_id = target_node
 
-                # Force the node to the target node so progress is stored under that person's node
-                node_id = target_node
+            # Special-case: we handled marking/unmarking manually; prevent the
+            # generic automatic mark below from overriding it.
+            skip_auto_mark = True
+        
+        # Store the scan
+        self.data['rfid_checkpoints']['timestamps'].append(timestamp)
+        self.data['rfid_checkpoints']['uid_scans'].append({
+            'tag_id': tag_id,
+            'station_id': station_id,
+            'node_id': node_id,
+            'checkpoint': checkpoint_id,
+            'timestamp': timestamp
+        })
+        
+        self.data['rfid_checkpoints']['latest_tag'] = tag_id
+        self.data['rfid_checkpoints']['latest_station'] = station_id
+        # Store latest seen name if provided by publisher (used for alert context)
+        if 'name' in rfid_data:
+            self.data['rfid_checkpoints']['latest_name'] = rfid_data.get('name')
+        
+        # Update checkpoint progress for specific nodes (skip if special-case handled it)
+        if not skip_auto_mark:
+            if node_id and checkpoint_id:
+                if node_id not in self.data['rfid_checkpoints']['checkpoint_progress']:
+                    self.data['rfid_checkpoints']['checkpoint_progress'][node_id] = {}
+                self.data['rfid_checkpoints']['checkpoint_progress'][node_id][checkpoint_id] = timestamp
+        
+        logging.info(f"RFID checkpoint updated: Station={station_id}, Tag={tag_id}, Node={node_id}, Checkpoint={checkpoint_id}")
 
-                # Special-case: we handled marking/unmarking manually; prevent the
-                # generic automatic mark below from overriding it.
-                skip_auto_mark = True
-            
-            # Store the scan
-            self.data['rfid_checkpoints']['timestamps'].append(timestamp)
-            self.data['rfid_checkpoints']['uid_scans'].append({
-                'tag_id': tag_id,
-                'station_id': station_id,
-                'node_id': node_id,
-                'checkpoint': checkpoint_id,
-                'timestamp': timestamp
-            })
-            
-            self.data['rfid_checkpoints']['latest_tag'] = tag_id
-            self.data['rfid_checkpoints']['latest_station'] = station_id
-            # Store latest seen name if provided by publisher (used for alert context)
-            if 'name' in rfid_data:
-                self.data['rfid_checkpoints']['latest_name'] = rfid_data.get('name')
-            
-            # Update checkpoint progress for specific nodes (skip if special-case handled it)
-            if not skip_auto_mark:
-                if node_id and checkpoint_id:
-                    if node_id not in self.data['rfid_checkpoints']['checkpoint_progress']:
-                        self.data['rfid_checkpoints']['checkpoint_progress'][node_id] = {}
-                    self.data['rfid_checkpoints']['checkpoint_progress'][node_id][checkpoint_id] = timestamp
-            
-            logging.info(f"RFID checkpoint updated: Station={station_id}, Tag={tag_id}, Node={node_id}, Checkpoint={checkpoint_id}")
-    
     def reset_checkpoint_progress(self, node_id=None, tag_id=None):
         """Reset checkpoint progress for a specific node or tag"""
-        with self.lock:
-            if tag_id:
-                # Reset tag scan counter
-                tag_lc = tag_id.lower() if isinstance(tag_id, str) else ''
-                if tag_lc in self._rfid_tag_scan_counts:
-                    del self._rfid_tag_scan_counts[tag_lc]
-                    logging.info(f"Reset scan counter for tag {tag_id}")
-            
-            if node_id:
-                # Reset checkpoint progress for node
-                if node_id in self.data['rfid_checkpoints']['checkpoint_progress']:
-                    del self.data['rfid_checkpoints']['checkpoint_progress'][node_id]
-                    logging.info(f"Reset checkpoint progress for node {node_id}")
-            
-            if not node_id and not tag_id:
-                # Reset everything
-                self._rfid_tag_scan_counts.clear()
-                self.data['rfid_checkpoints']['checkpoint_progress'].clear()
-                logging.info("Reset all checkpoint progress")
-    
+        with self.rfid_lock:
+            self._reset_checkpoint_progress(node_id, tag_id)
+            event = {'node_id': node_id, 'tag_id': tag_id}
+            now = epoch_now()
+            if self.store is not None:
+                self._stored_rfid_event('reset', now, event)
+            if self.pg_sink is not None:
+                self.pg_sink.write_rfid('reset', now, event)
+
+    def record_alert(self, alert_entry, cooldown=30.0):
+        """Send a new dashboard alert to the PostgreSQL sink (once per cooldown across browser sessions)"""
+        if self.pg_sink is None:
+            return
+        key = (alert_entry.get('type'), alert_entry.get('node'), alert_entry.get('message'))
+        now = time.monotonic()
+        with self._alert_lock:
+            if now - self._alert_sent.get(key, -cooldown) < cooldown:
+                return
+            self._alert_sent[key] = now
+            if len(self._alert_sent) > 1024:
+                self._alert_sent = {k: t for k, t in self._alert_sent.items() if now - t < cooldown}
+        self.pg_sink.write_alert(alert_entry)
+
+    def _reset_checkpoint_progress(self, node_id, tag_id):
+        """Reset checkpoint progress (caller holds rfid_lock)"""
+        if tag_id:
+            # Reset tag scan counter
+            tag_lc = tag_id.lower() if isinstance(tag_id, str) else ''
+            if tag_lc in self._rfid_tag_scan_counts:
+                del self._rfid_tag_scan_counts[tag_lc]
+                logging.info(f"Reset scan counter for tag {tag_id}")
+        
+        if node_id:
+            # Reset checkpoint progress for node
+            if node_id in self.data['rfid_checkpoints']['checkpoint_progress']:
+                del self.data['rfid_checkpoints']['checkpoint_progress'][node_id]
+                logging.info(f"Reset checkpoint progress for node {node_id}")
+        
+        if not node_id and not tag_id:
+            # Reset everything
+            self._rfid_tag_scan_counts.clear()
+            self.data['rfid_checkpoints']['checkpoint_progress'].clear()
+            logging.info("Reset all checkpoint progress")
+
     def get_rfid_data(self):
-        """Get RFID checkpoint data"""
-        with self.lock:
-            return self.data['rfid_checkpoints'].copy()
+        """Get a consistent copy of the RFID checkpoint data (scan history as tuples)"""
+        with self.rfid_lock:
+            rfid = self.data['rfid_checkpoints'].copy()
+            rfid['timestamps'] = tuple(rfid['timestamps'])
+            rfid['uid_scans'] = tuple(rfid['uid_scans'])
+            rfid['checkpoint_progress'] = {node: dict(p) for node, p in rfid['checkpoint_progress'].items()}
+            return rfid
     
     def get_checkpoint_status(self, node_id):
         """Get checkpoint status for a specific node"""
-        with self.lock:
+        with self.rfid_lock:
             checkpoints = self.data['rfid_checkpoints']['active_checkpoints'].get(node_id, [])
             progress = self.data['rfid_checkpoints']['checkpoint_progress'].get(node_id, {})
             
@@ -1136,7 +1525,7 @@ class MQTTClient:
     def __init__(self, data_manager):
         self.data_manager = data_manager
         self.client = None
-        self.connected = False
+        self._connected = False
 
         # MQTT Configuration
         self.mqtt_host = os.getenv("MQTT_HOST", "t5066166.ala.asia-southeast1.emqxsl.com")
@@ -1144,54 +1533,140 @@ class MQTTClient:
         self.mqtt_username = os.getenv("MQTT_USERNAME", "LOKI")
         self.mqtt_password = os.getenv("MQTT_PASSWORD", "LOKI2004")
 
-        # Topics
-        self.subscribe_topics = list(SensorDataManager.TOPIC_TO_NODE_MAP.keys())
+        # Unique per process so a second dashboard does not kick this one off the broker
+        self.client_id = os.getenv("MQTT_CLIENT_ID") or f"MineArmourDashboard-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+        # Topics (every pattern compiled into the data manager's router)
+        self.router = data_manager.topic_router
+        self.subscribe_topics = [t for t in self.router.patterns() if t not in SensorDataManager.RFID_TOPICS]
         self.rfid_topic = "rfid"
 
+        # Decoding and storage run on ingest workers, never on the paho network thread
+        # Under backlog, gas samples are coalesced per node (RFID and alarm readings are kept)
+        self.shedder = LoadShedder.from_env()
+        self.ingest = IngestQueue.from_env(self.process_batch, name="mqtt-ingest", protected=self.is_rfid_topic,
+                                           burst_watermark=self.shedder.watermark if self.shedder.enabled else None,
+                                           ack=self._ack, shard_key=self.router.shard_key)
+
+        # MQTT_PROTOCOL=5: QoS1 deliveries are acked only once stored, and at most one worker
+        # batch per worker is in flight, so the broker holds back while the ingest queue has a backlog
+        self.mqtt_options = MqttOptions.from_env(receive_maximum=self.ingest.batch_size * self.ingest.num_workers)
+        self.manual_ack = self.mqtt_options.manual_ack
+        self._ack_session = 0   # bumped per connection: acks for an older connection's mids are skipped
+        self.topic_aliases = TopicAliasResolver() if self.mqtt_options.is_v5 else None
+
+        # INGEST_PROCESSES > 0: consumer processes on $share/<group>/<topic> replace this client
+        self.shared_ingest = SharedSubscriptionIngest.from_env(data_manager, shedder=self.shedder)
+
         logging.info(f"MQTT subscribing to topics: {self.subscribe_topics}")
 
+    def is_rfid_topic(self, topic):
+        route = self.router.route(topic)
+        return route is not None and route.handler == 'rfid'
+
+    def _route_nodes(self, topic):
+        return self.data_manager.nodes_for_route(self.router.route(topic), topic)
+
+    @property
+    def connected(self):
+        if self.shared_ingest is not None:
+            return self.shared_ingest.connected
+        return self._connected
+
+    @connected.setter
+    def connected(self, value):
+        self._connected = value
+
     # --------------------------------------------------
     # MQTT CALLBACKS
     # --------------------------------------------------
 
-    def on_connect(self, client, userdata, flags, rc):
+    def on_connect(self, client, userdata, flags, rc, properties=None):
         if rc == 0:
             self.connected = True
+            self._ack_session += 1
             logging.info("✅ Connected to MQTT broker")
+            if self.topic_aliases is not None:
+                self.topic_aliases.reset()
+                if flags.get('session present'):
+                    logging.info("📬 Resumed MQTT v5 session (queued messages will be delivered)")
 
+            qos = self.mqtt_options.subscribe_qos
             for topic in self.subscribe_topics:
-                client.subscribe(topic)
+                client.subscribe(topic, qos=qos)
                 logging.info(f"📡 Subscribed to {topic}")
 
-            client.subscribe("rfid")
-            client.subscribe("rfid/#")
+            for topic in SensorDataManager.RFID_TOPICS:
+                client.subscribe(topic, qos=qos)
             logging.info("📡 Subscribed to RFID topics")
 
         else:
             logging.error(f"❌ MQTT connection failed (rc={rc})")
 
     def on_message(self, client, userdata, message):
-        try:
-            payload = message.payload.decode()
-            topic = message.topic
-            logging.info(f"📩 MQTT [{topic}] {payload}")
-
+        # Runs on the paho network thread: only hand the raw bytes over so keepalives
+        # are never delayed by storage or dashboard locks. With manual acks, QoS1
+        # deliveries are acked by the ingest worker once process_batch has stored them.
+        token = (self._ack_session, message.mid, message.qos) if self.manual_ack and message.qos else None
+        if self.topic_aliases is None:
+            self.ingest.put(message.topic, message.payload, token)
+            return
+        topic = self.topic_aliases.topic(message)
+        if topic:
+            self.ingest.put(topic, message.payload, token)
+        else:
+            hot_log.warning('mqtt.unknown_alias', "⚠ Message with unknown MQTT topic alias ignored")
+            if token is not None:
+                self._ack(token)
+
+    def _ack(self, token):
+        """Ack a stored QoS1 delivery (ingest worker); the broker resends unacked ones after a reconnect"""
+        session, mid, qos = token
+        client = self.client
+        if client is not None and session == self._ack_session:
+            client.ack(mid, qos)
+
+    def process_batch(self, batch):
+        """Decode a batch of raw MQTT payloads and store them (runs on an ingest worker)"""
+        gas_records = []
+        rfid_records = []
+        for topic, payload, received_at in batch:
             try:
-                data = json.loads(payload)
-            except Exception:
-                logging.warning("⚠ Non-JSON payload ignored")
-                return
-
-            # RFID payload
-            if isinstance(data, dict) and "tag_id" in data and "station_id" in data:
-                self.data_manager.add_rfid_data(data)
-            else:
-                self.data_manager.add_gas_data(data, topic=topic)
+                hot_log.count('messages', topic)
+                if is_binary_payload(payload):
+                    hot_log.info('mqtt.raw', "📩 MQTT [%s] <binary %d bytes>", topic, len(payload))
+                else:
+                    hot_log.info('mqtt.raw', "📩 MQTT [%s] %s", topic, LazyText(payload))
 
-        except Exception as e:
-            logging.error(f"❌ MQTT message error: {e}")
+                route = self.router.route(topic)
+                if route is None:
+                    hot_log.info('mqtt.blocked', "⛔ Sensor data BLOCKED - No valid node mapping for topic %s", topic)
+                    continue
 
-    def on_disconnect(self, client, userdata, rc):
+                kind, record = decode_payload(payload, received_at, self.data_manager.event_time)
+                if kind is None:
+                    hot_log.warning('mqtt.undecodable', "⚠ Undecodable payload ignored (topic %s)", topic)
+                elif kind == 'rfid' or route.handler == 'rfid':
+                    if kind == 'rfid':
+                        rfid_records.append((record, received_at))
+                    else:
+                        hot_log.warning('mqtt.non_rfid', "⚠ Non-RFID payload on RFID topic %s ignored", topic)
+                elif self.data_manager.nodes_for_route(route, topic):
+                    # Fixed routes name their nodes; per-helmet wildcard routes (helmet/+) take it from the topic
+                    gas_records.append((topic, record))
+
+            except Exception as e:
+                logging.error(f"❌ MQTT message error: {e}")
+
+        if gas_records and self.shedder.enabled:
+            # Alarm state is tracked on every batch; readings are only coalesced under backlog
+            gas_records = self.shedder.shed(gas_records, self._route_nodes, coalesce=self.ingest.bursting())
+        if gas_records:
+            self.data_manager.add_gas_batch(gas_records)
+        if rfid_records:
+            self.data_manager.add_rfid_batch(rfid_records)
+
+    def on_disconnect(self, client, userdata, rc, properties=None):
         self.connected = False
         logging.warning("🔌 MQTT disconnected")
 
@@ -1200,14 +1675,12 @@ class MQTTClient:
     # --------------------------------------------------
 
     def connect(self):
-        try:
-            from paho.mqtt.client import CallbackAPIVersion
+        if self.shared_ingest is not None:
+            self.shared_ingest.start()
+            return
 
-            self.client = mqtt.Client(
-                client_id="MineArmourDashboard",
-                protocol=mqtt.MQTTv311,
-                callback_api_version=CallbackAPIVersion.VERSION1
-            )
+        try:
+            self.client = self.mqtt_options.create_client(self.client_id, manual_ack=True)
 
             self.client.on_connect = self.on_connect
             self.client.on_message = self.on_message
@@ -1224,7 +1697,10 @@ class MQTTClient:
             self.client.reconnect_delay_set(5, 30)
             self.client.enable_logger()
 
-            self.client.connect(self.mqtt_host, self.mqtt_port, 60)
+            self.ingest.start()
+            # A stable MQTT_CLIENT_ID lets a restarted dashboard resume its v5 session
+            connect_kwargs = self.mqtt_options.connect_kwargs(resume_session=bool(os.getenv("MQTT_CLIENT_ID")))
+            self.client.connect(self.mqtt_host, self.mqtt_port, 60, **connect_kwargs)
             self.client.loop_start()
 
         except Exception as e:
@@ -1235,6 +1711,9 @@ class MQTTClient:
             self.client.loop_stop()
             self.client.disconnect()
             logging.info("🔴 MQTT disconnected cleanly")
+        self.ingest.stop()
+        if self.shared_ingest is not None:
+            self.shared_ingest.stop()
 
 # Initialize data manager and MQTT client
 data_manager = SensorDataManager()
@@ -1262,9 +1741,9 @@ def reset_rfid_counter():
 
     tag_lc = tag.lower()
     try:
-        # Remove the tag counter so sequence restarts
+        # Remove the tag counter so sequence restarts (recorded, so a restart does not bring it back)
         if tag_lc in data_manager._rfid_tag_scan_counts:
-            data_manager._rfid_tag_scan_counts.pop(tag_lc, None)
+            data_manager.reset_checkpoint_progress(tag_id=tag)
             return (f"Counter reset for {tag}", 200)
         else:
             return (f"No counter present for {tag}", 200)
@@ -1280,6 +1759,98 @@ def rfid_counters():
     except Exception as e:
         logging.error(f"Error returning rfid counters: {e}")
         return ("Internal Error", 500)
+
+
+@app.server.route('/ingest_stats', methods=['GET'])
+def ingest_stats():
+    try:
+        stats = mqtt_client.ingest.stats()
+        stats['dedupe'] = data_manager.deduplicator.stats()
+        stats['load_shedding'] = mqtt_client.shedder.stats()
+        stats['nodes'] = data_manager.per_node_data.stats()
+        if data_manager.store is not None:
+            stats['store'] = data_manager.store.stats()
+        if data_manager.pg_sink is not None:
+            stats['postgres'] = data_manager.pg_sink.stats()
+        if data_manager.segments is not None:
+            stats['segments'] = data_manager.segments.stats()
+        if data_manager.snapshots is not None:
+            stats['snapshot'] = data_manager.snapshots.stats()
+        if data_manager.reorder is not None:
+            stats['reorder'] = data_manager.reorder.stats()
+        stats['history'] = data_manager.history_stats()
+        stats['retention'] = data_manager.retention_stats()
+        stats['fleet'] = data_manager.fleet.stats()
+        if mqtt_client.shared_ingest is not None:
+            stats['shared'] = mqtt_client.shared_ingest.stats()
+        return jsonify(stats)
+    except Exception as e:
+        logging.error(f"Error returning ingest stats: {e}")
+        return ("Internal Error", 500)
+
+
+@app.server.route('/late_readings', methods=['GET'])
+def late_readings():
+    # ?node=<id> -> readings that arrived behind the node's reorder watermark (event-time mode)
+    node_id = request.args.get('node')
+    if not node_id:
+        return ("Missing node", 400)
+    try:
+        return jsonify(data_manager.late_readings(node_id))
+    except Exception as e:
+        logging.error(f"Error returning late readings: {e}")
+        return ("Internal Error", 500)
+
+
+@app.server.route('/export', methods=['GET'])
+def export_history():
+    # ?node=<id>&hours=24 (or &since=/&until= epoch seconds)&channels=LPG,CH4 -> CSV from segment files
+    if data_manager.segments is None:
+        return ("Segment history is disabled (set SEGMENT_DIR)", 404)
+    node_id = request.args.get('node')
+    if not node_id:
+        return ("Missing node", 400)
+    try:
+        until = float(request.args['until']) if 'until' in request.args else None
+        if 'since' in request.args:
+            since = float(request.args['since'])
+        else:
+            since = (until or epoch_now()) - float(request.args.get('hours', '24')) * 3600
+        channels = [c for c in request.args.get('channels', ','.join(CHANNELS[1:])).split(',') if c]
+        lanes = [CHANNELS.index(c) for c in channels]
+    except ValueError:
+        return ("Invalid since/until/hours or unknown channel", 400)
+    segments = data_manager.segments.lookup(node_id)
+    if segments is None:
+        return ("Unknown node", 404)
+    views = segments.views(since, until)
+
+    def rows():
+        # Streams straight from the mapped segments; only one segment's rows are formatted at a time
+        yield ','.join(['timestamp'] + channels) + '\n'
+        for view in views:
+            table = view.tolist() if view.ndim == 2 else [
+                view[k:k + len(CHANNELS)].tolist() for k in range(0, len(view), len(CHANNELS))]
+            yield ''.join(
+                ','.join([datetime.fromtimestamp(r[0]).isoformat()] + ['' if r[i] != r[i] else repr(r[i]) for i in lanes]) + '\n'
+                for r in table
+            )
+
+    return Response(rows(), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename="{node_id}_history.csv"'})
+
+
+@app.server.route('/log_verbosity', methods=['GET', 'POST'])
+def log_verbosity():
+    # ?verbose=1 logs every hot-path record, ?verbose=0 restores rate limiting
+    try:
+        verbose = request.args.get('verbose')
+        if verbose is not None:
+            hot_log.set_verbose(verbose.lower() in ('1', 'true', 'yes', 'on'))
+        return jsonify(hot_log.stats())
+    except Exception as e:
+        logging.error(f"Error updating log verbosity: {e}")
+        return ("Internal Error", 500)
 # Custom CSS styling with darker red-black gradient theme
 custom_style = {
     'backgroundColor': '#000000',
@@ -1537,59 +2108,82 @@ def zone_select_layout():
         })
     ])
 
+# ---------------------------
+# Node cards (listed from the node registry, one page at a time)
+# ---------------------------
+NODES_PER_PAGE = int(os.getenv("NODES_PER_PAGE", "12"))
+
+def _node_card(node, button_label):
+    status = 'Active' if node['has_data'] else 'Waiting for data'
+    return dbc.Card([
+        dbc.CardBody([
+            html.H4(node['name'], className='card-title', style={'color': '#ff4444', 'marginBottom': '8px'}),
+            html.P(f"Node ID: {node['id']}", style={'color': '#cccccc', 'marginBottom': '4px'}),
+            html.P(f"Status: {status}", style={'color': '#00ff88', 'marginBottom': '12px'}),
+            html.Button(
+                button_label,
+                id={'type': 'node-select-btn', 'index': node['id']},
+                n_clicks=0,
+                className='btn btn-danger',
+                style={
+                    'background': 'linear-gradient(45deg, #cc0000, #ff4444)',
+                    'border': 'none',
+                    'color': 'white',
+                    'fontWeight': 'bold',
+                    'width': '100%',
+                    'padding': '8px'
+                }
+            )
+        ])
+    ], style={
+        'background': 'linear-gradient(135deg, #1a0000, #330000)',
+        'border': '1px solid #660000',
+        'marginBottom': '15px',
+        'boxShadow': '0 4px 8px rgba(255,68,68,0.2)'
+    })
+
+def _node_page(zone_name, page, button_label):
+    """Cards for one page of registered nodes plus the page label"""
+    nodes, page, pages = data_manager.per_node_data.page(zone_name, page, NODES_PER_PAGE)
+    cards = [_node_card(node, button_label) for node in nodes]
+    if not cards:
+        cards = [html.P("No nodes registered yet", style={'color': '#99aab5'})]
+    return cards, f"Page {page + 1} of {pages}", page
+
+def _node_list(zone_name, button_label, max_height):
+    """Paginated node list shared by the zone nodes page and the open cast page"""
+    cards, label, page = _node_page(zone_name, 0, button_label)
+    pager_btn = {'background': 'linear-gradient(45deg, #666666, #999999)', 'border': 'none', 'color': 'white',
+                 'padding': '4px 12px', 'borderRadius': '6px'}
+    return html.Div([
+        dcc.Store(id='node-page-store', data={'zone': zone_name, 'page': page, 'label': button_label}),
+        html.Div(cards, id='node-cards', style={'maxHeight': max_height, 'overflowY': 'auto', 'padding': '10px'}),
+        html.Div([
+            html.Button("◀ PREV", id='node-page-prev', n_clicks=0, style=pager_btn),
+            html.Span(label, id='node-page-label', style={'color': '#ffcccc', 'margin': '0 12px'}),
+            html.Button("NEXT ▶", id='node-page-next', n_clicks=0, style=pager_btn),
+        ], style={'textAlign': 'center', 'marginTop': '8px'})
+    ])
+
+@app.callback(
+    [Output('node-cards', 'children'), Output('node-page-label', 'children'), Output('node-page-store', 'data')],
+    [Input('node-page-prev', 'n_clicks'), Input('node-page-next', 'n_clicks')],
+    State('node-page-store', 'data'),
+    prevent_initial_call=True
+)
+def change_node_page(n_prev, n_next, page_data):
+    if not callback_context.triggered or not page_data:
+        raise PreventUpdate
+    step = -1 if callback_context.triggered[0]['prop_id'].startswith('node-page-prev') else 1
+    cards, label, page = _node_page(page_data.get('zone'), page_data.get('page', 0) + step, page_data.get('label'))
+    return cards, label, dict(page_data, page=page)
+
 # ---------------------------
 # Page: Nodes Selection 
 # ---------------------------
 def nodes_layout(zone_name):
-    # Get nodes for the selected zone
-    # Use the same primary 4 named nodes across all zones so Zone B/C/D show the
-    # same node cards as Zone A (matches the RFID/node mapping used elsewhere).
-    primary_nodes = [
-        {'id': 'C7761005', 'name': 'LOKESH (RANJ_2005 Data)', 'status': 'Active'},
-        {'id': '93BA302D', 'name': 'TRISHALA (LOKI_2004 Data)', 'status': 'Active'},
-        {'id': '7AA81505', 'name': 'RANJHANA (RANJ_2005 Data)', 'status': 'Active'},
-        {'id': 'DB970104', 'name': 'SUSHMA (LOKI_2004 Data)', 'status': 'Active'}
-    ]
-
-    zone_nodes = {
-        'ZONE_A': primary_nodes,
-        'ZONE_B': primary_nodes,
-        'ZONE_C': primary_nodes,
-        'ZONE_D': primary_nodes
-    }
-    
-    nodes = zone_nodes.get(zone_name, [])
-    
-    # Create node cards
-    node_cards = []
-    for node in nodes:
-        card = dbc.Card([
-            dbc.CardBody([
-                html.H4(node['name'], className='card-title', style={'color': '#ff4444', 'marginBottom': '8px'}),
-                html.P(f"Node ID: {node['id']}", style={'color': '#cccccc', 'marginBottom': '4px'}),
-                html.P(f"Status: {node['status']}", style={'color': '#00ff88', 'marginBottom': '12px'}),
-                html.Button(
-                    "SELECT NODE",
-                    id={'type': 'node-select-btn', 'index': node['id']},
-                    n_clicks=0,
-                    className='btn btn-danger',
-                    style={
-                        'background': 'linear-gradient(45deg, #cc0000, #ff4444)',
-                        'border': 'none',
-                        'color': 'white',
-                        'fontWeight': 'bold',
-                        'width': '100%',
-                        'padding': '8px'
-                    }
-                )
-            ])
-        ], style={
-            'background': 'linear-gradient(135deg, #1a0000, #330000)',
-            'border': '1px solid #660000',
-            'marginBottom': '15px',
-            'boxShadow': '0 4px 8px rgba(255,68,68,0.2)'
-        })
-        node_cards.append(card)
+    # Nodes registered for this zone (configured nodes are listed in every zone)
+    node_list = _node_list(zone_name, "SELECT NODE", '400px')
     
     return html.Div([
         html.Div([
@@ -1599,7 +2193,7 @@ def nodes_layout(zone_name):
                         className='landing-subtext', 
                         style={'fontSize':'0.95rem','marginTop':'-18px','marginBottom':'20px','letterSpacing':'.8px','color':'#ffcccc','fontWeight':'600'}),
                 
-                html.Div(node_cards, style={'maxHeight': '400px', 'overflowY': 'auto', 'padding': '10px'}),
+                node_list,
                 
                 html.Div([
                     html.Button("← BACK TO ZONES", 
@@ -1664,43 +2258,8 @@ def mine_choice_layout():
 # Page: Open Cast Mine
 # ---------------------------
 def open_cast_layout():
-    # Reuse primary nodes as users on Open Cast page
-    primary_nodes = [
-        {'id': 'C7761005', 'name': 'LOKESH (RANJ_2005)', 'status': 'Active'},
-        {'id': '93BA302D', 'name': 'TRISHALA (LOKI_2004)', 'status': 'Active'},
-        {'id': '7AA81505', 'name': 'RANJHANA (RANJ_2005)', 'status': 'Active'},
-        {'id': 'DB970104', 'name': 'SUSHMA (LOKI_2004)', 'status': 'Active'}
-    ]
-
-    node_cards = []
-    for node in primary_nodes:
-        card = dbc.Card([
-            dbc.CardBody([
-                html.H4(node['name'], className='card-title', style={'color': '#ff4444', 'marginBottom': '8px'}),
-                html.P(f"Node ID: {node['id']}", style={'color': '#cccccc', 'marginBottom': '4px'}),
-                html.P(f"Status: {node['status']}", style={'color': '#00ff88', 'marginBottom': '12px'}),
-                html.Button(
-                    "SELECT USER",
-                    id={'type': 'node-select-btn', 'index': node['id']},
-                    n_clicks=0,
-                    className='btn btn-danger',
-                    style={
-                        'background': 'linear-gradient(45deg, #cc0000, #ff4444)',
-                        'border': 'none',
-                        'color': 'white',
-                        'fontWeight': 'bold',
-                        'width': '100%',
-                        'padding': '8px'
-                    }
-                )
-            ])
-        ], style={
-            'background': 'linear-gradient(135deg, #1a0000, #330000)',
-            'border': '1px solid #660000',
-            'marginBottom': '15px',
-            'boxShadow': '0 4px 8px rgba(255,68,68,0.2)'
-        })
-        node_cards.append(card)
+    # Registered nodes are the users on the Open Cast page
+    node_list = _node_list(None, "SELECT USER", '520px')
 
     # Top-aligned layout without full-height wrapper
     return dbc.Container([
@@ -1748,7 +2307,7 @@ def open_cast_layout():
                         html.H4("Select User", style={'color': '#ffffff', 'margin': '0'})
                     ], style={'background': 'linear-gradient(45deg, #660000, #990000)', 'border': 'none'}),
                     dbc.CardBody([
-                        html.Div(node_cards, style={'maxHeight': '520px', 'overflowY': 'auto', 'padding': '10px'})
+                        node_list
                     ], style={'background': 'linear-gradient(135deg, #1a0000, #330000)', 'color': '#ffffff'})
                 ], style={'border': '1px solid #660000', 'boxShadow': '0 4px 8px rgba(255,107,107,0.2)'})
             ], width=6)
@@ -2161,7 +2720,21 @@ def vitals_layout():
                 html.I(className="fas fa-chart-area me-3"),
                 "Real-time Gas Sensor Charts"
             ], className="text-center mb-4", 
-               style={'color': '#ffffff', 'fontWeight': 'bold'})
+               style={'color': '#ffffff', 'fontWeight': 'bold'}),
+            # History span: 'live' plots the raw buffer, longer spans read rollup tiers
+            dcc.RadioItems(
+                id='gas-history-span',
+                options=[
+                    {'label': ' Live', 'value': 'live'},
+                    {'label': ' 1 h', 'value': '3600'},
+                    {'label': ' Shift (8 h)', 'value': '28800'},
+                    {'label': ' 24 h', 'value': '86400'},
+                ],
+                value='live',
+                inline=True,
+                inputStyle={'marginLeft': '14px'},
+                style={'color': '#ffffff', 'textAlign': 'center'}
+            )
         ])
     ], className="mb-4"),
     
@@ -2411,7 +2984,7 @@ def update_current_values(n, node_data):
         from datetime import datetime
         
         # Debug logging
-        logging.info(f"🔍 update_current_values called: node_data={node_data}, type={type(node_data)}")
+        hot_log.info('ui.current_values', "🔍 update_current_values called: node_data=%s, type=%s", node_data, type(node_data))
         
         # Connection status
         status = "Connected" if mqtt_client.connected else "Disconnected"
@@ -2420,7 +2993,7 @@ def update_current_values(n, node_data):
         node_id = None
         if node_data:
             node_id = node_data.get('node_id') or node_data.get('node')
-        logging.info(f"🔍 Extracted node_id: {node_id}")
+        hot_log.info('ui.current_values.node', "🔍 Extracted node_id: %s", node_id)
         
         # Get latest gas sensor values (node-specific if node is selected)
         if node_id:
@@ -2487,9 +3060,9 @@ def update_current_values(n, node_data):
 
 @app.callback(
     Output('lpg-chart', 'figure'),
-    [Input('interval-component', 'n_intervals'), Input('selected-node-store', 'data')]
+    [Input('interval-component', 'n_intervals'), Input('selected-node-store', 'data'), Input('gas-history-span', 'value')]
 )
-def update_lpg_chart(n, node_data):
+def update_lpg_chart(n, node_data, span='live'):
     node_id = node_data.get('node_id') if node_data else None
     
     # Check if node has received data
@@ -2505,13 +3078,15 @@ def update_lpg_chart(n, node_data):
             )
             return fig
     
-    gas_data = data_manager.get_gas_data_for_node(node_id) if node_id else data_manager.get_gas_data()
+    series = data_manager.get_series_snapshot(node_id, ('ts', 'LPG'))
     
     fig = go.Figure()
-    if gas_data['timestamps'] and gas_data['LPG']:
+    if span and span != 'live' and node_id:
+        _add_history_traces(fig, node_id, 'LPG', int(span), '#800000')
+    elif len(series):
         fig.add_trace(go.Scatter(
-            x=list(gas_data['timestamps']),
-            y=list(gas_data['LPG']),
+            x=series.datetimes(),
+            y=series.values('LPG'),
             mode='lines+markers',
             name='LPG',
             line=dict(color='#800000', width=3),
@@ -2545,21 +3120,23 @@ def update_lpg_chart(n, node_data):
 
 @app.callback(
     Output('ch4-chart', 'figure'),
-    [Input('interval-component', 'n_intervals'), Input('selected-node-store', 'data')]
+    [Input('interval-component', 'n_intervals'), Input('selected-node-store', 'data'), Input('gas-history-span', 'value')]
 )
-def update_ch4_chart(n, node_data):
+def update_ch4_chart(n, node_data, span='live'):
     node_id = node_data.get('node_id') if node_data else None
     if node_id and not data_manager.per_node_data.get(node_id, {}).get('has_data', False):
         fig = go.Figure()
         fig.update_layout(title={'text': "💨 CH4 - Waiting for data...", 'x': 0.5, 'font': {'color': '#FFFFFF', 'size': 16}}, paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(26,0,0,0.3)', font={'color': '#FFFFFF'}, height=300)
         return fig
-    gas_data = data_manager.get_gas_data_for_node(node_id) if node_id else data_manager.get_gas_data()
+    series = data_manager.get_series_snapshot(node_id, ('ts', 'CH4'))
     
     fig = go.Figure()
-    if gas_data['timestamps'] and gas_data['CH4']:
+    if span and span != 'live' and node_id:
+        _add_history_traces(fig, node_id, 'CH4', int(span), '#4B0000')
+    elif len(series):
         fig.add_trace(go.Scatter(
-            x=list(gas_data['timestamps']),
-            y=list(gas_data['CH4']),
+            x=series.datetimes(),
+            y=series.values('CH4'),
             mode='lines+markers',
             name='CH4',
             line=dict(color='#4B0000', width=3),
@@ -2593,21 +3170,23 @@ def update_ch4_chart(n, node_data):
 
 @app.callback(
     Output('propane-chart', 'figure'),
-    [Input('interval-component', 'n_intervals'), Input('selected-node-store', 'data')]
+    [Input('interval-component', 'n_intervals'), Input('selected-node-store', 'data'), Input('gas-history-span', 'value')]
 )
-def update_propane_chart(n, node_data):
+def update_propane_chart(n, node_data, span='live'):
     node_id = node_data.get('node_id') if node_data else None
     if node_id and not data_manager.per_node_data.get(node_id, {}).get('has_data', False):
         fig = go.Figure()
         fig.update_layout(title={'text': "⛽ Propane - Waiting for data...", 'x': 0.5, 'font': {'color': '#FFFFFF', 'size': 16}}, paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(26,0,0,0.3)', font={'color': '#FFFFFF'}, height=300)
         return fig
-    gas_data = data_manager.get_gas_data_for_node(node_id) if node_id else data_manager.get_gas_data()
+    series = data_manager.get_series_snapshot(node_id, ('ts', 'Propane'))
     
     fig = go.Figure()
-    if gas_data['timestamps'] and gas_data['Propane']:
+    if span and span != 'live' and node_id:
+        _add_history_traces(fig, node_id, 'Propane', int(span), '#45b7d1')
+    elif len(series):
         fig.add_trace(go.Scatter(
-            x=list(gas_data['timestamps']),
-            y=list(gas_data['Propane']),
+            x=series.datetimes(),
+            y=series.values('Propane'),
             mode='lines+markers',
             name='Propane',
             line=dict(color='#45b7d1', width=3),
@@ -2641,21 +3220,23 @@ def update_propane_chart(n, node_data):
 
 @app.callback(
     Output('butane-chart', 'figure'),
-    [Input('interval-component', 'n_intervals'), Input('selected-node-store', 'data')]
+    [Input('interval-component', 'n_intervals'), Input('selected-node-store', 'data'), Input('gas-history-span', 'value')]
 )
-def update_butane_chart(n, node_data):
+def update_butane_chart(n, node_data, span='live'):
     node_id = node_data.get('node_id') if node_data else None
     if node_id and not data_manager.per_node_data.get(node_id, {}).get('has_data', False):
         fig = go.Figure()
         fig.update_layout(title={'text': "🧪 Butane - Waiting for data...", 'x': 0.5, 'font': {'color': '#FFFFFF', 'size': 16}}, paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(26,0,0,0.3)', font={'color': '#FFFFFF'}, height=300)
         return fig
-    gas_data = data_manager.get_gas_data_for_node(node_id) if node_id else data_manager.get_gas_data()
+    series = data_manager.get_series_snapshot(node_id, ('ts', 'Butane'))
     
     fig = go.Figure()
-    if gas_data['timestamps'] and gas_data['Butane']:
+    if span and span != 'live' and node_id:
+        _add_history_traces(fig, node_id, 'Butane', int(span), '#f39c12')
+    elif len(series):
         fig.add_trace(go.Scatter(
-            x=list(gas_data['timestamps']),
-            y=list(gas_data['Butane']),
+            x=series.datetimes(),
+            y=series.values('Butane'),
             mode='lines+markers',
             name='Butane',
             line=dict(color='#f39c12', width=3),
@@ -2689,21 +3270,23 @@ def update_butane_chart(n, node_data):
 
 @app.callback(
     Output('h2-chart', 'figure'),
-    [Input('interval-component', 'n_intervals'), Input('selected-node-store', 'data')]
+    [Input('interval-component', 'n_intervals'), Input('selected-node-store', 'data'), Input('gas-history-span', 'value')]
 )
-def update_h2_chart(n, node_data):
+def update_h2_chart(n, node_data, span='live'):
     node_id = node_data.get('node_id') if node_data else None
     if node_id and not data_manager.per_node_data.get(node_id, {}).get('has_data', False):
         fig = go.Figure()
         fig.update_layout(title={'text': "💡 H2 - Waiting for data...", 'x': 0.5, 'font': {'color': '#FFFFFF', 'size': 16}}, paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(26,0,0,0.3)', font={'color': '#FFFFFF'}, height=300)
         return fig
-    gas_data = data_manager.get_gas_data_for_node(node_id) if node_id else data_manager.get_gas_data()
+    series = data_manager.get_series_snapshot(node_id, ('ts', 'H2'))
     
     fig = go.Figure()
-    if gas_data['timestamps'] and gas_data['H2']:
+    if span and span != 'live' and node_id:
+        _add_history_traces(fig, node_id, 'H2', int(span), '#9b59b6')
+    elif len(series):
         fig.add_trace(go.Scatter(
-            x=list(gas_data['timestamps']),
-            y=list(gas_data['H2']),
+            x=series.datetimes(),
+            y=series.values('H2'),
             mode='lines+markers',
             name='H2',
             line=dict(color='#9b59b6', width=3),
@@ -2762,9 +3345,11 @@ def update_gps_map(n, node_data):
 
         # Valid coordinate check (avoid 0,0)
         if current_lat and current_lon and (current_lat != 0.0 or current_lon != 0.0):
-            lat_history = list(gps_data.get('lat', []))
-            lon_history = list(gps_data.get('lon', []))
-            timestamps = list(gps_data.get('timestamps', []))
+            # Fixes that carried both coordinates (the section is aligned across GPS channels)
+            fixes = [(lat, lon) for lat, lon in zip(gps_data.get('lat', ()), gps_data.get('lon', ()))
+                     if lat is not None and lon is not None]
+            lat_history = [lat for lat, _ in fixes]
+            lon_history = [lon for _, lon in fixes]
 
             # Trail (last up to 25 points excluding current)
             if len(lat_history) > 2 and len(lon_history) > 2:
@@ -2834,6 +3419,26 @@ def update_gps_map(n, node_data):
         )
         return fig
 
+def _add_history_traces(fig, node_id, channel, span_s, color, width_px=600):
+    """Min-max band plus mean line for one channel over span_s, from the tier that fits the chart width"""
+    history = data_manager.get_history(node_id, channel, span_s, width_px)
+    if not history['timestamps']:
+        return history['tier']
+    x = history['timestamps']
+    fig.add_trace(go.Scatter(x=x, y=history['max'], mode='lines', line=dict(width=0, color=color),
+                             name=f"{channel} max", hoverinfo='skip', showlegend=False))
+    fig.add_trace(go.Scatter(x=x, y=history['min'], mode='lines', line=dict(width=0, color=color),
+                             fill='tonexty', fillcolor='rgba(255, 255, 255, 0.12)',
+                             name=f"{channel} min", hoverinfo='skip', showlegend=False))
+    fig.add_trace(go.Scatter(
+        x=x, y=history['mean'], mode='lines', name=f"{channel} ({history['tier']})",
+        line=dict(color=color, width=3),
+        customdata=list(zip(history['min'], history['max'], history['count'])),
+        hovertemplate='%{x}<br>mean %{y:.2f}<br>min %{customdata[0]:.2f} / max %{customdata[1]:.2f}'
+                      '<br>%{customdata[2]} reading(s)<extra></extra>'
+    ))
+    return history['tier']
+
 # Health Sensor Charts
 @app.callback(
     Output('heartrate-chart', 'figure'),
@@ -2845,24 +3450,23 @@ def update_heartrate_chart(n, node_data):
         fig = go.Figure()
         fig.update_layout(title={'text': "❤️ Heart Rate - Waiting for data...", 'x': 0.5, 'font': {'color': '#FFFFFF', 'size': 14}}, paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(26,0,0,0.3)', font={'color': '#FFFFFF'}, height=250)
         return fig
-    health_data = data_manager.get_health_data_for_node(node_id) if node_id else data_manager.get_health_data()
+    series = data_manager.get_series_snapshot(node_id, ('ts', 'heartRate'))
     
     fig = go.Figure()
-    if health_data['timestamps'] and health_data['heartRate']:
-        # Filter out None values
-        valid_data = [(t, hr) for t, hr in zip(health_data['timestamps'], health_data['heartRate']) if hr is not None]
-        if valid_data:
-            timestamps, heart_rates = zip(*valid_data)
-            fig.add_trace(go.Scatter(
-                x=timestamps,
-                y=heart_rates,
-                mode='lines+markers',
-                name='Heart Rate',
-                line=dict(color='#e74c3c', width=3),
-                marker=dict(size=6, color='#e74c3c'),
-                fill='tonexty',
-                fillcolor='rgba(231, 76, 60, 0.1)'
-            ))
+    # The channel's own samples; NaN marks a "no reading" (-1) value
+    valid_data = [(t, v) for t, v in zip(series.datetimes(), series.column('heartRate').tolist()) if v == v]
+    if valid_data:
+        timestamps, heart_rates = zip(*valid_data)
+        fig.add_trace(go.Scatter(
+            x=timestamps,
+            y=heart_rates,
+            mode='lines+markers',
+            name='Heart Rate',
+            line=dict(color='#e74c3c', width=3),
+            marker=dict(size=6, color='#e74c3c'),
+            fill='tonexty',
+            fillcolor='rgba(231, 76, 60, 0.1)'
+        ))
     
     fig.update_layout(
         title={
@@ -2897,24 +3501,22 @@ def update_spo2_chart(n, node_data):
         fig = go.Figure()
         fig.update_layout(title={'text': "🫁 SpO2 - Waiting for data...", 'x': 0.5, 'font': {'color': '#FFFFFF', 'size': 14}}, paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(26,0,0,0.3)', font={'color': '#FFFFFF'}, height=300)
         return fig
-    health_data = data_manager.get_health_data_for_node(node_id) if node_id else data_manager.get_health_data()
+    series = data_manager.get_series_snapshot(node_id, ('ts', 'spo2'))
     
     fig = go.Figure()
-    if health_data['timestamps'] and health_data['spo2']:
-        # Filter out None values
-        valid_data = [(t, spo2) for t, spo2 in zip(health_data['timestamps'], health_data['spo2']) if spo2 is not None]
-        if valid_data:
-            timestamps, spo2_values = zip(*valid_data)
-            fig.add_trace(go.Scatter(
-                x=timestamps,
-                y=spo2_values,
-                mode='lines+markers',
-                name='SpO2',
-                line=dict(color='#3498db', width=3),
-                marker=dict(size=6, color='#3498db'),
-                fill='tonexty',
-                fillcolor='rgba(52, 152, 219, 0.1)'
-            ))
+    valid_data = [(t, v) for t, v in zip(series.datetimes(), series.column('spo2').tolist()) if v == v]
+    if valid_data:
+        timestamps, spo2_values = zip(*valid_data)
+        fig.add_trace(go.Scatter(
+            x=timestamps,
+            y=spo2_values,
+            mode='lines+markers',
+            name='SpO2',
+            line=dict(color='#3498db', width=3),
+            marker=dict(size=6, color='#3498db'),
+            fill='tonexty',
+            fillcolor='rgba(52, 152, 219, 0.1)'
+        ))
     
     fig.update_layout(
         title={
@@ -2949,24 +3551,22 @@ def update_temperature_chart(n, node_data):
         fig = go.Figure()
         fig.update_layout(title={'text': "🌡️ Temperature - Waiting for data...", 'x': 0.5, 'font': {'color': '#FFFFFF', 'size': 14}}, paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(26,0,0,0.3)', font={'color': '#FFFFFF'}, height=300)
         return fig
-    env_data = data_manager.get_environmental_data_for_node(node_id) if node_id else data_manager.get_environmental_data()
+    series = data_manager.get_series_snapshot(node_id, ('ts', 'temperature'))
     
     fig = go.Figure()
-    if env_data['timestamps'] and env_data['temperature']:
-        # Filter out None values
-        valid_data = [(t, temp) for t, temp in zip(env_data['timestamps'], env_data['temperature']) if temp is not None]
-        if valid_data:
-            timestamps, temperatures = zip(*valid_data)
-            fig.add_trace(go.Scatter(
-                x=timestamps,
-                y=temperatures,
-                mode='lines+markers',
-                name='Temperature',
-                line=dict(color='#f39c12', width=3),
-                marker=dict(size=6, color='#f39c12'),
-                fill='tonexty',
-                fillcolor='rgba(243, 156, 18, 0.1)'
-            ))
+    valid_data = [(t, v) for t, v in zip(series.datetimes(), series.column('temperature').tolist()) if v == v]
+    if valid_data:
+        timestamps, temperatures = zip(*valid_data)
+        fig.add_trace(go.Scatter(
+            x=timestamps,
+            y=temperatures,
+            mode='lines+markers',
+            name='Temperature',
+            line=dict(color='#f39c12', width=3),
+            marker=dict(size=6, color='#f39c12'),
+            fill='tonexty',
+            fillcolor='rgba(243, 156, 18, 0.1)'
+        ))
     
     fig.update_layout(
         title={
@@ -3001,24 +3601,22 @@ def update_humidity_chart(n, node_data):
         fig = go.Figure()
         fig.update_layout(title={'text': "💧 Humidity - Waiting for data...", 'x': 0.5, 'font': {'color': '#FFFFFF', 'size': 14}}, paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(26,0,0,0.3)', font={'color': '#FFFFFF'}, height=300)
         return fig
-    env_data = data_manager.get_environmental_data_for_node(node_id) if node_id else data_manager.get_environmental_data()
+    series = data_manager.get_series_snapshot(node_id, ('ts', 'humidity'))
     
     fig = go.Figure()
-    if env_data['timestamps'] and env_data['humidity']:
-        # Filter out None values
-        valid_data = [(t, hum) for t, hum in zip(env_data['timestamps'], env_data['humidity']) if hum is not None]
-        if valid_data:
-            timestamps, humidity_values = zip(*valid_data)
-            fig.add_trace(go.Scatter(
-                x=timestamps,
-                y=humidity_values,
-                mode='lines+markers',
-                name='Humidity',
-                line=dict(color='#2980b9', width=3),
-                marker=dict(size=6, color='#2980b9'),
-                fill='tonexty',
-                fillcolor='rgba(41, 128, 185, 0.1)'
-            ))
+    valid_data = [(t, v) for t, v in zip(series.datetimes(), series.column('humidity').tolist()) if v == v]
+    if valid_data:
+        timestamps, humidity_values = zip(*valid_data)
+        fig.add_trace(go.Scatter(
+            x=timestamps,
+            y=humidity_values,
+            mode='lines+markers',
+            name='Humidity',
+            line=dict(color='#2980b9', width=3),
+            marker=dict(size=6, color='#2980b9'),
+            fill='tonexty',
+            fillcolor='rgba(41, 128, 185, 0.1)'
+        ))
     
     fig.update_layout(
         title={
@@ -3053,13 +3651,13 @@ def update_gsr_chart(n, node_data):
         fig = go.Figure()
         fig.update_layout(title={'text': "🖐️ GSR - Waiting for data...", 'x': 0.5, 'font': {'color': '#FFFFFF', 'size': 14}}, paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(26,0,0,0.3)', font={'color': '#FFFFFF'}, height=300)
         return fig
-    health_data = data_manager.get_health_data_for_node(node_id) if node_id else data_manager.get_health_data()
+    series = data_manager.get_series_snapshot(node_id, ('ts', 'GSR'))
     
     fig = go.Figure()
-    if health_data['timestamps'] and health_data['GSR']:
+    if len(series):
         fig.add_trace(go.Scatter(
-            x=list(health_data['timestamps']),
-            y=list(health_data['GSR']),
+            x=series.datetimes(),
+            y=series.values('GSR'),
             mode='lines+markers',
             name='GSR',
             line=dict(color='#27ae60', width=3),
@@ -3288,7 +3886,7 @@ def update_rfid_checkpoint_display(n, node_data):
                 status_info = html.Div([
                     html.Small("PASSED", style={'color': '#00ff88', 'fontWeight': 'bold', 'fontSize': '9px'}),
                     html.Br(),
-                    html.Small(timestamp.strftime('%H:%M:%S') if timestamp else "", 
+                    html.Small(format_clock(timestamp), 
                               style={'color': '#cccccc', 'fontSize': '8px'})
                 ], style={'position': 'absolute', 'top': '70px', 'textAlign': 'center', 'whiteSpace': 'nowrap', 'width': '80px'})
             else:
@@ -3483,10 +4081,12 @@ def monitor_alerts(n, alerts_data, zone_data, node_data):
                 user = 'Unknown'
 
         new_alerts = []
+        # Carried-forward values of channels the helmet stopped sending do not raise alerts
+        now = epoch_now()
 
         # --- HEART RATE MONITORING ---
-        hr = latest.get('heartRate', None)
-        if hr is None:
+        hr = fresh_value(latest, 'heartRate', now)
+        if hr is None and 'heartRate' not in latest:
             try:
                 health = data_manager.get_health_data()
                 if health and health.get('heartRate'):
@@ -3497,14 +4097,15 @@ def monitor_alerts(n, alerts_data, zone_data, node_data):
             except Exception:
                 pass
 
-        if hr is not None and isinstance(hr, (int, float)) and hr > 0 and ((hr >= 10 and hr <= 70) or hr > 100):
-            if hr >= 10 and hr <= 70:
-                issue = f"Abnormal heart rate ({hr} BPM in danger zone 10-70)"
+        if heart_rate_alarm(hr):
+            hr_low, hr_high = HEART_RATE_DANGER_RANGE
+            if hr_low <= hr <= hr_high:
+                issue = f"Abnormal heart rate ({hr} BPM in danger zone {hr_low}-{hr_high})"
             else:
-                issue = f"High heart rate ({hr} BPM > 100)"
+                issue = f"High heart rate ({hr} BPM > {HEART_RATE_HIGH})"
             
             alert_entry = {
-                'ts': datetime.now().isoformat(),
+                'ts': epoch_now(),
                 'type': 'HEART_RATE',
                 'message': issue,
                 'zone': zone,
@@ -3514,8 +4115,8 @@ def monitor_alerts(n, alerts_data, zone_data, node_data):
             new_alerts.append(alert_entry)
 
         # --- TEMPERATURE MONITORING ---
-        temperature = latest.get('temperature', None)
-        if temperature is None:
+        temperature = fresh_value(latest, 'temperature', now)
+        if temperature is None and 'temperature' not in latest:
             try:
                 env_data = data_manager.get_environmental_data()
                 if env_data and env_data.get('temperature'):
@@ -3526,14 +4127,15 @@ def monitor_alerts(n, alerts_data, zone_data, node_data):
             except Exception:
                 pass
 
-        if temperature is not None and isinstance(temperature, (int, float)) and (temperature < 22 or temperature > 28):
-            if temperature < 22:
-                issue = f"Low temperature ({temperature}°C < 22°C)"
+        if temperature_alarm(temperature):
+            temp_low, temp_high = TEMPERATURE_RANGE
+            if temperature < temp_low:
+                issue = f"Low temperature ({temperature}°C < {temp_low}°C)"
             else:
-                issue = f"High temperature ({temperature}°C > 28°C)"
+                issue = f"High temperature ({temperature}°C > {temp_high}°C)"
             
             alert_entry = {
-                'ts': datetime.now().isoformat(),
+                'ts': epoch_now(),
                 'type': 'TEMPERATURE',
                 'message': issue,
                 'zone': zone,
@@ -3543,21 +4145,12 @@ def monitor_alerts(n, alerts_data, zone_data, node_data):
             new_alerts.append(alert_entry)
 
         # --- GAS SENSOR MONITORING ---
-        # Define danger thresholds (PPM)
-        gas_thresholds = {
-            'LPG': 1000,      # Explosive at 2-10%, dangerous at 1000+ ppm
-            'CH4': 5000,      # Explosive at 5-15%, dangerous at 5000+ ppm  
-            'Propane': 1000,  # Explosive at 2-10%, dangerous at 1000+ ppm
-            'Butane': 1000,   # Explosive at 1.5-9%, dangerous at 1000+ ppm
-            'H2': 4000        # Explosive at 4-75%, dangerous at 4000+ ppm
-        }
-
-        # Check each gas sensor
-        for gas_type, threshold in gas_thresholds.items():
-            gas_value = latest.get(gas_type)
-            if gas_value is not None and isinstance(gas_value, (int, float)) and gas_value > threshold:
+        # Danger thresholds (PPM) live in alert_rules so ingest load shedding never drops them
+        for gas_type, threshold in GAS_DANGER_THRESHOLDS.items():
+            gas_value = fresh_value(latest, gas_type, now)
+            if gas_alarm(gas_type, gas_value):
                 alert_entry = {
-                    'ts': datetime.now().isoformat(),
+                    'ts': epoch_now(),
                     'type': 'GAS_DANGER',
                     'message': f"Dangerous {gas_type} levels ({gas_value:.1f} ppm > {threshold} ppm)",
                     'zone': zone,
@@ -3570,15 +4163,15 @@ def monitor_alerts(n, alerts_data, zone_data, node_data):
         for alert_entry in new_alerts:
             # Check for duplicates (same type, node, and recent timestamp)
             is_duplicate = False
-            now = datetime.fromisoformat(alert_entry['ts'])
+            now = alert_entry['ts']
             
             for existing_alert in alerts:
                 try:
-                    existing_ts = datetime.fromisoformat(existing_alert['ts'])
+                    existing_ts = existing_alert['ts']
                     if (existing_alert['type'] == alert_entry['type'] and 
                         existing_alert['node'] == alert_entry['node'] and 
                         existing_alert['message'] == alert_entry['message'] and 
-                        (now - existing_ts).total_seconds() < 30):  # 30 second cooldown
+                        now - existing_ts < 30):  # 30 second cooldown
                         is_duplicate = True
                         break
                 except Exception:
@@ -3586,11 +4179,13 @@ def monitor_alerts(n, alerts_data, zone_data, node_data):
             
             if not is_duplicate:
                 alerts.append(alert_entry)
+                data_manager.record_alert(alert_entry)
                 logging.info(f"🚨 New alert: {alert_entry['type']} - {alert_entry['message']} (User: {user}, Zone: {zone}, Node: {node})")
 
         # Log current monitoring status
         temp_display = f"{temperature}°C" if temperature is not None else "N/A"
-        logging.info(f"Alert monitor: HR={hr}, TEMP={temp_display}, Active alerts={len(alerts)}, New alerts={len(new_alerts)}")
+        hot_log.info('ui.alert_monitor', "Alert monitor: HR=%s, TEMP=%s, Active alerts=%d, New alerts=%d",
+                     hr, temp_display, len(alerts), len(new_alerts))
 
         return alerts
         
@@ -3634,7 +4229,7 @@ def render_alerts(alerts_data, clear_clicks):
         for a in list(reversed(alerts_list))[:10]:  # Get last 10, most recent first
             ts = a.get('ts')
             try:
-                ts_fmt = datetime.fromisoformat(ts).strftime('%H:%M:%S')
+                ts_fmt = format_clock(ts)
             except Exception:
                 ts_fmt = ts
             rows.append(html.Div([
@@ -3675,7 +4270,7 @@ def render_landing_alerts(alerts_data, clear_clicks):
         for a in reversed(recent_alerts):
             ts = a.get('ts')
             try:
-                ts_fmt = datetime.fromisoformat(ts).strftime('%H:%M:%S')
+                ts_fmt = format_clock(ts)
             except Exception:
                 ts_fmt = ts
             
@@ -3718,13 +4313,13 @@ def render_landing_alerts(alerts_data, clear_clicks):
 )
 def update_live_pills(_n):
     try:
-        now = datetime.now()
+        now = epoch_now()
 
         # Helper to build a pill with a colored dot and label
         def pill(label, is_live, last_ts):
             color = '#19c37d' if is_live else '#6b6b6b'
             bg = 'rgba(25,195,125,0.15)' if is_live else 'rgba(255,255,255,0.08)'
-            ts_str = last_ts.strftime('%H:%M:%S') if last_ts else '—'
+            ts_str = format_clock(last_ts, default='—')
             return html.Div([
                 html.Span('', style={
                     'display':'inline-block','width':'10px','height':'10px','borderRadius':'50%','backgroundColor':color,
@@ -3743,8 +4338,7 @@ def update_live_pills(_n):
         except Exception:
             rfid_ts = None
         try:
-            gts = data_manager.data['gas_sensors']['timestamps']
-            gas_ts = gts[-1] if len(gts) else None
+            gas_ts = data_manager.fleet.last_timestamp()
         except Exception:
             gas_ts = None
 
@@ -3752,8 +4346,7 @@ def update_live_pills(_n):
         def is_live(ts):
             if not ts:
                 return False
-            age = (now - ts).total_seconds()
-            return age <= 5 and mqtt_client.connected
+            return now - ts <= 5 and mqtt_client.connected
 
         rfid_live = is_live(rfid_ts)
         gas_live = is_live(gas_ts)
@@ -3810,4 +4403,6 @@ if __name__ == '__main__':
         mqtt_client.disconnect()
     except Exception as e:
         print(f"❌ Error starting dashboard: {e}")
-        mqtt_client.disconnect()
\ No newline at end of file
+        mqtt_client.disconnect()
+    finally:
+        data_manager.close()
\ No newline at end of file
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Mine Armour - MQTT Protocol Options
+Builds paho clients for MQTT v3.1.1 (default) or, with MQTT_PROTOCOL=5, MQTT v5 with
+receive-maximum flow control, session expiry and topic aliases. Works with paho-mqtt
+v1.x and v2.x (manual QoS1 acks need v2.x).
+"""
+
+import os
+import logging
+
+import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+
+class MqttOptions:
+    """Protocol version and v5 connection properties, usually read from .env"""
+
+    def __init__(self, protocol=mqtt.MQTTv311, receive_maximum=None, session_expiry=3600,
+                 topic_alias_maximum=16):
+        self.protocol = protocol
+        self.receive_maximum = receive_maximum
+        self.session_expiry = session_expiry
+        self.topic_alias_maximum = topic_alias_maximum
+
+    @classmethod
+    def from_env(cls, receive_maximum=None):
+        """receive_maximum is the caller's default; MQTT_RECEIVE_MAXIMUM overrides it"""
+        version = os.getenv("MQTT_PROTOCOL", "3.1.1").strip().lower()
+        protocol = mqtt.MQTTv5 if version in ("5", "5.0", "v5", "mqttv5") else mqtt.MQTTv311
+        if os.getenv("MQTT_RECEIVE_MAXIMUM"):
+            receive_maximum = int(os.getenv("MQTT_RECEIVE_MAXIMUM"))
+        return cls(
+            protocol=protocol,
+            receive_maximum=receive_maximum,
+            session_expiry=int(os.getenv("MQTT_SESSION_EXPIRY", "3600")),
+            topic_alias_maximum=int(os.getenv("MQTT_TOPIC_ALIAS_MAXIMUM", "16")),
+        )
+
+    @property
+    def is_v5(self):
+        return self.protocol == mqtt.MQTTv5
+
+    @property
+    def subscribe_qos(self):
+        """QoS1 under v5 so receive-maximum and session queueing apply; v3.1.1 keeps QoS0"""
+        return 1 if self.is_v5 else 0
+
+    @property
+    def manual_ack(self):
+        """True when QoS1 deliveries can be acked after storage (v5 subscriptions on paho >= 2.0)"""
+        return self.is_v5 and hasattr(mqtt.Client, 'manual_ack_set')
+
+    def create_client(self, client_id, manual_ack=False):
+        """paho client using the v1 callback signatures on both paho v1.x and v2.x.
+
+        With manual_ack (and self.manual_ack) paho no longer acks QoS1 deliveries when
+        on_message returns; the caller acks them with client.ack(mid, qos)."""
+        CallbackAPIVersion = getattr(mqtt, "CallbackAPIVersion", None)
+        if CallbackAPIVersion is not None:
+            client = mqtt.Client(client_id=client_id, protocol=self.protocol,
+                                 callback_api_version=CallbackAPIVersion.VERSION1)
+        else:
+            client = mqtt.Client(client_id=client_id, protocol=self.protocol)
+        if manual_ack:
+            if self.manual_ack:
+                client.manual_ack_set(True)
+            elif self.is_v5:
+                logging.warning("⚠ paho-mqtt < 2.0: QoS1 messages are acked on receipt, before they are stored")
+        return client
+
+    def connect_kwargs(self, resume_session=False):
+        """Extra keyword arguments for client.connect()/connect_async() (empty for v3.1.1).
+
+        With resume_session the very first connect already resumes a stored session
+        (only useful with a stable client id); otherwise the first connect starts clean
+        and every reconnect resumes the session so queued messages are delivered.
+        """
+        if not self.is_v5:
+            return {}
+        properties = Properties(PacketTypes.CONNECT)
+        properties.SessionExpiryInterval = self.session_expiry
+        if self.receive_maximum:
+            properties.ReceiveMaximum = max(1, min(65535, int(self.receive_maximum)))
+        if self.topic_alias_maximum:
+            properties.TopicAliasMaximum = min(65535, int(self.topic_alias_maximum))
+        clean_start = False if resume_session else mqtt.MQTT_CLEAN_START_FIRST_ONLY
+        return {'clean_start': clean_start, 'properties': properties}
+
+
+class TopicAliasResolver:
+    """Maps inbound v5 topic aliases back to topic names (paho leaves message.topic empty)"""
+
+    def __init__(self):
+        self._topics = {}
+
+    def reset(self):
+        """Aliases only live for one network connection; call from on_connect"""
+        self._topics = {}
+
+    def topic(self, message):
+        """Topic of a received message, or None for an alias this connection never defined"""
+        topic = message.topic
+        properties = getattr(message, 'properties', None)
+        alias = getattr(properties, 'TopicAlias', None) if properties is not None else None
+        if alias is None:
+            return topic
+        if topic:
+            self._topics[alias] = topic
+            return topic
+        return self._topics.get(alias)
+
+
+class TopicAliasPublisher:
+    """Publishes through v5 topic aliases: the full topic once per connection, then only the alias"""
+
+    def __init__(self, client, options):
+        self.client = client
+        self.options = options
+        self._limit = 0
+        self._aliases = {}
+        self._empty_topic = True   # paho < 2.0 rejects the empty topic an aliased publish needs
+
+    def reset(self, properties=None):
+        """Call from on_connect with the CONNACK properties (TopicAliasMaximum of the server)"""
+        server_maximum = getattr(properties, 'TopicAliasMaximum', 0) if properties is not None else 0
+        self._limit = min(server_maximum, self.options.topic_alias_maximum) if self.options.is_v5 else 0
+        self._aliases = {}
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        if not self._limit:
+            return self.client.publish(topic, payload, qos=qos, retain=retain)
+        alias = self._aliases.get(topic)
+        properties = Properties(PacketTypes.PUBLISH)
+        if alias is None:
+            if len(self._aliases) >= self._limit:
+                return self.client.publish(topic, payload, qos=qos, retain=retain)
+            alias = self._aliases[topic] = len(self._aliases) + 1
+            properties.TopicAlias = alias
+            return self.client.publish(topic, payload, qos=qos, retain=retain, properties=properties)
+
+        properties.TopicAlias = alias
+        if self._empty_topic:
+            try:
+                return self.client.publish('', payload, qos=qos, retain=retain, properties=properties)
+            except ValueError:
+                self._empty_topic = False
+        return self.client.publish(topic, payload, qos=qos, retain=retain, properties=properties)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Mine Armour - Node Registry
+Tracks every helmet node the dashboard has heard from. Nodes are registered on
+their first message, looked up through an id -> slot index, get their series
+buffers only once data arrives, and are evicted after a long idle period.
+Configured nodes are pinned and never evicted. Each node's buffers are guarded
+by one of a fixed set of striped locks, so writers of one node never block
+readers of another.
+"""
+
+import os
+import time
+import threading
+from collections.abc import Mapping
+
+
+class NodeRegistry(Mapping):
+    """id -> per-node storage dict ({'series', 'has_data', 'name', ...}), slot-indexed.
+
+    Behaves as a read-only mapping so existing per_node_data.get(node_id, {}) lookups
+    keep working. Registration and eviction take the registry's own lock; a node's
+    series is read and written under lock_for(node_id).
+    """
+
+    def __init__(self, series_factory, idle_timeout=3600.0, eviction_interval=60.0, stripes=64):
+        self._series_factory = series_factory
+        self.idle_timeout = idle_timeout
+        self.eviction_interval = eviction_interval
+        self._lock = threading.Lock()
+        self._stripes = [threading.Lock() for _ in range(max(1, stripes))]
+        self._slots = []     # slot -> storage dict, or None once evicted
+        self._index = {}     # node_id -> slot
+        self._free = []      # evicted slots available for reuse
+        self._last_eviction = time.monotonic()
+        self._evicted = 0
+
+    @classmethod
+    def from_env(cls, series_factory):
+        """NODE_IDLE_TIMEOUT (seconds without data before an auto-registered node is evicted, 0 = never)
+        and NODE_LOCK_STRIPES"""
+        return cls(
+            series_factory,
+            idle_timeout=float(os.getenv("NODE_IDLE_TIMEOUT", "3600")),
+            stripes=int(os.getenv("NODE_LOCK_STRIPES", "64")),
+        )
+
+    # Mapping interface
+    def __getitem__(self, node_id):
+        return self._slots[self._index[node_id]]
+
+    def __iter__(self):
+        return iter(list(self._index))
+
+    def __len__(self):
+        return len(self._index)
+
+    def lock_for(self, node_id):
+        """Striped lock guarding a node's series (nodes in the same stripe share it)"""
+        slot = self._index.get(node_id)
+        return self._stripes[(slot or 0) % len(self._stripes)]
+
+    def register(self, node_id, name=None, zone=None, pinned=False):
+        """Add a node (no-op if known); returns its storage dict. Buffers are allocated on first data."""
+        slot = self._index.get(node_id)
+        if slot is not None:
+            return self._slots[slot]
+        with self._lock:
+            return self._register(node_id, name, zone, pinned)
+
+    def _register(self, node_id, name, zone, pinned):
+        slot = self._index.get(node_id)
+        if slot is not None:
+            return self._slots[slot]
+        storage = {
+            'id': node_id,
+            'name': name or node_id,
+            'zone': zone,            # None = listed in every zone
+            'pinned': pinned,
+            'series': None,
+            'has_data': False,       # Track if any data has been received for this node
+            'last_seen': time.monotonic(),
+        }
+        if self._free:
+            slot = self._free.pop()
+            self._slots[slot] = storage
+        else:
+            slot = len(self._slots)
+            self._slots.append(storage)
+        storage['slot'] = slot
+        self._index[node_id] = slot
+        return storage
+
+    def series_for(self, node_id, name=None, zone=None):
+        """Storage for a node receiving data: registers it and allocates its buffers if needed"""
+        storage = self.register(node_id, name=name, zone=zone)
+        if storage['series'] is None:
+            with self._lock:
+                if storage['series'] is None:
+                    storage['series'] = self._series_factory()
+        storage['last_seen'] = time.monotonic()
+        return storage
+
+    def evict_idle(self, now=None):
+        """Drop unpinned nodes idle for longer than idle_timeout; returns the evicted ids"""
+        now = time.monotonic() if now is None else now
+        self._last_eviction = now
+        if self.idle_timeout <= 0:
+            return []
+        with self._lock:
+            evicted = [
+                s['id'] for s in self._slots
+                if s is not None and not s['pinned'] and now - s['last_seen'] > self.idle_timeout
+            ]
+            for node_id in evicted:
+                slot = self._index.pop(node_id)
+                self._slots[slot] = None
+                self._free.append(slot)
+            self._evicted += len(evicted)
+        return evicted
+
+    def maybe_evict(self):
+        """evict_idle() at most once per eviction_interval (cheap enough for the ingest path)"""
+        now = time.monotonic()
+        if now - self._last_eviction < self.eviction_interval:
+            return []
+        return self.evict_idle(now)
+
+    def nodes(self, zone=None):
+        """Registered nodes in slot order, optionally only those listed in `zone`"""
+        with self._lock:
+            return [
+                s for s in self._slots
+                if s is not None and (zone is None or s['zone'] is None or s['zone'] == zone)
+            ]
+
+    def page(self, zone=None, page=0, page_size=12):
+        """(nodes on page, clamped page number, page count)"""
+        nodes = self.nodes(zone)
+        pages = max(1, -(-len(nodes) // page_size))
+        page = min(max(page, 0), pages - 1)
+        return nodes[page * page_size:(page + 1) * page_size], page, pages
+
+    def stats(self):
+        with self._lock:
+            return {
+                'nodes': len(self._index),
+                'with_buffers': sum(1 for s in self._slots if s is not None and s['series'] is not None),
+                'pinned': sum(1 for s in self._slots if s is not None and s['pinned']),
+                'evicted': self._evicted,
+                'idle_timeout_s': self.idle_timeout,
+                'lock_stripes': len(self._stripes),
+            }
@@ -0,0 +1,539 @@
+#!/usr/bin/env python3
+"""
+Mine Armour - Columnar Node Series
+Ring buffers for one node: each channel only gets samples for the readings that
+carried it, and channels that arrive together share one timestamp lane (epoch
+seconds / float64 values in one array('d') per ring, split only when the channels
+diverge). The live window of each channel is always contiguous, so readers get
+zero-copy memoryview / numpy views instead of per-sample Python objects. Readers
+work on immutable, versioned snapshots that are shared until the series changes.
+History is kept either by count or by duration (Retention), with a hard cap on
+samples per ring.
+"""
+
+import os
+import math
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+from types import MappingProxyType
+
+from sensor_codec import ALL_PRESENT, SENSOR_SLOTS
+
+try:
+    import numpy as _np
+except ImportError:
+    _np = None
+
+# Channels, in SensorReading slot order (slot 0 is the timestamp)
+CHANNELS = (
+    'ts', 'LPG', 'CH4', 'Propane', 'Butane', 'H2', 'heartRate', 'spo2',
+    'GSR', 'stress', 'temperature', 'humidity', 'lat', 'lon', 'alt', 'sat',
+)
+CHANNEL_INDEX = {name: idx for idx, name in enumerate(CHANNELS)}
+
+# Vitals that use -1 for "no reading"; stored as NaN, handed to legacy callers as None
+MISSING_AS_NAN = ('heartRate', 'spo2', 'temperature', 'humidity')
+_NAN_LANES = frozenset(CHANNEL_INDEX[name] for name in MISSING_AS_NAN)
+_INT_CHANNELS = frozenset(('stress', 'sat'))
+
+# Dashboard data sections and the channels each one plots
+SECTIONS = {
+    'gas_sensors': ('LPG', 'CH4', 'Propane', 'Butane', 'H2'),
+    'health_sensors': ('heartRate', 'spo2', 'GSR', 'stress'),
+    'environmental_sensors': ('temperature', 'humidity'),
+    'gps_data': ('lat', 'lon', 'alt', 'sat'),
+}
+
+_NAN = math.nan
+
+
+def _to_nan(values):
+    return [_NAN if v == -1 else v for v in values]
+
+
+class Retention:
+    """How long each channel's history is kept, relative to the node's newest reading.
+
+    `seconds` applies to every channel unless overridden in `per_channel`; `max_bytes`
+    is the hard cap on a node's buffers (a channel keeps fewer seconds than its retention
+    when hit).
+    """
+
+    def __init__(self, seconds=600.0, per_channel=None, max_bytes=4 * 1024 * 1024):
+        self.seconds = float(seconds)
+        self.per_channel = {name: float(s) for name, s in (per_channel or {}).items()}
+        unknown = set(self.per_channel) - set(CHANNELS)
+        if unknown:
+            raise ValueError(f"Unknown channel(s) in retention: {', '.join(sorted(unknown))}")
+        self.max_bytes = max_bytes
+        self.longest = max([self.seconds] + list(self.per_channel.values()))
+
+    @classmethod
+    def from_env(cls):
+        """SERIES_RETENTION seconds, SERIES_CHANNEL_RETENTION="lat:300,lon:300" overrides and
+        SERIES_MAX_BYTES per node"""
+        per_channel = {}
+        for entry in os.getenv("SERIES_CHANNEL_RETENTION", "").split(','):
+            if ':' in entry:
+                name, seconds = entry.split(':', 1)
+                per_channel[name.strip()] = float(seconds)
+        return cls(
+            seconds=float(os.getenv("SERIES_RETENTION", "600")),
+            per_channel=per_channel,
+            max_bytes=int(os.getenv("SERIES_MAX_BYTES", str(4 * 1024 * 1024))),
+        )
+
+    def window(self, name):
+        return self.per_channel.get(name, self.seconds)
+
+    @property
+    def max_points(self):
+        """Samples per ring that fit max_bytes even if every channel ends up in a ring of its
+        own (16 bytes per sample: timestamp and value)"""
+        return max(1, self.max_bytes // (16 * (len(CHANNELS) - 1)))
+
+
+class _ChannelRing:
+    """Samples of channels that arrive together: one shared timestamp lane and one value
+    lane per channel, `span` each, in one array('d')"""
+
+    __slots__ = ('slots', 'mask', 'lane', 'slab', 'span', 'points', 'start', 'end')
+
+    def __init__(self, slots, points, span):
+        self.slots = slots        # SensorReading slots of the channels, ascending
+        self.mask = sum(1 << slot for slot in slots)
+        self.lane = {slot: idx + 1 for idx, slot in enumerate(slots)}   # lane 0 holds the timestamps
+        self.slab = array('d', bytes(8 * span * (len(slots) + 1)))
+        self.span = span
+        self.points = points      # window the slab is sized for
+        self.start = 0
+        self.end = 0
+
+    def __len__(self):
+        return self.end - self.start
+
+
+class NodeSeries:
+    """Recent readings of one node, stored per channel: a channel only gets a sample when
+    the reading carried that field, so gas-only messages never pad the vitals or GPS lanes.
+
+    Channels that arrive in the same readings share one ring and one timestamp lane; a
+    ring is split (its timestamps copied once) only when a reading carries some of its
+    channels but not the others, and a channel's ring is allocated on its first sample.
+
+    Without a Retention each ring keeps its last `capacity` samples. With one, samples
+    older than the channel's window (measured from the node's newest reading) are expired
+    with one binary search per ring per append, and `capacity` (retention.max_points)
+    is only the per-ring hard cap; rings start small and double as needed up to it.
+
+    Appends write past a ring's window end; when it runs out of room the live window is
+    moved back to the start in one bulk copy per lane, so windows never wrap. Timestamps
+    are expected in order. Not thread-safe: the caller holds the store lock for appends
+    and for any live view().
+    """
+
+    def __init__(self, capacity=100, slack=None, retention=None):
+        self.retention = retention
+        if retention is not None:
+            capacity = retention.max_points
+        self.capacity = capacity
+        self._slack = slack
+        self._initial = capacity if retention is None else min(capacity, 32)
+        self._rings = {}          # slot -> _ChannelRing holding the channel
+        self._groups = []         # distinct rings
+        self._seen = 0            # mask of the slots that have a ring
+        self._newest = None       # epoch seconds of the newest reading on any channel
+        self._capped = 0          # samples dropped by the hard cap while still inside retention
+        self.latest = None        # newest reading as a dict (epoch timestamp); each field is its last received value,
+                                  # 'channel_ts' maps each field to when that value was received
+        self.gps_latest = None
+        self.version = 0          # bumped on every append
+        self._snapshots = {}      # channels -> SeriesSnapshot of the current version
+
+    def _span_for(self, points):
+        return points + (self._slack if self._slack is not None else max(16, points // 4))
+
+    def __len__(self):
+        return max((len(ring) for ring in self._groups), default=0)
+
+    def count(self, name):
+        ring = self._rings.get(CHANNEL_INDEX[name])
+        return len(ring) if ring is not None else 0
+
+    @property
+    def nbytes(self):
+        return sum(ring.slab.itemsize * len(ring.slab) for ring in self._groups)
+
+    def _window_of(self, ring):
+        return self.retention.window(CHANNELS[ring.slots[0]]) if self.retention is not None else None
+
+    def _add_ring(self, ring):
+        self._groups.append(ring)
+        for slot in ring.slots:
+            self._rings[slot] = ring
+        self._seen |= ring.mask
+
+    def _fit(self, mask):
+        """Make every ring either fully carried by `mask` or not at all, and start rings
+        for the channels it carries for the first time (one per retention window)"""
+        for ring in list(self._groups):
+            inside = ring.mask & mask
+            if inside and inside != ring.mask:
+                self._split(ring, inside)
+        new = mask & ~self._seen
+        if new:
+            by_window = {}
+            for slot in SENSOR_SLOTS:
+                if new >> slot & 1:
+                    window = self.retention.window(CHANNELS[slot]) if self.retention is not None else None
+                    by_window.setdefault(window, []).append(slot)
+            for slots in by_window.values():
+                self._add_ring(_ChannelRing(tuple(slots), self._initial, self._span_for(self._initial)))
+
+    def _split(self, ring, inside):
+        """Replace a ring by one for its channels in `inside` and one for the rest"""
+        self._groups.remove(ring)
+        live = len(ring)
+        for part in (inside, ring.mask & ~inside):
+            piece = _ChannelRing(tuple(slot for slot in ring.slots if part >> slot & 1), ring.points, ring.span)
+            lanes = [0] + [ring.lane[slot] for slot in piece.slots]
+            for dest, src in enumerate(lanes):
+                base = src * ring.span + ring.start
+                piece.slab[dest * piece.span:dest * piece.span + live] = ring.slab[base:base + live]
+            piece.end = live
+            self._add_ring(piece)
+
+    def append_rows(self, rows, epochs=None):
+        """Bulk-append SensorReading rows (one slice write per lane of each ring they
+        carry); epochs are the rows' epoch-second timestamps (defaults to the rows' own)"""
+        if len(rows) > self.capacity:
+            rows = rows[-self.capacity:]
+            if epochs is not None:
+                epochs = epochs[-self.capacity:]
+        n = len(rows)
+        if not n:
+            return
+        columns = list(zip(*rows))
+        epochs = epochs if epochs is not None else columns[0]
+        newest = max(epochs)
+        if self._newest is not None and self._newest > newest:
+            newest = self._newest
+        self._newest = newest
+
+        masks = columns[-1]
+        distinct = set(masks)
+        shared = None
+        if len(distinct) == 1:
+            # Usual case: every row of the batch carries the same fields
+            shared = distinct.pop()
+            shared = ALL_PRESENT if shared is None else shared
+            self._fit(shared)
+        else:
+            masks = [ALL_PRESENT if m is None else m for m in masks]
+            for mask in set(masks):
+                self._fit(mask)
+
+        received = {}       # slot -> (value, epoch) of its newest sample in this batch
+        for ring in self._groups:
+            if shared is not None:
+                picked = None
+                ts = epochs if shared & ring.mask else ()
+            else:
+                picked = [i for i, m in enumerate(masks) if m & ring.mask]
+                ts = [epochs[i] for i in picked]
+            lanes = []
+            if ts:
+                for slot in ring.slots:
+                    values = columns[slot] if picked is None else [columns[slot][i] for i in picked]
+                    received[slot] = (values[-1], ts[-1])
+                    lanes.append(_to_nan(values) if slot in _NAN_LANES else values)
+            window = self._window_of(ring)
+            self._append(ring, ts, lanes, newest - window if window is not None else None)
+
+        latest = rows[-1]._asdict()
+        del latest['present']
+        prev = self.latest
+        prev_ts = prev.get('channel_ts', {}) if prev is not None else {}
+        channel_ts = {}     # channel -> epoch of its own newest sample (values are carried forward)
+        for slot in SENSOR_SLOTS:
+            name = CHANNELS[slot]
+            got = received.get(slot)
+            if got is not None:
+                latest[name], channel_ts[name] = got
+            elif prev is not None:
+                latest[name] = prev[name]
+                if name in prev_ts:
+                    channel_ts[name] = prev_ts[name]
+
+        latest['channel_ts'] = channel_ts
+        self.latest = MappingProxyType(latest)
+        self.gps_latest = MappingProxyType({'lat': latest['lat'], 'lon': latest['lon'],
+                                            'alt': latest['alt'], 'sat': latest['sat']})
+        self.version += 1
+
+    def _append(self, ring, ts, lanes, cutoff):
+        n = len(ts)
+        start, end = ring.start, ring.end
+        if cutoff is not None:
+            # Batch expiry: one binary search on the ring's timestamp lane
+            start = bisect_left(ring.slab, cutoff, start, end)
+            if end + n > ring.span and ring.points < self.capacity:
+                self._grow(ring, end - start + n, start, end)
+                start, end = 0, end - start
+        if not n:
+            ring.start = start
+            return
+        slab, span = ring.slab, ring.span
+
+        if end + n > span:
+            keep = min(end - start, self.capacity - n)
+            if self.retention is not None:
+                self._capped += end - start - keep
+            for base in range(0, len(slab), span):
+                slab[base:base + keep] = slab[base + end - keep:base + end]
+            start, end = 0, keep
+
+        slab[end:end + n] = array('d', ts)
+        for lane, values in enumerate(lanes, 1):
+            base = lane * span + end
+            slab[base:base + n] = array('d', values)
+        end += n
+        ring.end = end
+        ring.start = max(start, end - self.capacity)
+        if self.retention is not None:
+            self._capped += ring.start - start
+
+    def _grow(self, ring, needed, start, end):
+        """Move a ring's live window into a larger slab (doubling, up to the hard cap)"""
+        points = min(max(2 * ring.points, needed), self.capacity)
+        span = self._span_for(points)
+        lanes = len(ring.slots) + 1
+        slab = array('d', bytes(8 * span * lanes))
+        live = end - start
+        for lane in range(lanes):
+            slab[lane * span:lane * span + live] = ring.slab[lane * ring.span + start:lane * ring.span + end]
+        ring.slab, ring.span, ring.points = slab, span, points
+
+    def view(self, name):
+        """Zero-copy view of one channel's live values (only valid while the lock is held)"""
+        slot = CHANNEL_INDEX[name]
+        ring = self._rings.get(slot)
+        if ring is None:
+            return _as_view(array('d'), 0, 0)
+        base = ring.lane[slot] * ring.span
+        return _as_view(ring.slab, base + ring.start, base + ring.end)
+
+    def times(self, name):
+        """Zero-copy view of one channel's sample timestamps (epoch seconds, lock held)"""
+        ring = self._rings.get(CHANNEL_INDEX[name])
+        if ring is None:
+            return _as_view(array('d'), 0, 0)
+        return _as_view(ring.slab, ring.start, ring.end)
+
+    def window(self):
+        """Effective history window: samples and seconds covered per channel, and whether
+        the hard cap (not the retention) is what limits it"""
+        channels = {}
+        for slot, ring in sorted(self._rings.items()):
+            points = len(ring)
+            covered = ring.slab[ring.end - 1] - ring.slab[ring.start] if points > 1 else 0.0
+            channels[CHANNELS[slot]] = {
+                'points': points,
+                'seconds': covered,
+                'rate_hz': (points - 1) / covered if covered > 0 else 0.0,
+            }
+        if self.retention is None:
+            capped = any(len(ring) >= self.capacity for ring in self._rings.values())
+        else:
+            capped = self._capped > 0 and any(
+                info['seconds'] < self.retention.window(name) for name, info in channels.items())
+        return {
+            'points': max((info['points'] for info in channels.values()), default=0),
+            'seconds': max((info['seconds'] for info in channels.values()), default=0.0),
+            'retention_s': self.retention.longest if self.retention is not None else None,
+            'capped': capped,
+            'rings': len(self._groups),
+            'capped_readings': self._capped,
+            'bytes': self.nbytes,
+            'channels': channels,
+        }
+
+    def state(self):
+        """Copy of the live windows and latest values for a warm-restart snapshot (lock held)"""
+        # Channels of one ring repeat its timestamp lane; the snapshot file stores it once
+        return {
+            'channels': {CHANNELS[slot]: (ring.slab[ring.start:ring.end],
+                                          ring.slab[ring.lane[slot] * ring.span + ring.start:
+                                                    ring.lane[slot] * ring.span + ring.end])
+                         for slot, ring in self._rings.items()},
+            'newest': self._newest,
+            'capped': self._capped,
+            'latest': dict(self.latest) if self.latest is not None else None,
+        }
+
+    def restore(self, state):
+        """Replace the contents with a state() copy, applying this series' capacity and retention"""
+        self._rings = {}
+        self._groups = []
+        self._seen = 0
+        self._newest = state['newest']
+        self._capped = state['capped']
+        # Channels with the same timestamps (and retention window) share a ring again
+        groups = {}
+        for name, (ts, values) in state['channels'].items():
+            if not len(values):
+                continue
+            window = self.retention.window(name) if self.retention is not None else None
+            groups.setdefault((array('d', ts).tobytes(), window), []).append(name)
+        for (_, window), names in groups.items():
+            names.sort(key=CHANNEL_INDEX.get)
+            ts = state['channels'][names[0]][0]
+            ring = _ChannelRing(tuple(CHANNEL_INDEX[name] for name in names), self._initial,
+                                self._span_for(self._initial))
+            self._add_ring(ring)
+            self._append(ring, ts[-self.capacity:], [state['channels'][name][1][-self.capacity:] for name in names],
+                         self._newest - window if window is not None else None)
+        latest = state['latest']
+        self.latest = MappingProxyType(latest) if latest is not None else None
+        self.gps_latest = MappingProxyType({k: latest[k] for k in ('lat', 'lon', 'alt', 'sat')}) \
+            if latest is not None else None
+        self._snapshots = {}
+        self.version += 1
+
+    def last_timestamp(self):
+        """Epoch seconds of the newest reading on any channel (None before the first)"""
+        return self._newest
+
+    def cached_snapshot(self, channels=CHANNELS):
+        """The snapshot of `channels` if it is still current, else None (safe without the lock)"""
+        snap = self._snapshots.get(channels)
+        if snap is not None and snap.version == self.version:
+            return snap
+        return None
+
+    def snapshot(self, channels=CHANNELS):
+        """Immutable copy of the given channels' live windows (call with the lock held).
+
+        'ts' in `channels` is accepted for the older (ts, channel) call shape; each channel
+        carries its own timestamps. Reused for every caller until the next append."""
+        snap = self.cached_snapshot(channels)
+        if snap is not None:
+            return snap
+        data = array('d')
+        lanes = {}
+        ts_offsets = {}     # ring -> offset of its timestamps, copied once per snapshot
+        for name in channels:
+            if name == 'ts':
+                continue
+            slot = CHANNEL_INDEX[name]
+            ring = self._rings.get(slot)
+            if ring is None:
+                lanes[name] = (len(data), 0, len(data))
+                continue
+            raw = memoryview(ring.slab)
+            ts_off = ts_offsets.get(id(ring))
+            if ts_off is None:
+                ts_off = ts_offsets[id(ring)] = len(data)
+                data.extend(raw[ring.start:ring.end])
+            base = ring.lane[slot] * ring.span
+            lanes[name] = (ts_off, len(ring), len(data))
+            data.extend(raw[base + ring.start:base + ring.end])
+        snap = SeriesSnapshot(data, lanes, self.latest, self.gps_latest, self.version)
+        self._snapshots[channels] = snap
+        return snap
+
+
+class SeriesSnapshot:
+    """Immutable copy of some channels of a NodeSeries at one version. Each channel has
+    its own timestamps; columns are read-only views into one contiguous array, so
+    snapshots can be shared between callers and threads"""
+
+    __slots__ = ('_data', '_lanes', 'length', 'latest', 'gps_latest', 'version', '_memo')
+
+    def __init__(self, data, lanes, latest, gps_latest, version=0):
+        self._data = data
+        self._lanes = lanes       # channel -> (offset of its timestamps, sample count, offset of its values)
+        self.length = max((count for _, count, _ in lanes.values()), default=0)
+        self.latest = latest
+        self.gps_latest = gps_latest
+        self.version = version
+        self._memo = {}   # derived values (datetimes, legacy sections) computed once per snapshot
+
+    def __len__(self):
+        return self.length
+
+    def _first(self):
+        return next(iter(self._lanes))
+
+    def count(self, name):
+        return self._lanes[name][1]
+
+    def times(self, name=None):
+        """Read-only epoch-second timestamps of one channel (default: the first channel)"""
+        off, count, _ = self._lanes[name or self._first()]
+        return _as_view(self._data, off, off + count, readonly=True)
+
+    def column(self, name):
+        """Read-only numpy view when numpy is installed, else a read-only memoryview of float64.
+
+        'ts' is the first channel's timestamps (the (ts, channel) snapshot shape)."""
+        if name == 'ts':
+            return self.times()
+        _, count, off = self._lanes[name]
+        return _as_view(self._data, off, off + count, readonly=True)
+
+    def values(self, name):
+        """Plot-ready channel values: the numpy view, or a list when numpy is unavailable"""
+        col = self.column(name)
+        return col if _np is not None else col.tolist()
+
+    def datetimes(self, name=None):
+        """Naive local-time timestamps of one channel (default: the first channel), as a
+        read-only datetime64 array with numpy, else a tuple of datetimes"""
+        name = name or self._first()
+        key = ('datetimes', name)
+        memo = self._memo.get(key)
+        if memo is not None:
+            return memo
+        ts = self.times(name)
+        if _np is not None and len(ts):
+            utc_offset = datetime.fromtimestamp(ts[-1]).astimezone().utcoffset().total_seconds()
+            memo = ((ts + utc_offset) * 1e6).astype('datetime64[us]')
+            memo.flags.writeable = False
+        else:
+            memo = tuple(datetime.fromtimestamp(t) for t in ts.tolist())
+        self._memo[key] = memo
+        return memo
+
+    def section(self, section):
+        """Legacy dict-of-sequences shape of one dashboard section.
+
+        The section's channels are aligned on the union of their timestamps, with None
+        where a channel has no sample (and for missing vitals). Values are tuples shared
+        by every caller of this snapshot; the dict itself is fresh."""
+        key = ('section', section)
+        memo = self._memo.get(key)
+        if memo is None:
+            names = SECTIONS[section]
+            times = sorted(set().union(*(self.times(name).tolist() for name in names)))
+            index = {t: i for i, t in enumerate(times)}
+            memo = {'timestamps': tuple(datetime.fromtimestamp(t) for t in times)}
+            for name in names:
+                aligned = [None] * len(times)
+                for t, v in zip(self.times(name).tolist(), self.column(name).tolist()):
+                    if v == v:
+                        aligned[index[t]] = int(v) if name in _INT_CHANNELS else v
+                memo[name] = tuple(aligned)
+            self._memo[key] = memo
+        return dict(memo)
+
+
+def _as_view(buf, start, end, readonly=False):
+    if _np is not None:
+        view = _np.frombuffer(buf, dtype=_np.float64, count=end - start, offset=start * 8)
+        if readonly:
+            view.flags.writeable = False
+        return view
+    view = memoryview(buf)[start:end]
+    return view.toreadonly() if readonly else view
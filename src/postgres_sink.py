@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Mine Armour - PostgreSQL History Sink
+Ships sensor readings, RFID scans and alerts to PostgreSQL for fleet-wide history.
+Ingest only appends rows to in-memory buffers; flusher threads drain them with
+COPY FROM STDIN over a small connection pool. When the database lags, the buffer
+is bounded: the oldest readings are shed (RFID scans and alerts are always kept)
+so ingest never blocks on the database.
+"""
+
+import io
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timezone
+
+try:
+    import psycopg2
+    from psycopg2 import pool as _pg_pool
+except ImportError:
+    psycopg2 = None
+
+from clock import epoch_now
+from hot_log import hot_log
+from sensor_codec import SensorReading, sparse_values
+
+# Sensor fields a payload did not carry are stored as NULL
+_READING_COLUMNS = ('node_id', 'ts') + SensorReading._fields[1:19]
+_RFID_COLUMNS = ('ts', 'kind', 'tag_id', 'station_id', 'payload')
+_ALERT_COLUMNS = ('ts', 'type', 'node_id', 'zone', 'user_name', 'message', 'payload')
+
+# table -> (columns, protected from shedding)
+TABLES = {
+    'sensor_readings': (_READING_COLUMNS, False),
+    'rfid_events': (_RFID_COLUMNS, True),
+    'alerts': (_ALERT_COLUMNS, True),
+}
+
+_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS sensor_readings (
+        node_id text NOT NULL, ts timestamptz NOT NULL,
+        "LPG" real, "CH4" real, "Propane" real, "Butane" real, "H2" real,
+        "heartRate" integer, spo2 real, "GSR" real, stress integer, temperature real, humidity real,
+        lat double precision, lon double precision, alt real, sat integer,
+        name text, zone text, seq bigint)""",
+    "CREATE INDEX IF NOT EXISTS sensor_readings_node_ts ON sensor_readings (node_id, ts)",
+    """CREATE TABLE IF NOT EXISTS rfid_events (
+        ts timestamptz NOT NULL, kind text NOT NULL, tag_id text, station_id text, payload jsonb)""",
+    "CREATE INDEX IF NOT EXISTS rfid_events_ts ON rfid_events (ts)",
+    """CREATE TABLE IF NOT EXISTS alerts (
+        ts timestamptz NOT NULL, type text NOT NULL, node_id text, zone text, user_name text,
+        message text, payload jsonb)""",
+    "CREATE INDEX IF NOT EXISTS alerts_node_ts ON alerts (node_id, ts)",
+)
+
+_COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def _utc(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).isoformat()
+
+
+def copy_text(rows):
+    """Rows as PostgreSQL COPY text format (tab-separated, \\N for NULL)"""
+    out = io.StringIO()
+    for row in rows:
+        out.write('\t'.join(
+            '\\N' if v is None else (v.translate(_COPY_ESCAPES) if type(v) is str else repr(v) if type(v) is float else str(v))
+            for v in row
+        ))
+        out.write('\n')
+    out.seek(0)
+    return out
+
+
+class PostgresSink:
+    """Buffered COPY writer for the sensor_readings, rfid_events and alerts tables.
+
+    write_*() only append to per-table buffers under a short lock. `pool_size` flusher
+    threads each hold one pooled connection and flush a table once it has flush_rows
+    rows or flush_interval has passed. At most max_pending rows are buffered or in
+    flight; beyond that the oldest sensor_readings rows are shed and counted.
+    """
+
+    def __init__(self, dsn, pool_size=2, flush_rows=5000, flush_interval=1.0, max_pending=200000,
+                 retry_delay=2.0, connect=None):
+        if psycopg2 is None and connect is None:
+            raise RuntimeError("psycopg2 is not installed (pip install psycopg2-binary)")
+        self.dsn = dsn
+        self.pool_size = max(1, int(pool_size))
+        self.flush_rows = max(1, int(flush_rows))
+        self.flush_interval = flush_interval
+        self.max_pending = max(self.flush_rows, int(max_pending))
+        self.retry_delay = retry_delay
+        self._connect = connect
+        self._pool = None
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+        self._buffers = {table: deque() for table in TABLES}   # deque of row batches
+        self._buffered = {table: 0 for table in TABLES}
+        self._in_flight = 0
+        self._last_flush = {table: time.monotonic() for table in TABLES}
+        self._cond = threading.Condition()
+        self._threads = []
+        self._running = False
+
+        self._written = {table: 0 for table in TABLES}
+        self._shed = 0
+        self._copies = 0
+        self._errors = 0
+        self._copy_time = 0.0
+        self._max_pending_seen = 0
+
+    @classmethod
+    def from_env(cls):
+        """PG_DSN (unset = no PostgreSQL sink), PG_POOL_SIZE, PG_FLUSH_ROWS, PG_FLUSH_MS and PG_MAX_PENDING"""
+        dsn = os.getenv("PG_DSN")
+        if not dsn:
+            return None
+        if psycopg2 is None:
+            logging.warning("⚠ PG_DSN is set but psycopg2 is not installed; PostgreSQL sink disabled")
+            return None
+        return cls(
+            dsn,
+            pool_size=int(os.getenv("PG_POOL_SIZE", "2")),
+            flush_rows=int(os.getenv("PG_FLUSH_ROWS", "5000")),
+            flush_interval=float(os.getenv("PG_FLUSH_MS", "1000")) / 1000.0,
+            max_pending=int(os.getenv("PG_MAX_PENDING", "200000")),
+        )
+
+    # --------------------------------------------------
+    # PRODUCER SIDE (ingest workers, dashboard callbacks)
+    # --------------------------------------------------
+
+    def write_readings(self, node_id, rows, epochs):
+        """Buffer one node's SensorReading rows (epochs: their timestamps in epoch seconds)"""
+        self._offer('sensor_readings', [(node_id, _utc(ts)) + sparse_values(row) + tuple(row[16:19])
+                                        for row, ts in zip(rows, epochs)])
+
+    def write_rfid(self, kind, timestamp, payload):
+        """Buffer an RFID event: kind 'scan' or 'reset' with its payload dict (timestamp in epoch seconds)"""
+        self._offer('rfid_events', [(
+            _utc(timestamp), kind, payload.get('tag_id'), payload.get('station_id'),
+            json.dumps(payload, default=str),
+        )])
+
+    def write_alert(self, alert):
+        """Buffer one dashboard alert dict ({'ts', 'type', 'node', 'zone', 'user', 'message'})"""
+        ts = alert.get('ts') or epoch_now()
+        self._offer('alerts', [(
+            _utc(ts), alert.get('type'), alert.get('node'), alert.get('zone'), alert.get('user'),
+            alert.get('message'), json.dumps(alert, default=str),
+        )])
+
+    def _offer(self, table, rows):
+        with self._cond:
+            self._buffers[table].append(rows)
+            self._buffered[table] += len(rows)
+            pending = self._in_flight + sum(self._buffered.values())
+            if pending > self.max_pending:
+                pending -= self._shed_oldest(pending - self.max_pending)
+            if pending > self._max_pending_seen:
+                self._max_pending_seen = pending
+            if self._buffered[table] >= self.flush_rows:
+                self._cond.notify()
+
+    def _shed_oldest(self, excess):
+        """Drop at least `excess` of the oldest buffered rows of unprotected tables (caller holds the lock)"""
+        shed = 0
+        for table, (_, protected) in TABLES.items():
+            buffer = self._buffers[table]
+            dropped = 0
+            while not protected and buffer and shed + dropped < excess:
+                dropped += len(buffer.popleft())
+            self._buffered[table] -= dropped
+            shed += dropped
+        self._shed += shed
+        if shed:
+            hot_log.warning('pg.shed', "⚠ PostgreSQL sink is lagging; shed %d buffered reading(s)", shed)
+        return shed
+
+    # --------------------------------------------------
+    # FLUSHER THREADS
+    # --------------------------------------------------
+
+    def start(self):
+        if self._running:
+            return
+        if self._connect is None:
+            # minconn=0: connections are opened by the flushers, so a database that is down
+            # at startup only delays history instead of failing the dashboard
+            self._pool = _pg_pool.ThreadedConnectionPool(0, self.pool_size, self.dsn)
+        self._running = True
+        self._threads = [threading.Thread(target=self._flusher, name=f"pg-flusher-{idx}", daemon=True)
+                         for idx in range(self.pool_size)]
+        for t in self._threads:
+            t.start()
+        logging.info(f"🐘 PostgreSQL sink started: {self.pool_size} connection(s), flush every "
+                     f"{self.flush_rows} rows / {self.flush_interval:.1f}s")
+
+    def stop(self, timeout=10.0):
+        """Flush what is buffered (best effort within timeout) and close the pool"""
+        if not self._running:
+            return
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join(max(0.0, deadline - time.monotonic()))
+        self._threads = []
+        if self._pool is not None:
+            self._pool.closeall()
+            self._pool = None
+
+    def _getconn(self):
+        return self._pool.getconn() if self._pool is not None else self._connect()
+
+    def _putconn(self, conn, close=False):
+        if self._pool is not None:
+            self._pool.putconn(conn, close=close)
+        elif close:
+            conn.close()
+
+    def _ensure_schema(self, conn):
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            with conn.cursor() as cur:
+                for statement in _SCHEMA:
+                    cur.execute(statement)
+            conn.commit()
+            self._schema_ready = True
+
+    def _take(self):
+        """Claim the next due table's buffered rows: (table, rows), or None once stopped and empty"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                due = [t for t in TABLES if self._buffered[t] and
+                       (self._buffered[t] >= self.flush_rows or not self._running
+                        or now - self._last_flush[t] >= self.flush_interval)]
+                if due:
+                    table = max(due, key=lambda t: self._buffered[t])
+                    rows = []
+                    buffer = self._buffers[table]
+                    while buffer and len(rows) < self.flush_rows:
+                        rows.extend(buffer.popleft())
+                    self._buffered[table] -= len(rows)
+                    self._in_flight += len(rows)
+                    self._last_flush[table] = now
+                    return table, rows
+                if not self._running:
+                    return None
+                self._cond.wait(self.flush_interval)
+
+    def _flusher(self):
+        conn = None
+        while True:
+            claimed = self._take()
+            if claimed is None:
+                break
+            table, rows = claimed
+            start = time.perf_counter()
+            try:
+                if conn is None:
+                    conn = self._getconn()
+                    self._ensure_schema(conn)
+                columns = ', '.join(f'"{c}"' for c in TABLES[table][0])
+                with conn.cursor() as cur:
+                    cur.copy_expert(f"COPY {table} ({columns}) FROM STDIN", copy_text(rows))
+                conn.commit()
+                ok = True
+            except Exception as e:
+                ok = False
+                logging.error(f"❌ PostgreSQL COPY into {table} failed ({len(rows)} row(s)): {e}")
+                if conn is not None:
+                    self._putconn(conn, close=True)
+                    conn = None
+            elapsed = time.perf_counter() - start
+            with self._cond:
+                self._in_flight -= len(rows)
+                self._copy_time += elapsed
+                if ok:
+                    self._copies += 1
+                    self._written[table] += len(rows)
+                else:
+                    self._errors += 1
+                    # Requeue at the front; readings are shed again if the database stays down
+                    self._buffers[table].appendleft(rows)
+                    self._buffered[table] += len(rows)
+                    pending = self._in_flight + sum(self._buffered.values())
+                    if pending > self.max_pending:
+                        self._shed_oldest(pending - self.max_pending)
+            if not ok:
+                if not self._running:
+                    break   # the database is still failing at shutdown: give up on what is left
+                time.sleep(self.retry_delay)
+        if conn is not None:
+            self._putconn(conn)
+
+    # --------------------------------------------------
+    # MONITORING
+    # --------------------------------------------------
+
+    @property
+    def lagging(self):
+        """True while the buffer is more than half full (the database is not keeping up)"""
+        with self._cond:
+            return self._in_flight + sum(self._buffered.values()) > self.max_pending // 2
+
+    def stats(self):
+        with self._cond:
+            pending = self._in_flight + sum(self._buffered.values())
+            return {
+                'pool_size': self.pool_size,
+                'pending': pending,
+                'max_pending': self.max_pending,
+                'max_pending_seen': self._max_pending_seen,
+                'lagging': pending > self.max_pending // 2,
+                'written': dict(self._written),
+                'copies': self._copies,
+                'avg_rows_per_copy': sum(self._written.values()) / self._copies if self._copies else 0.0,
+                'copy_time_ms': self._copy_time * 1000.0,
+                'shed': self._shed,
+                'errors': self._errors,
+            }
@@ -2,6 +2,8 @@
 """
 Publish a few test heart rate messages to MQTT to exercise dashboard alerts.
 Uses the same .env configuration as the dashboard (TLS on 8883, MQTT v3.1.1).
+Set MQTT_PAYLOAD_FORMAT=binary to publish the compact binary encoding instead of JSON,
+and MQTT_PROTOCOL=5 to publish over MQTT v5 with topic aliases.
 """
 import json
 import ssl
@@ -9,9 +11,11 @@ import time
 import os
 from datetime import datetime
 
-import paho.mqtt.client as mqtt
 from dotenv import load_dotenv
 
+from mqtt_options import MqttOptions, TopicAliasPublisher
+from sensor_codec import encode_payload
+
 load_dotenv()
 
 HOST = os.getenv("MQTT_HOST")
@@ -19,13 +23,23 @@ PORT = int(os.getenv("MQTT_PORT", "8883"))
 USER = os.getenv("MQTT_USERNAME")
 PASS = os.getenv("MQTT_PASSWORD")
 TOPIC = os.getenv("MQTT_TOPIC_1", "LOKI_2004")
+BINARY = os.getenv("MQTT_PAYLOAD_FORMAT", "json").lower() == "binary"
+
+# Secure client compatible with paho v1/v2 (MQTT v3.1.1 unless MQTT_PROTOCOL=5)
+options = MqttOptions.from_env()
+client = options.create_client(f"MineArmourTestPub-{int(time.time())}")
+publisher = TopicAliasPublisher(client, options)
+connected = False
+
+
+def on_connect(client, userdata, flags, rc, properties=None):
+    global connected
+    # Topic aliases are negotiated per connection (server's TopicAliasMaximum)
+    publisher.reset(properties)
+    connected = rc == 0
+
 
-# Small helper to build a secure client compatible with paho v1/v2
-CallbackAPIVersion = getattr(mqtt, 'CallbackAPIVersion', None)
-if CallbackAPIVersion is not None:
-    client = mqtt.Client(client_id=f"MineArmourTestPub-{int(time.time())}", protocol=mqtt.MQTTv311, callback_api_version=CallbackAPIVersion.VERSION1)
-else:
-    client = mqtt.Client(client_id=f"MineArmourTestPub-{int(time.time())}", protocol=mqtt.MQTTv311)
+client.on_connect = on_connect
 
 if USER and PASS:
     client.username_pw_set(USER, PASS)
@@ -37,8 +51,11 @@ ctx.verify_mode = ssl.CERT_NONE
 client.tls_set_context(ctx)
 
 print(f"Connecting to {HOST}:{PORT} and publishing to topic '{TOPIC}'...")
-client.connect(HOST, PORT, 60)
+client.connect(HOST, PORT, 60, **options.connect_kwargs())
 client.loop_start()
+deadline = time.time() + 10
+while not connected and time.time() < deadline:
+    time.sleep(0.1)
 
 # Build three messages: low HR, high HR, normal HR
 msgs = [
@@ -48,9 +65,9 @@ msgs = [
 ]
 
 for i, payload in enumerate(msgs, 1):
-    s = json.dumps(payload)
-    rc = client.publish(TOPIC, s, qos=1)
-    print(f"[{i}/3] Published: {s}")
+    s = encode_payload(payload, binary=BINARY)
+    rc = publisher.publish(TOPIC, s, qos=1)
+    print(f"[{i}/3] Published: {json.dumps(payload)}" + (f" ({len(s)} bytes binary)" if BINARY else ""))
     time.sleep(1.0)
 
 client.loop_stop()
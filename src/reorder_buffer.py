@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Mine Armour - Event-time Reorder Buffer
+With INGEST_TIME_MODE=event, readings carry the timestamp the helmet put in the
+payload instead of the receive time. A burst that arrives late or shuffled over
+a flaky underground link is held in a small per-node buffer and released in
+timestamp order once the node's watermark (its newest device timestamp minus
+the allowed lateness) has passed it. A reading older than what its node has
+already released is late: it is counted and kept in a side channel instead of
+the live series, so rollups and alerts only ever see readings in order.
+"""
+
+import os
+import heapq
+import logging
+import threading
+import time
+from collections import deque
+
+
+def event_time_enabled():
+    """INGEST_TIME_MODE=event stamps readings with the payload's `timestamp` (default: receive)"""
+    return os.getenv("INGEST_TIME_MODE", "receive").strip().lower() == 'event'
+
+
+class _NodeBuffer:
+    __slots__ = ('heap', 'newest', 'released', 'last_push')
+
+    def __init__(self):
+        self.heap = []          # (timestamp, arrival seq, reading)
+        self.newest = None      # newest device timestamp seen
+        self.released = None    # timestamp of the last reading released
+        self.last_push = 0.0    # monotonic time of the last push
+
+
+class ReorderBuffer:
+    """Per-node min-heaps of readings keyed by event time, released behind a watermark.
+
+    Callers hold the node's lock across push() / drain() and the series append that
+    follows, so released readings reach the series in timestamp order.
+    """
+
+    def __init__(self, lateness=2.0, max_rows=512, max_skew=5.0, late_keep=100):
+        self.lateness = lateness      # seconds a reading may trail its node's newest one
+        self.max_rows = max_rows      # per node; the oldest are released early beyond this
+        self.max_skew = max_skew      # device timestamps further ahead of receive time are clamped
+        self.late_keep = late_keep    # late readings kept per node for inspection
+        self._lock = threading.Lock()
+        self._nodes = {}
+        self._late = {}
+        self._seq = 0
+        self._released = 0
+        self._late_count = 0
+        self._clamped = 0
+        self._forced = 0
+        self._thread = None
+        self._stop = threading.Event()
+        self._flush = None
+
+    @classmethod
+    def from_env(cls):
+        """None unless INGEST_TIME_MODE=event; REORDER_LATENESS / REORDER_MAX_SKEW seconds,
+        REORDER_MAX_ROWS and REORDER_LATE_KEEP per node"""
+        if not event_time_enabled():
+            return None
+        return cls(
+            lateness=float(os.getenv("REORDER_LATENESS", "2")),
+            max_rows=int(os.getenv("REORDER_MAX_ROWS", "512")),
+            max_skew=float(os.getenv("REORDER_MAX_SKEW", "5")),
+            late_keep=int(os.getenv("REORDER_LATE_KEEP", "100")),
+        )
+
+    # --------------------------------------------------
+    # BUFFERING
+    # --------------------------------------------------
+
+    def push(self, node_id, rows, now, floor=None):
+        """Buffer a node's SensorReading rows; returns (ready, late).
+
+        ready are the rows now behind the watermark, in timestamp order; late are rows
+        older than the last one released (or than `floor`, the newest reading the node's
+        series already holds, e.g. after a restart)."""
+        ready = []
+        late = []
+        limit = now + self.max_skew
+        with self._lock:
+            buf = self._nodes.get(node_id)
+            if buf is None:
+                buf = self._nodes[node_id] = _NodeBuffer()
+            buf.last_push = time.monotonic()
+            released = buf.released if buf.released is not None else floor
+            heap = buf.heap
+            for row in rows:
+                ts = row[0]
+                if ts > limit:
+                    # A device clock running ahead would hold back every other reading of the node
+                    row = row._replace(timestamp=now)
+                    ts = now
+                    self._clamped += 1
+                if released is not None and ts < released:
+                    late.append(row)
+                    continue
+                self._seq += 1
+                heapq.heappush(heap, (ts, self._seq, row))
+                if buf.newest is None or ts > buf.newest:
+                    buf.newest = ts
+            if heap:
+                watermark = buf.newest - self.lateness
+                while heap and (heap[0][0] <= watermark or len(heap) > self.max_rows):
+                    if heap[0][0] > watermark:
+                        self._forced += 1
+                    ready.append(heapq.heappop(heap)[2])
+            if ready:
+                buf.released = ready[-1][0]
+                self._released += len(ready)
+            if late:
+                kept = self._late.get(node_id)
+                if kept is None:
+                    kept = self._late[node_id] = deque(maxlen=self.late_keep)
+                kept.extend(late)
+                self._late_count += len(late)
+        return ready, late
+
+    def drain(self, node_id):
+        """Release every buffered row of a node, in timestamp order"""
+        with self._lock:
+            buf = self._nodes.get(node_id)
+            if buf is None or not buf.heap:
+                return []
+            heap = buf.heap
+            ready = [heapq.heappop(heap)[2] for _ in range(len(heap))]
+            buf.released = ready[-1][0]
+            self._released += len(ready)
+        return ready
+
+    def pending_nodes(self, idle_for=None):
+        """Nodes holding rows that have not pushed anything for `idle_for` seconds (default: lateness)"""
+        idle_for = self.lateness if idle_for is None else idle_for
+        cutoff = time.monotonic() - idle_for
+        with self._lock:
+            return [nid for nid, buf in self._nodes.items() if buf.heap and buf.last_push <= cutoff]
+
+    def forget(self, node_ids):
+        """Drop the buffers of evicted nodes"""
+        with self._lock:
+            for nid in node_ids:
+                self._nodes.pop(nid, None)
+                self._late.pop(nid, None)
+
+    def late(self, node_id):
+        """Most recent late readings of a node (oldest first)"""
+        with self._lock:
+            return list(self._late.get(node_id, ()))
+
+    # --------------------------------------------------
+    # IDLE FLUSHER
+    # --------------------------------------------------
+
+    def start(self, flush):
+        """Run flush() periodically so a node that went quiet still has its last readings released"""
+        if self._thread is not None:
+            return
+        self._flush = flush
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="reorder-flush", daemon=True)
+        self._thread.start()
+        logging.info(f"⏱️ Event-time ingest: readings reordered within {self.lateness:g}s per node")
+
+    def _run(self):
+        while not self._stop.wait(max(0.1, self.lateness / 2)):
+            try:
+                self._flush()
+            except Exception as e:
+                logging.error(f"❌ Reorder flush failed: {e}")
+
+    def stop(self, final=True):
+        """Stop the flusher, releasing everything still buffered"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        if final:
+            self._flush(0.0)
+
+    def stats(self):
+        with self._lock:
+            buffered = sum(len(buf.heap) for buf in self._nodes.values())
+            late_nodes = {nid: len(kept) for nid, kept in self._late.items() if kept}
+        return {
+            'mode': 'event',
+            'lateness_s': self.lateness,
+            'max_rows_per_node': self.max_rows,
+            'max_skew_s': self.max_skew,
+            'buffered': buffered,
+            'released': self._released,
+            'late': self._late_count,
+            'clamped': self._clamped,
+            'forced': self._forced,
+            'late_kept': late_nodes,
+        }
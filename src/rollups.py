@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Mine Armour - Rollup Tiers
+Per-node multi-resolution history: every reading is folded into fixed-width time
+buckets (10 s, 1 min and 15 min by default) holding min, max, mean and count per
+channel. Buckets are maintained incrementally on ingest, so charts covering a
+whole shift read a few hundred buckets instead of every raw sample.
+"""
+
+import os
+from array import array
+
+from node_series import CHANNEL_INDEX, MISSING_AS_NAN
+from sensor_codec import ALL_PRESENT
+
+# Channels rolled up (GPS position is not aggregated)
+ROLLUP_CHANNELS = (
+    'LPG', 'CH4', 'Propane', 'Butane', 'H2', 'heartRate', 'spo2',
+    'GSR', 'stress', 'temperature', 'humidity',
+)
+_SLOTS = tuple(CHANNEL_INDEX[name] for name in ROLLUP_CHANNELS)   # same slot in SensorReading
+_SKIP_MISSING = tuple(name in MISSING_AS_NAN for name in ROLLUP_CHANNELS)
+_ROLLUP_INDEX = {name: idx for idx, name in enumerate(ROLLUP_CHANNELS)}
+
+# (bucket seconds, buckets kept): 1 h of 10 s, 12 h of 1 min, 24 h of 15 min
+DEFAULT_TIERS = ((10, 360), (60, 720), (900, 96))
+
+
+def _merge(acc, stats):
+    """Fold per-channel [count, sum, min, max] stats into an accumulator"""
+    for idx in range(0, len(acc), 4):
+        count = stats[idx]
+        if not count:
+            continue
+        if acc[idx]:
+            acc[idx + 2] = min(acc[idx + 2], stats[idx + 2])
+            acc[idx + 3] = max(acc[idx + 3], stats[idx + 3])
+        else:
+            acc[idx + 2] = stats[idx + 2]
+            acc[idx + 3] = stats[idx + 3]
+        acc[idx] += count
+        acc[idx + 1] += stats[idx + 1]
+
+
+class RollupTier:
+    """Ring of `capacity` closed buckets of `bucket_s` seconds plus the bucket being filled.
+
+    Closed buckets are stored columnar (float32 min/max/mean, uint32 count per channel).
+    """
+
+    def __init__(self, bucket_s, capacity):
+        self.bucket_s = bucket_s
+        self.capacity = capacity
+        width = capacity * len(ROLLUP_CHANNELS)
+        self._starts = array('d', bytes(8 * capacity))
+        self._count = array('I', bytes(4 * width))
+        self._min = array('f', bytes(4 * width))
+        self._max = array('f', bytes(4 * width))
+        self._mean = array('f', bytes(4 * width))
+        self._head = 0      # next ring position to write
+        self._size = 0
+        self._open_start = None
+        self._open = None   # [count, sum, min, max] per channel
+
+    @property
+    def label(self):
+        return f"{self.bucket_s // 60}m" if self.bucket_s >= 60 else f"{self.bucket_s}s"
+
+    @property
+    def retention(self):
+        return self.bucket_s * self.capacity
+
+    def add(self, ts, stats):
+        """Fold stats for readings at epoch `ts` into their bucket (late readings join the open one)"""
+        start = ts - ts % self.bucket_s
+        if self._open is None:
+            self._open_start, self._open = start, list(stats)
+            return
+        if start > self._open_start:
+            self._close()
+            self._open_start, self._open = start, list(stats)
+            return
+        _merge(self._open, stats)
+
+    def _close(self):
+        pos = self._head
+        self._starts[pos] = self._open_start
+        base = pos * len(ROLLUP_CHANNELS)
+        acc = self._open
+        for ch in range(len(ROLLUP_CHANNELS)):
+            count = acc[4 * ch]
+            self._count[base + ch] = count
+            if count:
+                self._min[base + ch] = acc[4 * ch + 2]
+                self._max[base + ch] = acc[4 * ch + 3]
+                self._mean[base + ch] = acc[4 * ch + 1] / count
+        self._head = (pos + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def state(self):
+        """Closed buckets (oldest first, only the filled part of the ring) and the open bucket"""
+        n_ch = len(ROLLUP_CHANNELS)
+        first = (self._head - self._size) % self.capacity
+        order = [(first + k) % self.capacity for k in range(self._size)]
+        out = {'bucket_s': self.bucket_s, 'capacity': self.capacity, 'starts': array('d', (self._starts[p] for p in order)),
+               'open_start': self._open_start, 'open': array('d', self._open) if self._open is not None else None}
+        for key, column in (('count', self._count), ('min', self._min), ('max', self._max), ('mean', self._mean)):
+            out[key] = array(column.typecode)
+            for pos in order:
+                out[key].extend(column[pos * n_ch:(pos + 1) * n_ch])
+        return out
+
+    def restore(self, state):
+        n_ch = len(ROLLUP_CHANNELS)
+        size = len(state['starts'])
+        self._starts[:size] = state['starts']
+        for key, column in (('count', self._count), ('min', self._min), ('max', self._max), ('mean', self._mean)):
+            column[:size * n_ch] = state[key]
+        self._head, self._size = size % self.capacity, size
+        self._open_start, self._open = state['open_start'], None
+        if state['open'] is not None:
+            self._open = list(state['open'])
+            self._open[::4] = [int(count) for count in self._open[::4]]
+
+    def query(self, channel, since=None):
+        """Buckets of one channel starting at or after `since` (oldest first, open bucket last).
+
+        Returns {'timestamps', 'mean', 'min', 'max', 'count'}; buckets with no reading
+        for the channel are skipped."""
+        ch = _ROLLUP_INDEX[channel]
+        n_ch = len(ROLLUP_CHANNELS)
+        out = {'timestamps': [], 'mean': [], 'min': [], 'max': [], 'count': []}
+        first = (self._head - self._size) % self.capacity
+        for k in range(self._size):
+            pos = (first + k) % self.capacity
+            start = self._starts[pos]
+            count = self._count[pos * n_ch + ch]
+            if (since is not None and start < since) or not count:
+                continue
+            idx = pos * n_ch + ch
+            out['timestamps'].append(start)
+            out['mean'].append(self._mean[idx])
+            out['min'].append(self._min[idx])
+            out['max'].append(self._max[idx])
+            out['count'].append(count)
+        if self._open is not None and (since is None or self._open_start >= since):
+            count = self._open[4 * ch]
+            if count:
+                out['timestamps'].append(self._open_start)
+                out['mean'].append(self._open[4 * ch + 1] / count)
+                out['min'].append(self._open[4 * ch + 2])
+                out['max'].append(self._open[4 * ch + 3])
+                out['count'].append(count)
+        return out
+
+
+class NodeRollups:
+    """All rollup tiers of one node, updated together from batches of SensorReading rows"""
+
+    def __init__(self, tiers=DEFAULT_TIERS):
+        self.tiers = [RollupTier(bucket_s, capacity) for bucket_s, capacity in sorted(tiers)]
+        finest = self.tiers[0].bucket_s if self.tiers else 1
+        for tier in self.tiers:
+            if tier.bucket_s % finest:
+                raise ValueError(f"Rollup bucket {tier.bucket_s}s is not a multiple of the finest bucket {finest}s")
+        self._finest = finest
+
+    @staticmethod
+    def tiers_from_env():
+        """ROLLUP_TIERS="10:360,60:720,900:96" (bucket seconds:buckets kept); empty or 0 disables rollups"""
+        spec = os.getenv("ROLLUP_TIERS")
+        if spec is None:
+            return DEFAULT_TIERS
+        tiers = []
+        for entry in spec.split(','):
+            if ':' in entry:
+                bucket_s, capacity = entry.split(':', 1)
+                tiers.append((int(bucket_s), int(capacity)))
+        return tuple(tiers)
+
+    def add_rows(self, rows, epochs):
+        """Fold rows (with their epoch-second timestamps) into every tier, one run per finest bucket"""
+        if not self.tiers:
+            return
+        columns = list(zip(*rows))
+        masks = columns[-1]
+        sparse = any(m is not None and m != ALL_PRESENT for m in masks)
+        finest = self._finest
+        n = len(rows)
+        i = 0
+        while i < n:
+            bucket = epochs[i] // finest
+            j = i + 1
+            while j < n and epochs[j] // finest == bucket:
+                j += 1
+            stats = []
+            for slot, skip_missing in zip(_SLOTS, _SKIP_MISSING):
+                values = columns[slot][i:j]
+                if sparse:
+                    # Fields the payloads did not carry are not samples
+                    values = [v for v, m in zip(values, masks[i:j]) if m is None or m >> slot & 1]
+                if skip_missing:
+                    values = [v for v in values if v != -1]
+                if values:
+                    stats.extend((len(values), sum(values), min(values), max(values)))
+                else:
+                    stats.extend((0, 0.0, 0.0, 0.0))
+            for tier in self.tiers:
+                tier.add(epochs[i], stats)
+            i = j
+
+    def state(self):
+        """Copy of every tier for a warm-restart snapshot"""
+        return [tier.state() for tier in self.tiers]
+
+    def restore(self, state):
+        """Load tiers from state(); returns False (and keeps the empty tiers) when the
+        snapshot was taken with a different ROLLUP_TIERS layout"""
+        layout = [(t['bucket_s'], t['capacity']) for t in state]
+        if layout != [(t.bucket_s, t.capacity) for t in self.tiers]:
+            return False
+        for tier, tier_state in zip(self.tiers, state):
+            tier.restore(tier_state)
+        return True
+
+    def pick_tier(self, span_s, width_px):
+        """Finest tier with at most about one bucket per pixel over span_s (coarsest as fallback)"""
+        seconds_per_px = span_s / max(width_px, 1)
+        for tier in self.tiers:
+            if tier.bucket_s >= seconds_per_px and tier.retention >= span_s:
+                return tier
+        return self.tiers[-1] if self.tiers else None
+
+    @property
+    def nbytes(self):
+        return sum(
+            sum(a.itemsize * len(a) for a in (t._starts, t._count, t._min, t._max, t._mean))
+            for t in self.tiers
+        )
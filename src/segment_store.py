@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Mine Armour - Memory-mapped Segment Files
+Off-heap, append-only per-node history. Each node gets a directory of segment
+files holding fixed 128-byte records (epoch timestamp plus the 15 sensor channels
+as float64, in node_series.CHANNELS order; NaN where the reading had no value). Ingest appends whole records; readers
+mmap the files, so weeks of history can be sliced as zero-copy NumPy views.
+Segments rotate after a fixed time span and are deleted once older than the
+retention period.
+"""
+
+import os
+import mmap
+import math
+import time
+import struct
+import logging
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+
+from node_series import CHANNELS, CHANNEL_INDEX, MISSING_AS_NAN
+from sensor_codec import present_mask
+
+try:
+    import numpy as _np
+except ImportError:
+    _np = None
+
+# File header: magic, format version, lanes per record, header size
+_MAGIC = b'MASEG\x00'
+_HEADER = struct.Struct('<6sHII')
+HEADER_SIZE = 64
+RECORD_LANES = len(CHANNELS)
+RECORD_SIZE = 8 * RECORD_LANES
+SUFFIX = '.seg'
+
+_NAN_LANES = frozenset(CHANNEL_INDEX[name] for name in MISSING_AS_NAN)
+
+
+def _header():
+    return _HEADER.pack(_MAGIC, 1, RECORD_LANES, HEADER_SIZE).ljust(HEADER_SIZE, b'\x00')
+
+
+class Segment:
+    """One segment file: records of readings with timestamps in [start, start + span)"""
+
+    def __init__(self, path, start):
+        self.path = path
+        self.start = start
+        self._map = None
+        self._mapped_records = 0
+
+    def records(self):
+        """Complete records currently in the file (a torn tail write is ignored)"""
+        try:
+            return max(0, (os.path.getsize(self.path) - HEADER_SIZE) // RECORD_SIZE)
+        except OSError:
+            return 0
+
+    def table(self):
+        """All records as a read-only float64 view of the mapped file: a (records, lanes)
+        numpy array, or a flat memoryview of records * lanes values without numpy.
+
+        Remaps when the file has grown; earlier views stay valid (the old mapping is
+        kept alive by them)."""
+        count = self.records()
+        if count == 0:
+            return _empty_table()
+        if self._map is None or count != self._mapped_records:
+            with open(self.path, 'rb') as f:
+                self._map = mmap.mmap(f.fileno(), HEADER_SIZE + count * RECORD_SIZE, access=mmap.ACCESS_READ)
+            self._mapped_records = count
+        if _np is not None:
+            return _np.frombuffer(self._map, dtype=_np.float64, count=count * RECORD_LANES,
+                                  offset=HEADER_SIZE).reshape(count, RECORD_LANES)
+        return memoryview(self._map)[HEADER_SIZE:HEADER_SIZE + count * RECORD_SIZE].cast('d')
+
+
+def _empty_table():
+    if _np is not None:
+        return _np.empty((0, RECORD_LANES))
+    return memoryview(array('d'))
+
+
+def _records(table):
+    return table.shape[0] if _np is not None else len(table) // RECORD_LANES
+
+
+class NodeSegments:
+    """Append/read access to one node's segment directory"""
+
+    def __init__(self, directory, segment_s):
+        self.directory = directory
+        self.segment_s = segment_s
+        self._lock = threading.Lock()
+        self._file = None           # append handle of self._current
+        self._current = None        # segment being appended to
+        self._segments = []         # Segment objects, oldest first
+        os.makedirs(directory, exist_ok=True)
+        for name in sorted(os.listdir(directory), key=lambda n: float(n[:-len(SUFFIX)]) if n.endswith(SUFFIX) else 0):
+            if name.endswith(SUFFIX):
+                self._segments.append(Segment(os.path.join(directory, name), float(name[:-len(SUFFIX)])))
+
+    def append(self, rows, epochs):
+        """Append SensorReading rows (timestamps as epoch seconds) as fixed records.
+
+        Each row goes to the segment whose span holds its timestamp. Readers binary-search
+        timestamps, so rows are expected in time order; a late row lands at the tail of
+        its segment."""
+        with self._lock:
+            i = 0
+            n = len(rows)
+            while i < n:
+                current = self._current
+                if current is None or not current.start <= epochs[i] < current.start + self.segment_s:
+                    current = self._rotate(epochs[i])
+                # The run of readings inside the current segment's span goes out in one write
+                lo, hi = current.start, current.start + self.segment_s
+                j = i + 1
+                while j < n and lo <= epochs[j] < hi:
+                    j += 1
+                buf = array('d')
+                for row, ts in zip(rows[i:j], epochs[i:j]):
+                    buf.append(ts)
+                    present = present_mask(row)
+                    for lane in range(1, RECORD_LANES):
+                        value = row[lane]
+                        if not present >> lane & 1 or (lane in _NAN_LANES and value == -1):
+                            value = math.nan
+                        buf.append(value)
+                self._file.write(buf.tobytes())
+                i = j
+            self._file.flush()
+
+    def _rotate(self, ts):
+        """Make the segment whose span holds `ts` the append target (creating it if needed)"""
+        if self._file is not None:
+            self._file.close()
+        start = ts - ts % self.segment_s
+        path = os.path.join(self.directory, f"{start:.0f}{SUFFIX}")
+        existing = next((s for s in self._segments if s.path == path), None)
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(_header())
+        else:
+            # Drop a torn record left by a crash mid-write, so records stay aligned
+            size = self._file.tell()
+            whole = HEADER_SIZE + (size - HEADER_SIZE) // RECORD_SIZE * RECORD_SIZE
+            if whole != size:
+                self._file.truncate(whole)
+                self._file.seek(whole)
+        if existing is None:
+            existing = Segment(path, start)
+            self._segments.append(existing)
+            self._segments.sort(key=lambda s: s.start)
+        self._current = existing
+        return existing
+
+    def segments(self, since=None, until=None):
+        """Segments overlapping [since, until], oldest first"""
+        with self._lock:
+            segments = list(self._segments)
+        starts = [s.start for s in segments]
+        lo = 0 if since is None else max(0, bisect_right(starts, since) - 1)
+        hi = len(segments) if until is None else bisect_right(starts, until)
+        return segments[lo:hi]
+
+    def views(self, since=None, until=None):
+        """Zero-copy views of the records in [since, until], one per segment (see Segment.table)"""
+        out = []
+        for segment in self.segments(since, until):
+            table = segment.table()
+            if not _records(table):
+                continue
+            ts = table[:, 0] if _np is not None else table[::RECORD_LANES]
+            lo = 0 if since is None else _search(ts, since, left=True)
+            hi = len(ts) if until is None else _search(ts, until, left=False)
+            if hi > lo:
+                out.append(table[lo:hi] if _np is not None else table[lo * RECORD_LANES:hi * RECORD_LANES])
+        return out
+
+    def prune(self, cutoff):
+        """Delete segments whose whole span ends before `cutoff`; returns how many were removed"""
+        removed = 0
+        with self._lock:
+            keep = []
+            for segment in self._segments:
+                if segment is not self._current and segment.start + self.segment_s <= cutoff:
+                    try:
+                        os.remove(segment.path)
+                        removed += 1
+                        continue
+                    except OSError as e:   # e.g. still mapped by a reader on Windows; retried next prune
+                        logging.warning(f"⚠ Could not remove segment {segment.path}: {e}")
+                keep.append(segment)
+            self._segments = keep
+        return removed
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                self._current = None
+
+
+def _search(ts, value, left):
+    """Index of `value` in a sorted timestamp column (numpy view or list)"""
+    if _np is not None:
+        return int(_np.searchsorted(ts, value, side='left' if left else 'right'))
+    return bisect_left(ts, value) if left else bisect_right(ts, value)
+
+
+class SegmentStore:
+    """Per-node segment directories under `root` (one NodeSegments per node id)"""
+
+    def __init__(self, root, segment_s=3600, retention_s=14 * 86400, prune_interval=300.0):
+        self.root = root
+        self.segment_s = max(1, int(segment_s))
+        self.retention_s = retention_s
+        self.prune_interval = prune_interval
+        self._nodes = {}
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+        self._appended = 0
+        self._pruned = 0
+        os.makedirs(root, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        """SEGMENT_DIR (unset = no segment files), SEGMENT_SPAN seconds per file and
+        SEGMENT_RETENTION seconds of history kept (0 = keep forever)"""
+        root = os.getenv("SEGMENT_DIR")
+        if not root:
+            return None
+        return cls(
+            root,
+            segment_s=int(os.getenv("SEGMENT_SPAN", "3600")),
+            retention_s=float(os.getenv("SEGMENT_RETENTION", str(14 * 86400))),
+        )
+
+    def _directory(self, node_id):
+        safe = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in node_id)
+        return os.path.join(self.root, safe)
+
+    def node(self, node_id):
+        """A node's segments, creating its directory on first use (the append path)"""
+        segments = self._nodes.get(node_id)
+        if segments is None:
+            with self._lock:
+                segments = self._nodes.get(node_id)
+                if segments is None:
+                    segments = self._nodes[node_id] = NodeSegments(self._directory(node_id), self.segment_s)
+        return segments
+
+    def lookup(self, node_id):
+        """A node's segments if it has a segment directory, else None; never creates anything"""
+        segments = self._nodes.get(node_id)
+        if segments is None and os.path.isdir(self._directory(node_id)):
+            segments = self.node(node_id)
+        return segments
+
+    def node_ids(self):
+        """Nodes with a segment directory (directory names; ids with unsafe characters come back mangled)"""
+        return sorted(name for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name)))
+
+    def append(self, node_id, rows, epochs):
+        self.node(node_id).append(rows, epochs)
+        self._appended += len(rows)
+        self.maybe_prune()
+
+    def views(self, node_id, since=None, until=None):
+        """Zero-copy record views of a node's history in [since, until] (see NodeSegments.views)"""
+        segments = self.lookup(node_id)
+        return segments.views(since, until) if segments is not None else []
+
+    def channel(self, node_id, name, since=None, until=None):
+        """(timestamps, values) of one channel; zero-copy when the range lies in one segment"""
+        lane = CHANNEL_INDEX[name]
+        views = self.views(node_id, since, until)
+        if _np is not None:
+            if len(views) == 1:
+                return views[0][:, 0], views[0][:, lane]
+            if not views:
+                return _np.empty(0), _np.empty(0)
+            return _np.concatenate([v[:, 0] for v in views]), _np.concatenate([v[:, lane] for v in views])
+        ts, values = [], []
+        for v in views:
+            ts.extend(v[::RECORD_LANES].tolist())
+            values.extend(v[lane::RECORD_LANES].tolist())
+        return ts, values
+
+    def maybe_prune(self, now=None):
+        """Delete segments older than retention_s, at most once per prune_interval"""
+        if self.retention_s <= 0:
+            return 0
+        now = time.time() if now is None else now
+        if now - self._last_prune < self.prune_interval:
+            return 0
+        self._last_prune = now
+        cutoff = now - self.retention_s
+        removed = 0
+        with self._lock:
+            opened = {os.path.basename(n.directory): n for n in self._nodes.values()}
+            # Nodes not written since the restart have no NodeSegments yet; prune their
+            # directories too. Holding the lock keeps node() from opening one meanwhile.
+            for name in os.listdir(self.root):
+                directory = os.path.join(self.root, name)
+                if name in opened or not os.path.isdir(directory):
+                    continue
+                removed += NodeSegments(directory, self.segment_s).prune(cutoff)
+                try:
+                    os.rmdir(directory)     # only succeeds once nothing is left in it
+                except OSError:
+                    pass
+        removed += sum(segments.prune(cutoff) for segments in opened.values())
+        self._pruned += removed
+        if removed:
+            logging.info(f"🧹 Removed {removed} segment file(s) older than {self.retention_s / 86400:.1f} day(s)")
+        return removed
+
+    def close(self):
+        with self._lock:
+            for segments in self._nodes.values():
+                segments.close()
+
+    def stats(self):
+        with self._lock:
+            nodes = list(self._nodes.values())
+        files = [s.path for n in nodes for s in n.segments()]
+        size = 0
+        for path in files:
+            try:
+                size += os.path.getsize(path)
+            except OSError:
+                pass
+        return {
+            'root': self.root,
+            'nodes': len(nodes),
+            'segments': len(files),
+            'bytes': size,
+            'appended': self._appended,
+            'pruned': self._pruned,
+            'segment_s': self.segment_s,
+            'retention_s': self.retention_s,
+        }
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Mine Armour - Sensor Payload Codec
+Schema-specialised decoding of helmet gas/vitals payloads into typed readings.
+Accepts JSON (orjson/ujson when installed, stdlib json otherwise) and a compact
+binary struct layout identified by a leading marker byte.
+"""
+
+import json
+import struct
+from collections import namedtuple
+
+from clock import parse_timestamp
+
+try:
+    import orjson as _fast_json
+
+    def json_loads(payload):
+        return _fast_json.loads(payload)
+
+    JSON_BACKEND = 'orjson'
+except ImportError:
+    try:
+        import ujson as _fast_json
+
+        def json_loads(payload):
+            return _fast_json.loads(payload)
+
+        JSON_BACKEND = 'ujson'
+    except ImportError:
+        def json_loads(payload):
+            return json.loads(payload)
+
+        JSON_BACKEND = 'json'
+
+
+# One decoded sensor message; timestamp is epoch seconds, the receive time
+# (clock.epoch_now) or in event-time mode the device's own. Missing fields keep
+# the defaults the dashboard has always used (-1 marks "no reading" for vitals,
+# 0 for gas/GPS). seq is the publisher's optional message sequence number (None
+# when not sent). present is a bit mask of the sensor slots (1-15) the payload
+# actually carried; None (rows built elsewhere, or stored before the mask
+# existed) means every slot.
+SensorReading = namedtuple('SensorReading', (
+    'timestamp', 'LPG', 'CH4', 'Propane', 'Butane', 'H2', 'heartRate', 'spo2',
+    'GSR', 'stress', 'temperature', 'humidity', 'lat', 'lon', 'alt', 'sat',
+    'name', 'zone', 'seq', 'present',
+), defaults=(None,))
+
+_DEFAULTS = (None, 0.0, 0.0, 0.0, 0.0, 0.0, -1, -1.0,
+             0.0, 0, -1.0, -1.0, 0.0, 0.0, 0.0, 0,
+             None, None, None, 0)
+
+SENSOR_SLOTS = range(1, 16)
+ALL_PRESENT = sum(1 << slot for slot in SENSOR_SLOTS)
+
+_FLOAT = 0
+_INT = 1
+
+# payload key -> (slot in SensorReading, cast kind)
+_NUMERIC_FIELDS = {
+    'LPG': (1, _FLOAT),
+    'CH4': (2, _FLOAT),
+    'Propane': (3, _FLOAT),
+    'Butane': (4, _FLOAT),
+    'H2': (5, _FLOAT),
+    'heartRate': (6, _INT),
+    'spo2': (7, _FLOAT),
+    'GSR': (8, _FLOAT),
+    'stress': (9, _INT),
+    'temperature': (10, _FLOAT),
+    'humidity': (11, _FLOAT),
+    'lat': (12, _FLOAT),
+    'lon': (13, _FLOAT),
+    'alt': (14, _FLOAT),
+    'sat': (15, _INT),
+    'seq': (18, _INT),
+}
+
+# Person name aliases in order of precedence
+_NAME_KEYS = ('name', 'person', 'user')
+
+_new_reading = tuple.__new__
+
+
+def _cast(value, kind, default):
+    """Numeric cast that tolerates strings/None from publishers (matches the old helpers)"""
+    try:
+        if value is None or (type(value) is str and not value.strip()):
+            return default
+        return float(value) if kind == _FLOAT else int(float(value))
+    except Exception:
+        return default
+
+
+def reading_from_dict(data, timestamp, event_time=False):
+    """Build a SensorReading from an already-parsed payload dict in a single pass.
+
+    With event_time the payload's own `timestamp` (when parseable) replaces the receive time."""
+    row = list(_DEFAULTS)
+    row[0] = timestamp
+    names = None
+    station_id = None
+    zone = None
+    present = 0
+    numeric = _NUMERIC_FIELDS
+    for key, value in data.items():
+        spec = numeric.get(key)
+        if spec is not None:
+            slot, kind = spec
+            cls = type(value)
+            if (cls is float and kind == _FLOAT) or (cls is int and kind == _INT):
+                row[slot] = value
+                present |= 1 << slot
+            else:
+                value = _cast(value, kind, None)
+                if value is not None:
+                    row[slot] = value
+                    present |= 1 << slot
+        elif key in _NAME_KEYS:
+            if names is None:
+                names = {}
+            names[key] = value
+        elif key == 'station_id':
+            station_id = value
+        elif key == 'zone':
+            zone = value
+        elif key == 'timestamp' and event_time:
+            device_ts = parse_timestamp(value)
+            if device_ts is not None:
+                row[0] = device_ts
+
+    if names:
+        row[16] = names.get('name') or names.get('person') or names.get('user')
+    if not zone and isinstance(station_id, str) and station_id:
+        zone = f"Zone {station_id[0].upper()}"
+    row[17] = zone
+    row[19] = present & ALL_PRESENT
+    return _new_reading(SensorReading, row)
+
+
+def present_mask(reading):
+    """Bit mask of the sensor slots a reading carried (ALL_PRESENT for readings without a mask)"""
+    present = reading[19]
+    return ALL_PRESENT if present is None else present
+
+
+def sparse_values(reading):
+    """Sensor values of slots 1-15 with None for the slots the payload did not carry"""
+    present = reading[19]
+    if present is None or present == ALL_PRESENT:
+        return reading[1:16]
+    return tuple(reading[slot] if present >> slot & 1 else None for slot in SENSOR_SLOTS)
+
+
+def dedupe_key(reading):
+    """Identity of a reading for duplicate suppression.
+
+    ('seq', name, seq) when the publisher numbers its messages, otherwise
+    ('hash', h) over every field except the timestamp. Content hashes are not
+    unique over time (a steady reading repeats), so ingest_pipeline.Deduplicator
+    only matches them across topics within one batch.
+    """
+    seq = reading[18]
+    if seq is not None:
+        return ('seq', reading[16], seq)
+    return ('hash', hash(reading[1:18]))
+
+
+def event_dedupe_key(reading):
+    """dedupe_key for event-time ingest: the device timestamp is part of a reading's
+    identity, so ('event', h) also covers it and is remembered like a sequence number"""
+    seq = reading[18]
+    if seq is not None:
+        return ('seq', reading[16], seq)
+    return ('event', hash(reading[:18]))
+
+
+# --------------------------------------------------
+# COMPACT BINARY FORMAT
+# --------------------------------------------------
+#
+#   byte 0     BINARY_MAGIC (0xB5 - can never start a UTF-8 JSON document)
+#   byte 1     format version (BINARY_VERSION)
+#   bytes 2-5  little-endian uint32 field mask (bit i set = field i present)
+#   ...        present numeric fields, packed little-endian in _BINARY_FIELDS order
+#   ...        present string fields, each a uint8 length + UTF-8 bytes
+#   ...        uint32 sequence number if mask bit 31 is set (older decoders ignore it)
+#
+# A full gas + vitals + GPS reading is 66 bytes versus ~250 bytes of JSON.
+
+BINARY_MAGIC = 0xB5
+BINARY_VERSION = 1
+
+_BINARY_HEADER = struct.Struct('<BBI')
+
+# (payload key, struct code); bit i of the mask corresponds to entry i. The
+# numeric fields are in SensorReading order, so entry i fills slot i + 1.
+_BINARY_FIELDS = (
+    ('LPG', 'f'), ('CH4', 'f'), ('Propane', 'f'), ('Butane', 'f'), ('H2', 'f'),
+    ('heartRate', 'h'), ('spo2', 'f'), ('GSR', 'f'), ('stress', 'B'),
+    ('temperature', 'f'), ('humidity', 'f'),
+    ('lat', 'd'), ('lon', 'd'), ('alt', 'f'), ('sat', 'B'),
+)
+_BINARY_STRINGS = ('name', 'station_id', 'zone')
+# Ranges of the integer struct codes, checked before packing
+_INT_RANGES = {'B': (0, 0xFF), 'h': (-0x8000, 0x7FFF)}
+_STRING_BIT0 = len(_BINARY_FIELDS)
+_NUMERIC_MASK = (1 << _STRING_BIT0) - 1
+_SEQ_BIT = 1 << 31
+_SEQ = struct.Struct('<I')
+
+# field mask -> (Struct, reading slots); built on first use of each combination
+_binary_layouts = {}
+
+
+def _binary_layout(mask):
+    layout = _binary_layouts.get(mask)
+    if layout is None:
+        codes = []
+        slots = []
+        for bit, (_, code) in enumerate(_BINARY_FIELDS):
+            if mask & (1 << bit):
+                codes.append(code)
+                slots.append(bit + 1)
+        layout = (struct.Struct('<' + ''.join(codes)), tuple(slots))
+        _binary_layouts[mask] = layout
+    return layout
+
+
+def is_binary_payload(payload):
+    return len(payload) >= _BINARY_HEADER.size and payload[0] == BINARY_MAGIC
+
+
+def encode_binary(data):
+    """Encode a sensor payload dict in the compact binary format (for publishers).
+
+    Raises ValueError for integer fields outside their packed range (heartRate is a
+    16-bit signed value, stress and sat are single unsigned bytes)."""
+    mask = 0
+    values = []
+    for bit, (key, code) in enumerate(_BINARY_FIELDS):
+        value = data.get(key)
+        if value is None or (isinstance(value, str) and not value.strip()):
+            continue
+        if code in ('f', 'd'):
+            value = float(value)
+        else:
+            value = int(float(value))
+            low, high = _INT_RANGES[code]
+            if not low <= value <= high:
+                raise ValueError(f"{key}={value} is outside the binary field range {low}..{high}")
+        mask |= 1 << bit
+        values.append(value)
+    body = _binary_layout(mask)[0].pack(*values)
+
+    strings = []
+    for idx, key in enumerate(_BINARY_STRINGS):
+        value = data.get(key)
+        if value:
+            raw = str(value).encode('utf-8')[:255]
+            mask |= 1 << (_STRING_BIT0 + idx)
+            strings.append(bytes((len(raw),)) + raw)
+    seq = data.get('seq')
+    if seq is not None:
+        mask |= _SEQ_BIT
+        strings.append(_SEQ.pack(int(seq) & 0xFFFFFFFF))
+    return _BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, mask) + body + b''.join(strings)
+
+
+def decode_binary(payload, timestamp):
+    """Decode a compact binary payload straight into a SensorReading"""
+    _, version, mask = _BINARY_HEADER.unpack_from(payload, 0)
+    if version != BINARY_VERSION:
+        raise ValueError(f"Unsupported binary payload version {version}")
+    layout, slots = _binary_layout(mask & _NUMERIC_MASK)
+    values = layout.unpack_from(payload, _BINARY_HEADER.size)
+
+    row = list(_DEFAULTS)
+    row[0] = timestamp
+    for slot, value in zip(slots, values):
+        row[slot] = value
+    row[19] = (mask & _NUMERIC_MASK) << 1
+
+    if mask >> _STRING_BIT0:
+        strings = {}
+        offset = _BINARY_HEADER.size + layout.size
+        for idx, key in enumerate(_BINARY_STRINGS):
+            if mask & (1 << (_STRING_BIT0 + idx)):
+                length = payload[offset]
+                strings[key] = bytes(payload[offset + 1:offset + 1 + length]).decode('utf-8', 'replace')
+                offset += 1 + length
+        row[16] = strings.get('name')
+        zone = strings.get('zone')
+        station_id = strings.get('station_id')
+        if not zone and station_id:
+            zone = f"Zone {station_id[0].upper()}"
+        row[17] = zone
+        if mask & _SEQ_BIT:
+            row[18] = _SEQ.unpack_from(payload, offset)[0]
+    return _new_reading(SensorReading, row)
+
+
+def encode_payload(data, binary=False):
+    """Encode a sensor payload for publishing, as JSON text or compact binary"""
+    if binary:
+        return encode_binary(data)
+    return json.dumps(data)
+
+
+def decode_payload(payload, timestamp, event_time=False):
+    """Decode raw MQTT payload bytes (JSON or compact binary).
+
+    `timestamp` is the receive time; with event_time a JSON payload's own `timestamp`
+    is used instead (binary payloads carry none and keep the receive time).
+
+    Returns ('rfid', dict) for RFID scans, ('sensor', SensorReading) for sensor
+    messages, or (None, None) if the payload cannot be decoded.
+    """
+    if is_binary_payload(payload):
+        try:
+            return 'sensor', decode_binary(payload, timestamp)
+        except Exception:
+            return None, None
+    try:
+        data = json_loads(payload)
+    except Exception:
+        return None, None
+    if not isinstance(data, dict):
+        return None, None
+    if 'tag_id' in data and 'station_id' in data:
+        return 'rfid', data
+    return 'sensor', reading_from_dict(data, timestamp, event_time)
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Mine Armour - SQLite Series Store
+Optional on-disk persistence for sensor readings and RFID scans so a dashboard
+restart does not lose history. Ingest only enqueues; a background writer thread
+batches rows into time-partitioned SQLite tables (WAL mode), clustered on
+(node, ts). On startup the tail of every node is read back in bulk to rehydrate
+the in-memory series.
+"""
+
+import os
+import json
+import time
+import queue
+import sqlite3
+import logging
+import threading
+
+from hot_log import hot_log
+from sensor_codec import SensorReading
+from state_snapshot import decode_state, encode_state
+
+# Stored SensorReading fields (the timestamp is stored as epoch seconds in `ts`)
+_VALUE_FIELDS = SensorReading._fields[1:]
+_COLUMN_TYPES = {'heartRate': 'INTEGER', 'stress': 'INTEGER', 'sat': 'INTEGER', 'seq': 'INTEGER',
+                 'name': 'TEXT', 'zone': 'TEXT', 'present': 'INTEGER'}
+
+_STOP = object()
+
+
+def _partition_ddl(table):
+    columns = ', '.join(f"{name} {_COLUMN_TYPES.get(name, 'REAL')}" for name in _VALUE_FIELDS)
+    # WITHOUT ROWID: the (node, ts, id) primary key is the table itself, so tail
+    # and range reads of one node are a single ordered scan with no extra lookups
+    return (f"CREATE TABLE IF NOT EXISTS {table} ("
+            f"node TEXT NOT NULL, ts REAL NOT NULL, id INTEGER NOT NULL, {columns}, "
+            f"PRIMARY KEY (node, ts, id)) WITHOUT ROWID")
+
+
+class SeriesStore:
+    """SQLite (WAL) persistence with a background batch writer.
+
+    Readings go to one table per `partition_s` seconds (readings_<partition start>),
+    listed in the `partitions` catalog. RFID scans and checkpoint resets go to
+    `rfid_events` so the checkpoint state can be rebuilt by replaying them in order.
+    Every rfid_checkpoint_every events the caller stores the whole RFID state with
+    write_rfid_checkpoint(); the events it covers are then deleted, so the table and
+    the startup replay stay bounded.
+    write_readings()/write_rfid() never block ingest: when the writer falls behind by
+    more than queue_size batches, new batches are dropped and counted.
+    """
+
+    def __init__(self, path, partition_s=86400, batch_size=500, flush_interval=0.5, queue_size=10000, replay=True,
+                 rfid_checkpoint_every=1000):
+        self.path = path
+        self.replay = replay    # rehydrate the in-memory series from the store on startup
+        self.rfid_checkpoint_every = max(0, int(rfid_checkpoint_every))   # 0: keep every RFID event
+        self.partition_s = max(1, int(partition_s))
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._thread = None
+        self._partitions = set()
+        self._next_id = time.time_ns() // 1000   # row tiebreaker, increasing across restarts
+
+        self._stats_lock = threading.Lock()
+        self._written = 0
+        self._rfid_written = 0
+        self._rfid_checkpoints = 0
+        self._transactions = 0
+        self._dropped = 0
+        self._errors = 0
+        self._write_time = 0.0
+        self._replay = {}
+
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS partitions (name TEXT PRIMARY KEY, start REAL NOT NULL, end REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS nodes (node TEXT PRIMARY KEY, name TEXT, zone TEXT, last_ts REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS rfid_events (id INTEGER PRIMARY KEY, ts REAL NOT NULL, kind TEXT NOT NULL, payload TEXT)")
+            conn.execute("CREATE TABLE IF NOT EXISTS rfid_checkpoint (id INTEGER PRIMARY KEY CHECK (id = 1), ts REAL NOT NULL, state BLOB NOT NULL)")
+            self._partitions.update(name for name, in conn.execute("SELECT name FROM partitions"))
+            for table in self._partitions:
+                # Partitions written before readings carried a field mask (NULL = every field present)
+                columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+                if columns and 'present' not in columns:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN present INTEGER")
+        conn.close()
+
+    @classmethod
+    def from_env(cls):
+        """SERIES_DB path (unset = no persistence), SERIES_DB_PARTITION seconds per table,
+        SERIES_DB_BATCH rows per transaction, SERIES_DB_FLUSH_MS, SERIES_DB_QUEUE, SERIES_DB_REPLAY
+        and SERIES_DB_RFID_CHECKPOINT (RFID events between state checkpoints, 0 = never)"""
+        path = os.getenv("SERIES_DB")
+        if not path:
+            return None
+        return cls(
+            path,
+            partition_s=int(os.getenv("SERIES_DB_PARTITION", "86400")),
+            batch_size=int(os.getenv("SERIES_DB_BATCH", "500")),
+            flush_interval=float(os.getenv("SERIES_DB_FLUSH_MS", "500")) / 1000.0,
+            queue_size=int(os.getenv("SERIES_DB_QUEUE", "10000")),
+            replay=os.getenv("SERIES_DB_REPLAY", "1").lower() not in ('0', 'false', 'no', 'off'),
+            rfid_checkpoint_every=int(os.getenv("SERIES_DB_RFID_CHECKPOINT", "1000")),
+        )
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30.0)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")   # durable at checkpoints; a crash loses at most the last commits
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    # --------------------------------------------------
+    # PRODUCER SIDE (ingest workers)
+    # --------------------------------------------------
+
+    def write_readings(self, node_id, rows, epochs):
+        """Queue one node's SensorReading rows (epochs: their timestamps in epoch seconds)"""
+        self._offer(('readings', node_id, rows, epochs))
+
+    def write_rfid(self, kind, timestamp, payload):
+        """Queue an RFID event (timestamp in epoch seconds): kind 'scan' (payload = scan dict) or
+        'reset' (payload = {'node_id', 'tag_id'})"""
+        self._offer(('rfid', timestamp, kind, json.dumps(payload, default=str)))
+
+    def write_rfid_checkpoint(self, timestamp, state):
+        """Queue the full RFID state as of `timestamp` (a dict of containers state_snapshot can
+        encode). Call it in the same order as write_rfid(): every event queued before it is
+        covered by the checkpoint and deleted when it is written."""
+        self._offer(('rfid_checkpoint', timestamp, state))
+
+    def _offer(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._stats_lock:
+                self._dropped += len(item[2]) if item[0] == 'readings' else 1
+            hot_log.warning('store.db_full', "⚠ Series DB writer is behind; dropping a batch (%s)", self.path)
+
+    # --------------------------------------------------
+    # WRITER THREAD
+    # --------------------------------------------------
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._writer, name="series-db-writer", daemon=True)
+        self._thread.start()
+        logging.info(f"💾 Series DB writer started: {self.path} (partition {self.partition_s}s)")
+
+    def stop(self, timeout=5.0):
+        """Flush everything queued so far and stop the writer"""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _writer(self):
+        conn = self._connect()
+        stopping = False
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            if item is _STOP:
+                break
+            items = [item]
+            rows = len(item[2]) if item[0] == 'readings' else 1
+            # Coalesce whatever is queued (up to batch_size rows) into one transaction
+            while rows < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                items.append(item)
+                rows += len(item[2]) if item[0] == 'readings' else 1
+            start = time.perf_counter()
+            try:
+                written, rfid = self._write(conn, items)
+                failed = 0
+            except sqlite3.Error as e:
+                written = rfid = 0
+                failed = rows
+                logging.error(f"❌ Series DB write failed ({rows} row(s)): {e}")
+            elapsed = time.perf_counter() - start
+            with self._stats_lock:
+                self._written += written
+                self._rfid_written += rfid
+                self._transactions += 1
+                self._errors += failed
+                self._write_time += elapsed
+        conn.close()
+
+    def _write(self, conn, items):
+        by_table = {}
+        node_rows = {}
+        rfid_rows = []
+        checkpoint = None
+        covered = 0
+        created = set()
+        for item in items:
+            if item[0] == 'rfid':
+                rfid_rows.append(item[1:])
+                continue
+            if item[0] == 'rfid_checkpoint':
+                # Events queued before the checkpoint are part of its state
+                checkpoint = (item[1], encode_state(item[2]))
+                covered += len(rfid_rows)
+                rfid_rows = []
+                continue
+            _, node_id, rows, epochs = item
+            for row, ts in zip(rows, epochs):
+                table = self._partition_for(conn, ts, created)
+                self._next_id += 1
+                by_table.setdefault(table, []).append((node_id, ts, self._next_id) + tuple(row[1:]))
+            last = rows[-1]
+            node_rows[node_id] = (node_id, last[16], last[17], epochs[-1])
+
+        with conn:
+            for table, values in by_table.items():
+                conn.executemany(
+                    f"INSERT OR REPLACE INTO {table} VALUES ({', '.join('?' * (3 + len(_VALUE_FIELDS)))})", values)
+            if node_rows:
+                conn.executemany(
+                    "INSERT INTO nodes VALUES (?, ?, ?, ?) ON CONFLICT(node) DO UPDATE SET "
+                    "name = coalesce(excluded.name, name), zone = coalesce(excluded.zone, zone), "
+                    "last_ts = max(coalesce(last_ts, 0), excluded.last_ts)",
+                    list(node_rows.values()))
+            if checkpoint is not None:
+                # Every stored event predates the checkpoint (the queue is FIFO)
+                conn.execute("DELETE FROM rfid_events")
+                conn.execute("INSERT OR REPLACE INTO rfid_checkpoint VALUES (1, ?, ?)", checkpoint)
+            if rfid_rows:
+                conn.executemany("INSERT INTO rfid_events (ts, kind, payload) VALUES (?, ?, ?)", rfid_rows)
+        # Only now that the catalog rows are committed; after a rollback they are inserted again
+        self._partitions.update(created)
+        if checkpoint is not None:
+            with self._stats_lock:
+                self._rfid_checkpoints += 1
+        return sum(len(values) for values in by_table.values()), len(rfid_rows) + covered
+
+    def _partition_for(self, conn, ts, created):
+        """Partition table for `ts`; tables new to this process are added to `created` and
+        registered in self._partitions by the caller once the transaction commits"""
+        start = int(ts // self.partition_s) * self.partition_s
+        table = f"readings_{start}"
+        if table not in self._partitions and table not in created:
+            conn.execute(_partition_ddl(table))
+            conn.execute("INSERT OR IGNORE INTO partitions VALUES (?, ?, ?)", (table, start, start + self.partition_s))
+            created.add(table)
+        return table
+
+    # --------------------------------------------------
+    # REPLAY (startup, before the writer runs)
+    # --------------------------------------------------
+
+    def _tables(self, conn, since=None):
+        """Partition tables newest first, optionally only those ending after `since`"""
+        if since is None:
+            return [name for name, in conn.execute("SELECT name FROM partitions ORDER BY start DESC")]
+        return [name for name, in conn.execute(
+            "SELECT name FROM partitions WHERE end > ? ORDER BY start DESC", (since,))]
+
+    def nodes(self):
+        """Stored nodes as (node_id, name, zone, last_ts)"""
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT node, name, zone, last_ts FROM nodes").fetchall()
+        finally:
+            conn.close()
+
+    def load_tail(self, node_id, limit, since=None):
+        """(rows, epochs) of a node's newest `limit` readings (only those at or after `since`
+        when given), oldest first"""
+        where, params = ("node = ?", (node_id,)) if since is None else ("node = ? AND ts >= ?", (node_id, since))
+        conn = self._connect()
+        try:
+            found = []
+            for table in self._tables(conn, since):
+                need = limit - len(found)
+                if need <= 0:
+                    break
+                found.extend(conn.execute(
+                    f"SELECT * FROM {table} WHERE {where} ORDER BY ts DESC, id DESC LIMIT ?", params + (need,)))
+        finally:
+            conn.close()
+        found.reverse()
+        return self._to_rows(found)
+
+    def iter_range(self, node_id, since, chunk=4096):
+        """(rows, epochs) chunks of a node's readings at or after `since`, oldest first"""
+        conn = self._connect()
+        try:
+            for table in reversed(self._tables(conn, since)):
+                cursor = conn.execute(f"SELECT * FROM {table} WHERE node = ? AND ts >= ? ORDER BY ts, id", (node_id, since))
+                while True:
+                    found = cursor.fetchmany(chunk)
+                    if not found:
+                        break
+                    yield self._to_rows(found)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _to_rows(found):
+        epochs = [r[1] for r in found]
+        rows = [SensorReading(r[1], *r[3:]) for r in found]
+        return rows, epochs
+
+    def load_rfid_checkpoint(self):
+        """(epoch, state) of the newest RFID state checkpoint, or None"""
+        conn = self._connect()
+        try:
+            found = conn.execute("SELECT ts, state FROM rfid_checkpoint WHERE id = 1").fetchone()
+        finally:
+            conn.close()
+        return None if found is None else (found[0], decode_state(found[1])[1])
+
+    def load_rfid_events(self, since=None):
+        """Stored RFID events (after epoch `since` when given) as (epoch, kind, payload dict),
+        in the order received; only events after the last checkpoint are still stored"""
+        where, params = ("", ()) if since is None else (" WHERE ts > ?", (since,))
+        conn = self._connect()
+        try:
+            return [(ts, kind, json.loads(payload))
+                    for ts, kind, payload in conn.execute(f"SELECT ts, kind, payload FROM rfid_events{where} ORDER BY id", params)]
+        finally:
+            conn.close()
+
+    def record_replay(self, nodes, readings, rfid_events, seconds):
+        with self._stats_lock:
+            self._replay = {'nodes': nodes, 'readings': readings, 'rfid_events': rfid_events,
+                            'seconds': round(seconds, 3)}
+
+    # --------------------------------------------------
+    # MONITORING
+    # --------------------------------------------------
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'path': self.path,
+                'partitions': len(self._partitions),
+                'queued_batches': self._queue.qsize(),
+                'written': self._written,
+                'rfid_written': self._rfid_written,
+                'rfid_checkpoints': self._rfid_checkpoints,
+                'transactions': self._transactions,
+                'avg_rows_per_transaction': (self._written + self._rfid_written) / self._transactions if self._transactions else 0.0,
+                'write_time_ms': self._write_time * 1000.0,
+                'dropped': self._dropped,
+                'errors': self._errors,
+                'replay': dict(self._replay),
+            }
@@ -1,6 +1,7 @@
 import json
 import logging
 import os
+import signal
 import ssl
 import time
 from datetime import datetime
@@ -8,6 +9,11 @@ from datetime import datetime
 import paho.mqtt.client as mqtt
 from dotenv import load_dotenv
 
+from hot_log import LazyText, hot_log
+from mqtt_options import MqttOptions, TopicAliasResolver
+from sensor_codec import decode_binary, is_binary_payload
+from topic_router import TopicRouter
+
 # Load env variables from .env file
 load_dotenv()
 
@@ -42,17 +48,14 @@ if not all([host, port, mqtt_username, mqtt_password]):
     exit(1)
 
 # Create MQTT client with TLS support (compatible with paho-mqtt v1.x and v2.x)
+# MQTT_PROTOCOL=5 switches to MQTT v5 (session expiry, receive maximum, topic aliases)
+mqtt_options = MqttOptions.from_env()
+topic_aliases = TopicAliasResolver()
 try:
-    CallbackAPIVersion = getattr(mqtt, "CallbackAPIVersion", None)
-    if CallbackAPIVersion is not None:
-        # paho-mqtt v2.x
-        client = mqtt.Client(client_id="SensorDataServer", protocol=mqtt.MQTTv311,
-                             callback_api_version=CallbackAPIVersion.VERSION1)
-    else:
-        # paho-mqtt v1.x
-        client = mqtt.Client(client_id="SensorDataServer", protocol=mqtt.MQTTv311)
+    client = mqtt_options.create_client("SensorDataServer")
 except Exception as e:
     logging.warning(f"Falling back to default MQTT client creation: {e}")
+    mqtt_options = MqttOptions()
     client = mqtt.Client()
 
 # Configure TLS/SSL
@@ -78,7 +81,11 @@ def parse_gas_sensor_data(payload):
     """Parse gas sensor data from LOKI_2004 topic"""
     try:
         # Parse JSON data like: {"LPG":125.14,"CH4":67.47,"Propane":94.18,"Butane":109.31,"H2":68.45}
-        data = json.loads(payload)
+        # or the compact binary encoding from sensor_codec
+        if is_binary_payload(payload):
+            data = decode_binary(payload, None)._asdict()
+        else:
+            data = json.loads(payload)
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
         # Update gas data
@@ -89,47 +96,62 @@ def parse_gas_sensor_data(payload):
         gas_data["H2"] = data.get("H2")
         gas_data["timestamp"] = timestamp
         
-        # Log the gas readings
-        logging.info(f"  GAS SENSOR [{timestamp[11:19]}]:")
-        logging.info(f"   💨 LPG: {data.get('LPG', 'N/A')} ppm")
-        logging.info(f"   🔥 CH4: {data.get('CH4', 'N/A')} ppm") 
-        logging.info(f"   ⛽ Propane: {data.get('Propane', 'N/A')} ppm")
-        logging.info(f"   🧪 Butane: {data.get('Butane', 'N/A')} ppm")
-        logging.info(f"   💡 H2: {data.get('H2', 'N/A')} ppm")
+        # Log the gas readings (rate-limited; the periodic summary still reports the latest values)
+        hot_log.info(
+            'server.gas',
+            "  GAS SENSOR [%s]: 💨 LPG: %s ppm | 🔥 CH4: %s ppm | ⛽ Propane: %s ppm | 🧪 Butane: %s ppm | 💡 H2: %s ppm",
+            timestamp[11:19], data.get('LPG', 'N/A'), data.get('CH4', 'N/A'), data.get('Propane', 'N/A'),
+            data.get('Butane', 'N/A'), data.get('H2', 'N/A'),
+        )
         
     except json.JSONDecodeError as e:
         logging.error(f"Error parsing JSON gas sensor data '{payload}': {e}")
     except Exception as e:
         logging.error(f"Error processing gas sensor data '{payload}': {e}")
 
+# Compiled subscriptions: every configured topic (wildcards included) routes to the gas parser
+topic_router = TopicRouter()
+for _topic in mqtt_topics:
+    topic_router.add(_topic, parse_gas_sensor_data)
+
 def parse_sensor_data(topic, payload):
     """Parse sensor data based on topic"""
     try:
-        if topic in mqtt_topics or any(topic.startswith(t.rstrip('/#')) for t in mqtt_topics if '/#' in t):
-            parse_gas_sensor_data(payload)
+        route = topic_router.route(topic)
+        if route is not None:
+            route.handler(payload)
         else:
-            logging.warning(f"Unknown topic received: {topic}")
+            hot_log.warning('server.unknown_topic', "Unknown topic received: %s", topic)
             
     except Exception as e:
         logging.error(f"Error parsing data from topic {topic}: {e}")
 
-def on_connect(client, userdata, flags, return_code):
+def on_connect(client, userdata, flags, return_code, properties=None):
     """MQTT connection callback"""
     if return_code == 0:
         logging.info("✅ Connected to MQTT broker")
+        topic_aliases.reset()
         logging.info(f"📡 Subscribing to {len(mqtt_topics)} topics:")
         for topic in mqtt_topics:
             logging.info(f"   🔔 {topic}")
-            client.subscribe(topic)
+            client.subscribe(topic, qos=mqtt_options.subscribe_qos)
     else:
         logging.error(f"❌ Failed to connect to MQTT broker, return code: {return_code}")
 
 def on_message(client, userdata, message):
     """MQTT message callback"""
+    topic = None
     try:
-        topic = message.topic
-        payload = message.payload.decode('utf-8')
-        logging.info(f"📨 Raw message on {topic}: {payload}")
+        topic = topic_aliases.topic(message)
+        if not topic:
+            hot_log.warning('server.unknown_alias', "Message with unknown topic alias ignored")
+            return
+        payload = message.payload
+        hot_log.count('messages', topic)
+        if is_binary_payload(payload):
+            hot_log.info('server.raw', "📨 Raw message on %s: <binary %d bytes>", topic, len(payload))
+        else:
+            hot_log.info('server.raw', "📨 Raw message on %s: %s", topic, LazyText(payload))
         parse_sensor_data(topic, payload)
     except Exception as e:
         logging.error(f"Error processing message on topic {topic}: {e}")
@@ -156,6 +178,15 @@ def print_gas_summary():
 client.on_connect = on_connect
 client.on_message = on_message
 
+
+def toggle_log_verbosity(signum, frame):
+    """SIGUSR1 toggles full hot-path logging (kill -USR1 <pid>)"""
+    hot_log.set_verbose(not hot_log.verbose)
+
+
+if hasattr(signal, "SIGUSR1"):
+    signal.signal(signal.SIGUSR1, toggle_log_verbosity)
+
 def run():
     """Main function to run the gas sensor data server"""
     try:
@@ -165,7 +196,7 @@ def run():
         logging.info(f"📡 Monitoring {len(mqtt_topics)} topics: {', '.join(mqtt_topics)}")
         
         # Connect to MQTT broker
-        client.connect(host, port, 60)
+        client.connect(host, port, 60, **mqtt_options.connect_kwargs(resume_session=True))
         
         # Start gas summary thread
         import threading
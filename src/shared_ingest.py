@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""
+Mine Armour - Horizontal Ingest with MQTT Shared Subscriptions
+Runs N consumer processes, each with a unique client id, on $share/<group>/<topic>
+subscriptions so the broker load-balances messages across them. Consumers decode
+payloads in parallel and ship decoded batches back to the parent process through a
+bounded queue. The parent merges them into the single SensorDataManager the dashboard
+reads from, through the same load shedding and after-storage acks as the in-process
+client.
+"""
+
+import os
+import ssl
+import math
+import queue
+import logging
+import threading
+import multiprocessing
+
+from clock import epoch_now
+from reorder_buffer import event_time_enabled
+from sensor_codec import decode_payload
+from topic_router import TopicRouter, route_nodes
+
+
+def shared_topic(group, topic):
+    """Shared-subscription filter for a topic, e.g. $share/mine-armour/LOKI_2004"""
+    return f"$share/{group}/{topic}"
+
+
+class MqttClientFactory:
+    """Creates a configured, asynchronously connecting paho client inside a consumer process"""
+
+    def __init__(self, host, port, username, password, options=None):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.options = options
+
+    @classmethod
+    def from_env(cls, receive_maximum=None):
+        from mqtt_options import MqttOptions
+
+        options = MqttOptions.from_env(receive_maximum=receive_maximum)
+        # Consumers do not accept inbound topic aliases: an alias is only valid on the
+        # connection that defined it, and each consumer process sees a different stream
+        options.topic_alias_maximum = 0
+        return cls(
+            os.getenv("MQTT_HOST", "t5066166.ala.asia-southeast1.emqxsl.com"),
+            int(os.getenv("MQTT_PORT", 8883)),
+            os.getenv("MQTT_USERNAME", "LOKI"),
+            os.getenv("MQTT_PASSWORD", "LOKI2004"),
+            options,
+        )
+
+    @property
+    def manual_ack(self):
+        """True when consumers ack QoS1 deliveries only after the parent stored them"""
+        return self.options is not None and self.options.manual_ack
+
+    def __call__(self, client_id, index):
+        from mqtt_options import MqttOptions
+
+        options = self.options or MqttOptions()
+        client = options.create_client(client_id, manual_ack=True)
+        client.username_pw_set(self.username, self.password)
+        client.tls_set(tls_version=ssl.PROTOCOL_TLSv1_2)
+        client.reconnect_delay_set(5, 30)
+        client.connect_async(self.host, self.port, 60, **options.connect_kwargs())
+        return client
+
+
+def _consumer_main(index, group, routes, client_factory, out_queue, ack_queue, stop_event,
+                   batch_size, flush_interval):
+    """Entry point of one consumer process"""
+    router = TopicRouter.from_routes(routes)
+    event_time = event_time_enabled()
+    manual_ack = getattr(client_factory, 'manual_ack', False)
+    client_id = f"MineArmourIngest-{group}-{index}-{os.getpid()}"
+    client = client_factory(client_id, index)
+
+    # Decoded messages wait here while the parent's queue is full. QoS0 sensor readings
+    # beyond max_pending are dropped oldest first; RFID scans and deliveries awaiting an
+    # ack are kept (the broker's receive-maximum window bounds how many there can be).
+    max_pending = 4 * batch_size
+    pending_lock = threading.Lock()
+    wake = threading.Event()
+    gas_records = []        # (topic, SensorReading, ack token or None)
+    rfid_records = []
+    tokens = []             # ack tokens of the pending RFID scans
+    counts = {'messages': 0, 'ignored': 0, 'dropped': 0}
+    session = [0]           # bumped per connection: acks for an older connection's mids are skipped
+
+    def flush():
+        with pending_lock:
+            if not gas_records and not rfid_records and not counts['messages']:
+                return
+            gas = [(topic, record) for topic, record, _ in gas_records]
+            acks = [token for _, _, token in gas_records if token is not None] + tokens
+            rfid = list(rfid_records)
+            del gas_records[:]
+            del rfid_records[:]
+            del tokens[:]
+            item = ('data', index, gas, rfid, acks, counts['messages'], counts['ignored'], counts['dropped'])
+            counts['messages'] = counts['ignored'] = counts['dropped'] = 0
+        # Blocks while the parent is behind; on_message keeps collecting meanwhile
+        out_queue.put(item)
+
+    def ack(token):
+        sess, mid, qos = token
+        if sess == session[0]:
+            client.ack(mid, qos)
+
+    def ack_loop():
+        for batch in iter(ack_queue.get, None):
+            for token in batch:
+                try:
+                    ack(token)
+                except Exception as e:
+                    logging.error(f"❌ Shared ingest ack failed: {e}")
+
+    def on_connect(c, userdata, flags, rc, *args):
+        if rc == 0:
+            session[0] += 1
+            for pattern in router.patterns():
+                c.subscribe(shared_topic(group, pattern), qos=1)
+        out_queue.put(('status', index, rc == 0))
+
+    def on_disconnect(c, userdata, rc, *args):
+        out_queue.put(('status', index, False))
+
+    def on_message(c, userdata, message):
+        topic = message.topic
+        route = router.route(topic)
+        token = (session[0], message.mid, message.qos) if manual_ack and message.qos else None
+        timestamp = epoch_now()
+        kind, record = (None, None) if route is None else decode_payload(message.payload, timestamp, event_time)
+        with pending_lock:
+            counts['messages'] += 1
+            if kind == 'rfid':
+                rfid_records.append((record, timestamp))
+                if token is not None:
+                    tokens.append(token)
+                token = None
+            elif kind == 'sensor' and route.handler != 'rfid' and route_nodes(route, topic):
+                if len(gas_records) + len(rfid_records) >= max_pending and token is None:
+                    oldest = next((i for i, entry in enumerate(gas_records) if entry[2] is None), None)
+                    if oldest is not None:
+                        del gas_records[oldest]
+                        counts['dropped'] += 1
+                gas_records.append((topic, record, token))
+                token = None
+            else:
+                counts['ignored'] += 1
+            full = len(gas_records) + len(rfid_records) >= batch_size
+        if token is not None:
+            ack(token)      # nothing to store
+        if full:
+            wake.set()
+
+    client.on_connect = on_connect
+    client.on_disconnect = on_disconnect
+    client.on_message = on_message
+    threading.Thread(target=ack_loop, name=f"mqtt-consumer-{index}-acks", daemon=True).start()
+    client.loop_start()
+    try:
+        while not stop_event.is_set():
+            wake.wait(flush_interval)
+            wake.clear()
+            flush()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.loop_stop()
+        try:
+            client.disconnect()
+        except Exception:
+            pass
+        flush()
+        out_queue.put(('stopped', index))
+
+
+class SharedSubscriptionIngest:
+    """Parent-side supervisor: starts consumer processes and merges their output into one store"""
+
+    def __init__(self, data_manager, group='mine-armour', processes=2, client_factory=None,
+                 batch_size=256, flush_interval=0.2, queue_size=10000, shedder=None):
+        """queue_size bounds the decoded messages waiting for the merge (rounded to whole
+        batches); consumers hold back once it is full. shedder is the LoadShedder applied
+        to every merged batch, coalescing while the queue is above its watermark."""
+        self.data_manager = data_manager
+        self.group = group
+        self.num_processes = max(1, int(processes))
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = flush_interval
+        self.shedder = shedder
+        # At most two batches per consumer are unacked: one queued, one being collected
+        self.client_factory = client_factory or MqttClientFactory.from_env(receive_maximum=2 * self.batch_size)
+        self.max_batches = max(2, int(queue_size) // self.batch_size)
+
+        self._out_queue = multiprocessing.Queue(maxsize=self.max_batches)
+        self._ack_queues = [multiprocessing.Queue() for _ in range(self.num_processes)]
+        self._stop_event = multiprocessing.Event()
+        self._processes = []
+        self._drain_thread = None
+        self._running = False
+        self._stats_lock = threading.Lock()
+        self._connected = {}
+        self._messages = {}
+        self._ignored = {}
+        self._stored = 0
+        self._dropped = 0
+        self._shed = 0
+        self._acked = 0
+        self._restamped = 0
+        self._max_depth = 0
+        self._last_stamp = {'gas': 0.0, 'rfid': 0.0}   # merge thread only
+
+    @classmethod
+    def from_env(cls, data_manager, shedder=None):
+        """Enabled when INGEST_PROCESSES > 0; returns None otherwise"""
+        processes = int(os.getenv("INGEST_PROCESSES", "0"))
+        if processes <= 0:
+            return None
+        return cls(
+            data_manager,
+            group=os.getenv("MQTT_SHARE_GROUP", "mine-armour"),
+            processes=processes,
+            batch_size=int(os.getenv("INGEST_BATCH_SIZE", "256")),
+            queue_size=int(os.getenv("INGEST_QUEUE_SIZE", "10000")),
+            shedder=shedder,
+        )
+
+    @property
+    def connected(self):
+        with self._stats_lock:
+            return any(self._connected.values())
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._stop_event.clear()
+        routes = self.data_manager.topic_router.routes()
+        for index in range(self.num_processes):
+            proc = multiprocessing.Process(
+                target=_consumer_main,
+                args=(index, self.group, routes, self.client_factory, self._out_queue, self._ack_queues[index],
+                      self._stop_event, self.batch_size, self.flush_interval),
+                name=f"mqtt-consumer-{index}",
+                daemon=True,
+            )
+            proc.start()
+            self._processes.append(proc)
+        self._drain_thread = threading.Thread(target=self._drain, name="shared-ingest-merge", daemon=True)
+        self._drain_thread.start()
+        logging.info(f"📥 Shared-subscription ingest started: {self.num_processes} consumer process(es) in group "
+                     f"'{self.group}', queue {self.max_batches} batch(es) of {self.batch_size}")
+
+    def stop(self, timeout=5.0):
+        if not self._running:
+            return
+        self._stop_event.set()
+        for proc in self._processes:
+            proc.join(timeout)
+            if proc.is_alive():
+                proc.terminate()
+        self._running = False
+        if self._drain_thread is not None:
+            self._drain_thread.join(timeout)
+        for acks in self._ack_queues:
+            acks.cancel_join_thread()   # consumers are gone; unread acks must not hold up exit
+        self._processes = []
+
+    def depth(self):
+        """Batches waiting for the merge (0 where the platform cannot tell, e.g. macOS)"""
+        try:
+            return self._out_queue.qsize()
+        except NotImplementedError:
+            return 0
+
+    def bursting(self):
+        """True while the merge is behind by at least the shedder's watermark"""
+        return self.shedder is not None and self.depth() >= self.shedder.watermark * self.max_batches
+
+    def _route_nodes(self, topic):
+        return self.data_manager.nodes_for_route(self.data_manager.topic_router.route(topic), topic)
+
+    def _restamp(self, kind, stamps):
+        """Receive times on one increasing clock (merge thread only).
+
+        Consumers stamp messages in their own processes and their batches interleave here,
+        so a consumer's stamp is kept only if it is after the last one merged and not
+        ahead of this process's clock; otherwise the message gets the next representable
+        time after the last one. Each reading therefore lags its true receive time by at
+        most one flush interval, and every node's readings arrive in time order."""
+        now = epoch_now()
+        last = self._last_stamp[kind]
+        out = []
+        moved = 0
+        for ts in stamps:
+            ts = min(ts, now)
+            if ts <= last:
+                ts = math.nextafter(last, math.inf)
+                moved += 1
+            out.append(ts)
+            last = ts
+        self._last_stamp[kind] = last
+        return out, moved
+
+    def _merge(self, gas, rfid):
+        """Store one consumer batch the way MQTTClient.process_batch does; returns (stored, shed, restamped)"""
+        moved = 0
+        if not self.data_manager.event_time:
+            # Event-time readings carry device timestamps and go through the reorder buffer instead
+            stamps, moved_gas = self._restamp('gas', [record[0] for _, record in gas])
+            gas = [(topic, record._replace(timestamp=ts)) for (topic, record), ts in zip(gas, stamps)]
+            stamps, moved_rfid = self._restamp('rfid', [ts for _, ts in rfid])
+            rfid = [(record, ts) for (record, _), ts in zip(rfid, stamps)]
+            moved = moved_gas + moved_rfid
+        shed = 0
+        if gas and self.shedder is not None and self.shedder.enabled:
+            kept = self.shedder.shed(gas, self._route_nodes, coalesce=self.bursting())
+            shed = len(gas) - len(kept)
+            gas = kept
+        stored = 0
+        if gas:
+            stored += self.data_manager.add_gas_batch(gas)
+        if rfid:
+            stored += self.data_manager.add_rfid_batch(rfid)
+        return stored, shed, moved
+
+    def _drain(self):
+        stopped = set()
+        while len(stopped) < self.num_processes:
+            try:
+                item = self._out_queue.get(timeout=0.5)
+            except queue.Empty:
+                if not self._running:
+                    break
+                continue
+            kind, index = item[0], item[1]
+            if kind == 'data':
+                _, _, gas, rfid, acks, messages, ignored, dropped = item
+                depth = self.depth()
+                stored = shed = moved = 0
+                try:
+                    stored, shed, moved = self._merge(gas, rfid)
+                except Exception as e:
+                    logging.error(f"❌ Shared ingest merge error: {e}")
+                # Ack only now, so unstored messages keep counting against the broker's window
+                # (failed batches are acked too: a redelivery would fail the same way)
+                if acks:
+                    self._ack_queues[index].put(acks)
+                with self._stats_lock:
+                    self._messages[index] = self._messages.get(index, 0) + messages
+                    self._ignored[index] = self._ignored.get(index, 0) + ignored
+                    self._stored += stored
+                    self._dropped += dropped
+                    self._shed += shed
+                    self._acked += len(acks)
+                    self._restamped += moved
+                    self._max_depth = max(self._max_depth, depth)
+            elif kind == 'status':
+                with self._stats_lock:
+                    self._connected[index] = item[2]
+            elif kind == 'stopped':
+                stopped.add(index)
+                with self._stats_lock:
+                    self._connected[index] = False
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'group': self.group,
+                'processes': self.num_processes,
+                'alive': sum(1 for p in self._processes if p.is_alive()),
+                'connected': {str(k): v for k, v in sorted(self._connected.items())},
+                'messages_per_consumer': {str(k): v for k, v in sorted(self._messages.items())},
+                'ignored': sum(self._ignored.values()),
+                'stored': self._stored,
+                'depth': self.depth(),
+                'max_depth': self._max_depth,
+                'capacity': self.max_batches,
+                'dropped': self._dropped,
+                'shed': self._shed,
+                'acked': self._acked,
+                'restamped': self._restamped,
+            }
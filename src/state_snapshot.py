@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Mine Armour - Warm-restart Snapshots
+Periodic snapshots of the dashboard's in-memory state (per-node series, rollups and
+compressed history, RFID checkpoint progress and scan counters) so a restart comes
+back with full charts instead of waiting for devices to publish or replaying the
+whole SQLite tail.
+
+A snapshot file is a fixed header followed by one zlib stream holding a compact
+JSON description of the state and a binary blob with every typed array's raw
+bytes, so loading is a decompress, one JSON parse and a memcpy per array. Files
+are written to a temporary name, fsynced and renamed over the previous snapshot,
+so a crash mid-write never leaves a torn snapshot behind. No pickle: loading a
+snapshot never executes code.
+"""
+
+import os
+import json
+import time
+import zlib
+import struct
+import logging
+import threading
+from array import array
+from collections import deque
+from datetime import datetime
+from types import MappingProxyType
+
+# magic, format version, created (epoch seconds), JSON length, blob length (both uncompressed)
+_MAGIC = b'MASNAP'
+_VERSION = 2     # 2: timestamps in the state are epoch seconds
+_HEADER = struct.Struct('<6sHdQQ')
+
+
+# --------------------------------------------------
+# ENCODING
+# --------------------------------------------------
+#
+# Values the JSON cannot hold directly are tagged single-key objects:
+#   {"$a": [typecode, offset, nbytes]}   array.array, raw bytes in the blob (identical arrays share them)
+#   {"$b": [offset, nbytes]}             bytes
+#   {"$t": epoch}                        naive local datetime
+#   {"$d": [[key, value], ...]}          dict with non-string keys (tuple keys as lists)
+#   {"$q": [maxlen, [items]]}            collections.deque
+#   {"$u": [items]}                      tuple
+
+class _Packer:
+    def __init__(self):
+        self.blob = bytearray()
+        self._arrays = {}   # raw bytes -> blob offset; channels sharing a timestamp lane are stored once
+
+    def pack(self, value):
+        cls = type(value)
+        if value is None or cls in (str, int, float, bool):
+            return value
+        if cls is array:
+            raw = value.tobytes()
+            offset = self._arrays.get(raw)
+            if offset is None:
+                offset = self._arrays[raw] = len(self.blob)
+                self.blob += raw
+            return {'$a': [value.typecode, offset, len(raw)]}
+        if cls in (bytes, bytearray, memoryview):
+            offset = len(self.blob)
+            self.blob += value
+            return {'$b': [offset, len(self.blob) - offset]}
+        if cls is datetime:
+            return {'$t': value.timestamp()}
+        if cls is deque:
+            return {'$q': [value.maxlen, [self.pack(v) for v in value]]}
+        if cls is tuple:
+            return {'$u': [self.pack(v) for v in value]}
+        if cls is list:
+            return [self.pack(v) for v in value]
+        if cls in (dict, MappingProxyType):
+            # A single '$'-prefixed key would read back as a tag, so such dicts go through '$d'
+            if all(type(k) is str for k in value) and not (len(value) == 1 and next(iter(value)).startswith('$')):
+                return {k: self.pack(v) for k, v in value.items()}
+            return {'$d': [[self.pack(k), self.pack(v)] for k, v in value.items()]}
+        raise TypeError(f"Cannot snapshot {cls.__name__}")
+
+
+def _unpack(value, blob):
+    cls = type(value)
+    if cls is list:
+        return [_unpack(v, blob) for v in value]
+    if cls is not dict:
+        return value
+    if len(value) == 1:
+        tag, body = next(iter(value.items()))
+        if tag == '$a':
+            typecode, offset, nbytes = body
+            out = array(typecode)
+            out.frombytes(blob[offset:offset + nbytes])
+            return out
+        if tag == '$b':
+            return bytes(blob[body[0]:body[0] + body[1]])
+        if tag == '$t':
+            return datetime.fromtimestamp(body)
+        if tag == '$q':
+            return deque((_unpack(v, blob) for v in body[1]), maxlen=body[0])
+        if tag == '$u':
+            return tuple(_unpack(v, blob) for v in body)
+        if tag == '$d':
+            return {_hashable(_unpack(k, blob)): _unpack(v, blob) for k, v in body}
+    return {k: _unpack(v, blob) for k, v in value.items()}
+
+
+def _hashable(key):
+    return tuple(_hashable(k) for k in key) if type(key) is list else key
+
+
+def encode_state(state, created=None, level=1):
+    """State (dicts, lists, arrays, bytes, datetimes, deques, tuples) -> snapshot bytes"""
+    packer = _Packer()
+    meta = json.dumps(packer.pack(state), separators=(',', ':')).encode('utf-8')
+    stream = zlib.compressobj(level)
+    body = stream.compress(meta) + stream.compress(packer.blob) + stream.flush()
+    created = time.time() if created is None else created
+    return _HEADER.pack(_MAGIC, _VERSION, created, len(meta), len(packer.blob)) + body
+
+
+def decode_state(data):
+    """Snapshot bytes -> (created epoch, state); ValueError for foreign or damaged files"""
+    if len(data) < _HEADER.size:
+        raise ValueError("Snapshot too short")
+    magic, version, created, meta_len, blob_len = _HEADER.unpack_from(data)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError(f"Not a version {_VERSION} state snapshot")
+    try:
+        body = zlib.decompress(memoryview(data)[_HEADER.size:])
+    except zlib.error as e:
+        raise ValueError(f"Damaged snapshot: {e}") from e
+    if len(body) != meta_len + blob_len:
+        raise ValueError("Snapshot length mismatch")
+    blob = memoryview(body)[meta_len:]
+    return created, _unpack(json.loads(body[:meta_len]), blob)
+
+
+# --------------------------------------------------
+# BACKGROUND SNAPSHOTTER
+# --------------------------------------------------
+
+class StateSnapshotter:
+    """Writes capture() to `path` every `interval` seconds from a background thread.
+
+    capture() is expected to copy state under short, fine-grained locks and return it;
+    encoding, compression and file I/O happen without any dashboard lock held.
+    """
+
+    def __init__(self, path, interval=60.0, level=1):
+        self.path = path
+        self.interval = max(1.0, float(interval))
+        self.level = level
+        self._capture = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._write_lock = threading.Lock()
+        self._written = 0
+        self._errors = 0
+        self._last = {}
+        self._loaded = {}
+
+    @classmethod
+    def from_env(cls):
+        """STATE_SNAPSHOT path (unset = no snapshots), STATE_SNAPSHOT_INTERVAL seconds"""
+        path = os.getenv("STATE_SNAPSHOT")
+        if not path:
+            return None
+        return cls(path, interval=float(os.getenv("STATE_SNAPSHOT_INTERVAL", "60")))
+
+    def load(self):
+        """(created epoch, state) of the snapshot on disk, or None if missing or unusable"""
+        start = time.perf_counter()
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+            created, state = decode_state(data)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.warning(f"⚠ Ignoring state snapshot {self.path}: {e}")
+            return None
+        self._loaded = {'bytes': len(data), 'decode_ms': (time.perf_counter() - start) * 1000.0,
+                        'age_s': time.time() - created}
+        return created, state
+
+    def record_load(self, restore_ms):
+        self._loaded['restore_ms'] = restore_ms
+
+    def write(self, state):
+        """Encode `state` and atomically replace the snapshot file; returns its size"""
+        start = time.perf_counter()
+        data = encode_state(state, level=self.level)
+        encoded = time.perf_counter()
+        tmp = f"{self.path}.tmp"
+        with self._write_lock:
+            with open(tmp, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        self._written += 1
+        self._last = {'bytes': len(data), 'encode_ms': (encoded - start) * 1000.0,
+                      'write_ms': (time.perf_counter() - encoded) * 1000.0, 'at': time.time()}
+        return len(data)
+
+    def snapshot_now(self):
+        """Capture and write one snapshot (errors are logged and counted)"""
+        if self._capture is None:
+            return
+        try:
+            start = time.perf_counter()
+            state = self._capture()
+            capture_ms = (time.perf_counter() - start) * 1000.0
+            self.write(state)
+            self._last['capture_ms'] = capture_ms
+        except Exception as e:
+            self._errors += 1
+            logging.error(f"❌ State snapshot to {self.path} failed: {e}")
+
+    def start(self, capture):
+        if self._thread is not None:
+            return
+        self._capture = capture
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="state-snapshot", daemon=True)
+        self._thread.start()
+        logging.info(f"📸 State snapshots every {self.interval:.0f}s to {self.path}")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.snapshot_now()
+
+    def stop(self, final=True):
+        """Stop the background thread, writing one last snapshot (for a warm restart)"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        if final:
+            self.snapshot_now()
+
+    def stats(self):
+        return {
+            'path': self.path,
+            'interval_s': self.interval,
+            'written': self._written,
+            'errors': self._errors,
+            'last': dict(self._last),
+            'loaded': dict(self._loaded),
+        }
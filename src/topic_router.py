@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Mine Armour - Topic Router
+Compiles MQTT subscriptions (including + and # wildcards) into an exact-match
+table plus a trie, so each incoming topic resolves to its handler and node list
+in O(topic depth) no matter how many topics are configured.
+"""
+
+from collections import namedtuple
+
+# handler: whatever the caller registered (a callable or a tag such as 'sensor')
+# nodes:   tuple of node IDs fed by the subscription
+# pattern: the subscription that matched
+Route = namedtuple('Route', ('handler', 'nodes', 'pattern'))
+
+
+def route_nodes(route, topic):
+    """Node IDs a routed topic feeds: the route's own list, or the topic's last level for a
+    'sensor' route registered without nodes (per-helmet topics such as helmet/+)"""
+    if route is None:
+        return ()
+    if route.nodes or route.handler != 'sensor':
+        return route.nodes
+    return (topic.rsplit('/', 1)[-1],)
+
+
+class _TrieNode:
+    __slots__ = ('children', 'plus', 'route', 'hash_route')
+
+    def __init__(self):
+        self.children = {}
+        self.plus = None        # child for a '+' level
+        self.route = None       # subscription ending exactly at this level
+        self.hash_route = None  # subscription ending with '#' at this level
+
+
+class TopicRouter:
+    """Resolves topics against compiled subscriptions; most specific match wins"""
+
+    def __init__(self, cache_size=4096):
+        self._exact = {}
+        self._root = _TrieNode()
+        self._patterns = []
+        self._routes = {}
+        self._cache = {}
+        self._cache_size = cache_size
+        self._groups = None     # node -> representative of the nodes sharing topics with it
+
+    @classmethod
+    def from_node_map(cls, topic_to_nodes, handler='sensor'):
+        """Build a router from a {topic_pattern: [node_id, ...]} mapping"""
+        router = cls()
+        for pattern, nodes in topic_to_nodes.items():
+            router.add(pattern, handler, nodes)
+        return router
+
+    @classmethod
+    def from_routes(cls, routes):
+        """Rebuild a router from the Route list returned by routes() (e.g. in another process)"""
+        router = cls()
+        for route in routes:
+            router.add(route.pattern, route.handler, route.nodes)
+        return router
+
+    def add(self, pattern, handler, nodes=()):
+        """Register a subscription pattern such as 'LOKI_2004', 'SUSH_2004/#' or 'site/+/gas'"""
+        if isinstance(nodes, str):
+            nodes = (nodes,)
+        route = Route(handler, tuple(nodes), pattern)
+        levels = pattern.split('/')
+        for idx, level in enumerate(levels):
+            if level == '#' and idx != len(levels) - 1:
+                raise ValueError(f"'#' must be the last level of a topic filter: {pattern}")
+            if level not in ('+', '#') and ('+' in level or '#' in level):
+                raise ValueError(f"Wildcards must occupy a whole topic level: {pattern}")
+
+        if pattern not in self._patterns:
+            self._patterns.append(pattern)
+        self._routes[pattern] = route
+        self._cache.clear()
+        self._groups = None
+
+        if '+' not in levels and '#' not in levels:
+            self._exact[pattern] = route
+            return route
+
+        node = self._root
+        for level in levels:
+            if level == '#':
+                node.hash_route = route
+                return route
+            if level == '+':
+                if node.plus is None:
+                    node.plus = _TrieNode()
+                node = node.plus
+            else:
+                child = node.children.get(level)
+                if child is None:
+                    child = node.children[level] = _TrieNode()
+                node = child
+        node.route = route
+        return route
+
+    def patterns(self):
+        """Subscription patterns in registration order (what to pass to client.subscribe)"""
+        return list(self._patterns)
+
+    def routes(self):
+        """Registered Routes in registration order"""
+        return [self._routes[pattern] for pattern in self._patterns]
+
+    def shard_key(self, topic):
+        """Key that is equal for every topic feeding a common node (directly or through other
+        topics), so hashing it to an ingest worker keeps each node's readings on one worker"""
+        nodes = route_nodes(self.route(topic), topic)
+        if not nodes:
+            return topic
+        groups = self._groups
+        if groups is None:
+            groups = self._groups = self._node_groups()
+        return groups.get(nodes[0], nodes[0])
+
+    def _node_groups(self):
+        """Union-find over the configured node lists: node -> smallest node id of its group"""
+        parent = {}
+
+        def find(node):
+            parent.setdefault(node, node)
+            while parent[node] != node:
+                parent[node] = parent[parent[node]]
+                node = parent[node]
+            return node
+
+        for route in self._routes.values():
+            roots = [find(node) for node in route.nodes]
+            for root in roots[1:]:
+                low, high = sorted((find(roots[0]), find(root)))
+                parent[high] = low
+        return {node: find(node) for node in parent}
+
+    def route(self, topic):
+        """Return the Route for a concrete topic, or None if nothing matches"""
+        route = self._exact.get(topic)
+        if route is not None:
+            return route
+        try:
+            return self._cache[topic]
+        except KeyError:
+            pass
+
+        levels = topic.split('/')
+        # Per the MQTT spec, wildcards at the first level never match '$SYS'-style topics
+        route = self._match(self._root, levels, 0, topic.startswith('$'))
+        if len(self._cache) >= self._cache_size:
+            self._cache.clear()
+        self._cache[topic] = route
+        return route
+
+    def _match(self, node, levels, idx, no_wildcards):
+        if idx == len(levels):
+            return node.route or node.hash_route
+        child = node.children.get(levels[idx])
+        if child is not None:
+            route = self._match(child, levels, idx + 1, False)
+            if route is not None:
+                return route
+        if no_wildcards:
+            return None
+        if node.plus is not None:
+            route = self._match(node.plus, levels, idx + 1, False)
+            if route is not None:
+                return route
+        return node.hash_route